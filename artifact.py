@@ -0,0 +1,485 @@
+# artifact.py
+"""Versioned binary format for compiled programs.
+
+An artifact holds one compile: its IR, a string table, the symbol table,
+the diagnostics and assembly, and optionally the AST. The file is laid
+out so it can be read in place from a memory map:
+
+    header      magic, format version, flags, section count
+    directory   (offset, count) of every section, in SECTIONS order
+    sections    typed little-endian arrays, each aligned to 8 bytes
+
+Every string (IR names, symbol fields, messages, assembly lines, AST
+identifiers) is stored once in the string table; other sections refer to
+it by index. Constants and symbol values are entries of a tagged value
+table. The AST, if present, is a preorder stream of 32-bit words.
+
+Loading does no parsing: Artifact() only checks the header and takes
+memoryviews of the sections. The IR columns are available without a
+copy (Artifact.ops etc.), strings are decoded when asked for, and
+Artifact.ir copies the four columns into an IntermediateCode with one
+memcpy each.
+"""
+import mmap
+import struct
+import sys
+from array import array
+
+from ir import IntermediateCode
+from syntax_tree import (Program, Block, Declaration, Assignment, Print, If, While,
+                         Number, Name, Binary, Condition)
+
+MAGIC = b'MCAF'
+FORMAT_VERSION = 1
+SUFFIX = '.mca'
+
+# Header flags
+HAS_AST = 1
+
+SECTIONS = ('ops', 'arg1', 'arg2', 'result', 'string_offsets', 'string_data',
+            'value_tags', 'value_data', 'names', 'constants', 'symbols',
+            'lex_errors', 'errors', 'warnings', 'assembly', 'ast')
+# Array type code of each section
+SECTION_TYPES = ('B', 'q', 'q', 'q', 'I', 'B',
+                 'B', 'q', 'I', 'I', 'I',
+                 'I', 'I', 'I', 'I', 'I')
+
+_HEADER = struct.Struct('<4sHHI')
+# (offset, count) of every section
+_DIRECTORY = struct.Struct('<' + 'QQ' * len(SECTIONS))
+_ITEM_SIZES = tuple(array(typecode).itemsize for typecode in SECTION_TYPES)
+_ALIGN = 8
+
+# Value tags; a float's payload is the bits of the double, a str's and a
+# big int's the index of its (decimal) text in the string table
+INT = 0
+FLOAT = 1
+STR = 2
+BIG_INT = 3
+
+# Symbol value index of a symbol without a value
+NO_VALUE = 0xFFFFFFFF
+
+# AST node kinds and expression types; a node starts with a word holding
+# its kind and (kind | type << 8), then its line and position
+NODE_KINDS = (Program, Block, Declaration, Assignment, Print, If, While,
+              Number, Name, Binary, Condition)
+NODE_KIND = {kind: code for code, kind in enumerate(NODE_KINDS)}
+TYPES = (None, 'int', 'float')
+TYPE_CODE = {name: code for code, name in enumerate(TYPES)}
+
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+_INT64 = (-(1 << 63), (1 << 63) - 1)
+
+
+class ArtifactError(ValueError):
+    """The data is not an artifact this version can read"""
+
+
+class _Writer:
+    def __init__(self):
+        self.strings = []
+        self.string_index = {}
+        self.value_tags = array('B')
+        self.value_data = array('q')
+
+    def string(self, text):
+        index = self.string_index.get(text)
+        if index is None:
+            index = self.string_index[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def value(self, value):
+        """Append value to the value table and return its index"""
+        index = len(self.value_tags)
+        if isinstance(value, str):
+            self.value_tags.append(STR)
+            self.value_data.append(self.string(value))
+        elif isinstance(value, float):
+            self.value_tags.append(FLOAT)
+            self.value_data.append(struct.unpack('<q', struct.pack('<d', value))[0])
+        elif _INT64[0] <= value <= _INT64[1]:
+            self.value_tags.append(INT)
+            self.value_data.append(value)
+        else:
+            self.value_tags.append(BIG_INT)
+            self.value_data.append(self.string(str(value)))
+        return index
+
+    def node(self, node, words):
+        """Append the words of node and of the nodes nested in it"""
+        # Nodes may nest deeper than Python's recursion limit, so each node
+        # is a generator yielding its children, driven from an explicit stack
+        stack = [self._node(node, words)]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+            else:
+                stack.append(self._node(child, words))
+
+    def _node(self, node, words):
+        kind = type(node)
+        expression_type = getattr(node, 'type', None) if kind is not Condition else None
+        words.append(NODE_KIND[kind] | TYPE_CODE[expression_type] << 8)
+        words.append(node.line)
+        words.append(node.position)
+        if kind is Program or kind is Block:
+            words.append(len(node.statements))
+            yield from node.statements
+        elif kind is Declaration:
+            words.append(self.string(node.var_type))
+            words.append(self.string(node.name))
+            words.append(node.init is not None)
+            if node.init is not None:
+                yield node.init
+        elif kind is Assignment:
+            words.append(self.string(node.name))
+            yield node.value
+        elif kind is Print:
+            yield node.value
+        elif kind is If:
+            yield node.condition
+            yield node.then
+            words.append(node.otherwise is not None)
+            if node.otherwise is not None:
+                yield node.otherwise
+        elif kind is While:
+            yield node.condition
+            yield node.body
+        elif kind is Number:
+            words.append(self.value(node.value))
+        elif kind is Name:
+            words.append(self.string(node.name))
+        else:
+            words.append(self.string(node.op))
+            yield node.left
+            yield node.right
+
+
+def dumps(entry, ast=None):
+    """Serialize a compile to bytes.
+
+    entry is a mapping shaped like CompileResult.cache_entry(): 'ir',
+    'symbols', 'lex_errors', 'errors', 'warnings' and 'assembly'. ast is
+    the Program node to include, if any.
+    """
+    writer = _Writer()
+    ir = entry['ir']
+    names = array('I', map(writer.string, ir.names))
+    constants = array('I', map(writer.value, ir.constants))
+
+    symbols = array('I')
+    for symbol in entry['symbols']:
+        value = symbol['value']
+        symbols.extend((writer.string(symbol['name']), writer.string(symbol['type']),
+                        writer.string(symbol['scope']),
+                        NO_VALUE if value is None else writer.value(value)))
+
+    messages = {key: array('I', map(writer.string, entry[key]))
+                for key in ('lex_errors', 'errors', 'warnings', 'assembly')}
+
+    ast_words = array('I')
+    if ast is not None:
+        writer.node(ast, ast_words)
+
+    string_offsets = array('I', [0])
+    string_data = bytearray()
+    for text in writer.strings:
+        string_data += text.encode('utf-8')
+        string_offsets.append(len(string_data))
+
+    sections = {
+        'ops': ir.ops, 'arg1': ir.arg1, 'arg2': ir.arg2, 'result': ir.result,
+        'string_offsets': string_offsets, 'string_data': string_data,
+        'value_tags': writer.value_tags, 'value_data': writer.value_data,
+        'names': names, 'constants': constants, 'symbols': symbols,
+        'ast': ast_words,
+    }
+    sections.update(messages)
+
+    flags = HAS_AST if ast is not None else 0
+    offset = _aligned(_HEADER.size + _DIRECTORY.size)
+    directory = []
+    blobs = []
+    for name, typecode in zip(SECTIONS, SECTION_TYPES):
+        data = sections[name]
+        if typecode != 'B':
+            if not _LITTLE_ENDIAN:
+                data = array(typecode, data)
+                data.byteswap()
+            count = len(data)
+            data = data.tobytes()
+        else:
+            count = len(data)
+            data = bytes(data)
+        directory.extend((offset, count))
+        blobs.append((offset, data))
+        offset = _aligned(offset + len(data))
+
+    out = bytearray(offset)
+    _HEADER.pack_into(out, 0, MAGIC, FORMAT_VERSION, flags, len(SECTIONS))
+    _DIRECTORY.pack_into(out, _HEADER.size, *directory)
+    for start, data in blobs:
+        out[start:start + len(data)] = data
+    return bytes(out)
+
+
+def save(path, entry, ast=None):
+    """Write dumps(entry, ast) to path"""
+    with open(path, 'wb') as f:
+        f.write(dumps(entry, ast))
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) & ~(_ALIGN - 1)
+
+
+class Artifact:
+    """A serialized compile, read in place from a buffer (bytes, mmap, ...).
+
+    sections maps each section name to a memoryview of its items; ops,
+    arg1, arg2 and result are the IR columns. The views stay valid until
+    close(); everything built from them (ir, symbols, ast, ...) is
+    independent of the buffer.
+    """
+
+    def __init__(self, buffer):
+        self._mmap = None
+        self._views = []
+        try:
+            self._read_directory(buffer)
+        except BaseException:
+            # Release the views taken so far, or the buffer cannot be closed
+            self.close()
+            raise
+        sections = self.sections
+        self.ops = sections['ops']
+        self.arg1 = sections['arg1']
+        self.arg2 = sections['arg2']
+        self.result = sections['result']
+        self._strings = {}
+        self._all_strings = None
+
+    def _read_directory(self, buffer):
+        view = self._keep(memoryview(buffer).cast('B'))
+        if len(view) < _HEADER.size:
+            raise ArtifactError("Artifact is truncated")
+        magic, version, self.flags, count = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ArtifactError("Not a compiled program artifact")
+        if version != FORMAT_VERSION or count != len(SECTIONS):
+            raise ArtifactError(f"Unsupported artifact format version {version}")
+        if len(view) < _HEADER.size + _DIRECTORY.size:
+            raise ArtifactError("Artifact is truncated")
+        directory = _DIRECTORY.unpack_from(view, _HEADER.size)
+
+        self.sections = {}
+        for n, (name, typecode) in enumerate(zip(SECTIONS, SECTION_TYPES)):
+            offset = directory[2 * n]
+            size = directory[2 * n + 1] * _ITEM_SIZES[n]
+            if offset % _ALIGN or offset + size > len(view):
+                raise ArtifactError(f"Artifact section {name} is out of bounds")
+            self.sections[name] = self._section(view[offset:offset + size], typecode)
+            if name == 'value_data':
+                # The same payload words, read as doubles for FLOAT values
+                self._floats = self._section(view[offset:offset + size], 'd')
+
+    @classmethod
+    def open(cls, path):
+        """Map the file at path and read it in place"""
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            artifact = cls(mapped)
+        except BaseException:
+            mapped.close()
+            raise
+        artifact._mmap = mapped
+        return artifact
+
+    def _keep(self, view):
+        self._views.append(view)
+        return view
+
+    def _section(self, view, typecode):
+        self._keep(view)
+        if typecode == 'B':
+            return view
+        if _LITTLE_ENDIAN:
+            return self._keep(view.cast(typecode))
+        data = array(typecode, view.tobytes())
+        data.byteswap()
+        return data
+
+    def close(self):
+        """Release the section views and, if this artifact mapped a file, unmap it"""
+        self.sections = {}
+        self.ops = self.arg1 = self.arg2 = self.result = self._floats = None
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.ops)
+
+    # Tables
+
+    def string(self, index):
+        text = self._strings.get(index)
+        if text is None:
+            offsets = self.sections['string_offsets']
+            data = self.sections['string_data'][offsets[index]:offsets[index + 1]]
+            text = self._strings[index] = str(data, 'utf-8')
+        return text
+
+    def value(self, index):
+        tag = self.sections['value_tags'][index]
+        if tag == INT:
+            return self.sections['value_data'][index]
+        if tag == FLOAT:
+            return self._floats[index]
+        text = self.string(self.sections['value_data'][index])
+        return text if tag == STR else int(text)
+
+    def strings(self):
+        """The whole string table as a list, decoded in one go"""
+        if self._all_strings is None:
+            offsets = self.sections['string_offsets']
+            data = self.sections['string_data']
+            text = str(data, 'utf-8')
+            if len(text) == len(data):
+                # ASCII: byte offsets are character offsets
+                self._all_strings = [text[offsets[i]:offsets[i + 1]]
+                                     for i in range(len(offsets) - 1)]
+            else:
+                self._all_strings = [str(data[offsets[i]:offsets[i + 1]], 'utf-8')
+                                     for i in range(len(offsets) - 1)]
+        return self._all_strings
+
+    def _strings_of(self, name):
+        strings = self.strings()
+        return [strings[index] for index in self.sections[name]]
+
+    @property
+    def ir(self):
+        constants = [self.value(index) for index in self.sections['constants']]
+        names = [self.string(index) for index in self.sections['names']]
+        return IntermediateCode.from_columns(self.ops, self.arg1, self.arg2, self.result,
+                                             names, constants)
+
+    @property
+    def symbols(self):
+        string = self.strings().__getitem__
+        words = self.sections['symbols']
+        return [{'name': string(words[i]), 'type': string(words[i + 1]),
+                 'value': None if words[i + 3] == NO_VALUE else self.value(words[i + 3]),
+                 'scope': string(words[i + 2])}
+                for i in range(0, len(words), 4)]
+
+    @property
+    def lex_errors(self):
+        return self._strings_of('lex_errors')
+
+    @property
+    def errors(self):
+        return self._strings_of('errors')
+
+    @property
+    def warnings(self):
+        return self._strings_of('warnings')
+
+    @property
+    def assembly(self):
+        return self._strings_of('assembly')
+
+    def cache_entry(self):
+        """The compile as a dict shaped like CompileResult.cache_entry()"""
+        return {
+            'lex_errors': self.lex_errors,
+            'symbols': self.symbols,
+            'ir': self.ir,
+            'assembly': self.assembly,
+            'errors': self.errors,
+            'warnings': self.warnings,
+        }
+
+    @property
+    def ast(self):
+        """The stored Program node, or None"""
+        if not self.flags & HAS_AST:
+            return None
+        return self._node(iter(self.sections['ast']).__next__)
+
+    def _node(self, read):
+        """Read a node and the nodes nested in it"""
+        # As in _Writer.node, without recursion: each node is a generator
+        # that yields for each child and is sent the child once it is read
+        stack = [self._read_node(read)]
+        child = None
+        while True:
+            try:
+                stack[-1].send(child)
+            except StopIteration as done:
+                stack.pop()
+                child = done.value
+                if not stack:
+                    return child
+            else:
+                stack.append(self._read_node(read))
+                child = None
+
+    def _read_node(self, read):
+        header = read()
+        kind = NODE_KINDS[header & 0xFF]
+        line = read()
+        position = read()
+        if kind is Program or kind is Block:
+            statements = []
+            for _ in range(read()):
+                statements.append((yield))
+            return kind(statements, line, position)
+        if kind is Declaration:
+            var_type = self.string(read())
+            name = self.string(read())
+            init = (yield) if read() else None
+            return kind(var_type, name, init, line, position)
+        if kind is Assignment:
+            name = self.string(read())
+            return kind(name, (yield), line, position)
+        if kind is Print:
+            return kind((yield), line, position)
+        if kind is If:
+            condition = yield
+            then = yield
+            otherwise = (yield) if read() else None
+            return kind(condition, then, otherwise, line, position)
+        if kind is While:
+            condition = yield
+            return kind(condition, (yield), line, position)
+        if kind is Number:
+            return kind(self.value(read()), line, position)
+        if kind is Name:
+            node = kind(self.string(read()), line, position)
+        else:
+            op = self.string(read())
+            left = yield
+            node = kind(op, left, (yield), line, position)
+        if kind is not Condition:
+            node.type = TYPES[header >> 8]
+        return node
+
+
+def load(path):
+    """Open the artifact file at path (memory mapped); close() it when done"""
+    return Artifact.open(path)
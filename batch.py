@@ -0,0 +1,440 @@
+# batch.py
+"""Headless batch compiler.
+
+Compiles many source files without Tk, spreading them over a process pool.
+Each worker builds its lexer and parser tables once and reuses them for
+every file it is handed.
+
+Usage:
+    python batch.py SRC [SRC ...] [--out-dir DIR | --jsonl FILE] [--jobs N] [-O LEVEL]
+                    [--registers N] [--run [vm|python] [--max-steps N]] [--lexer ply|fast]
+                    [--parser ply|descent] [--profile] [--trace-memory]
+                    [--profile-json FILE] [--profile-trace FILE] [--stream]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from parser import format_instruction
+from session import CompilerSession, PARSER_BACKENDS
+from cache import CompileCache
+from lexer import BACKENDS
+from optimizer import OPT_LEVELS, format_report
+from codegen import DEFAULT_REGISTERS, SCRATCH_REGISTERS, AssemblyEmitter, format_allocation
+from vm import VM, VMError, lower
+from profiling import Profile, phase_timer, merge_profiles, format_profile, chrome_trace
+import artifact
+import transpile
+
+DEFAULT_EXTENSION = '.mc'
+# Execution tiers for --run
+TIERS = ('vm', 'python')
+
+# Per-process compiler session, created by _init_worker
+_session = None
+
+
+def _init_worker(cache_dir=None, opt_level=0, registers=DEFAULT_REGISTERS, lexer_backend='ply',
+                 parser_backend='ply', trace_memory=False):
+    global _session
+    if trace_memory:
+        # Imported here: only --trace-memory needs it
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    _session = CompilerSession(quiet=True, cache=CompileCache(disk_dir=cache_dir),
+                               opt_level=opt_level, registers=registers,
+                               lexer_backend=lexer_backend, parser_backend=parser_backend)
+
+
+def collect_sources(paths, extension=DEFAULT_EXTENSION):
+    """Expand files and directories into (source_path, output_name) pairs"""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith(extension):
+                        full_path = os.path.join(dirpath, filename)
+                        sources.append((full_path, os.path.relpath(full_path, path)))
+        else:
+            sources.append((path, os.path.basename(path)))
+    return sources
+
+
+def format_diagnostics(errors):
+    return [f"{i}. {error}" for i, error in enumerate(errors, 1)]
+
+
+def compile_file(source_path, output_name, out_dir=None, execute=None, max_steps=None,
+                 profile=False, stream=False):
+    """Compile one file in the current worker.
+
+    With out_dir the IR, assembly and diagnostics are written next to each
+    other as <name>.ir / <name>.asm / <name>.err, the whole compile as a
+    binary artifact <name>.mca (see artifact.py), and only a summary is
+    returned; otherwise the full record is returned for the JSON lines output.
+    With execute set to one of TIERS, programs that compiled without errors
+    are also run, on the bytecode VM or as translated Python, and what they
+    print is kept (and written to <name>.out). With profile, the record
+    also holds the Profile (see profiling.py) of the whole job as a dict.
+    With stream, the file is compiled by stream_file() instead.
+    """
+    if stream:
+        return stream_file(source_path, output_name, out_dir, profile)
+    profile = Profile() if profile else None
+    phase = phase_timer(profile)
+    try:
+        with phase('read'):
+            with open(source_path, encoding='utf-8') as f:
+                source_code = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return unreadable_file(source_path, output_name, out_dir, e, profile)
+
+    result = _session.compile(source_code, profile=profile)
+    with phase('format IR'):
+        intermediate = [format_instruction(inst) for inst in result.intermediate_code]
+    errors = result.all_errors
+
+    record = {
+        'file': source_path,
+        'lines': len(source_code.splitlines()),
+        'ok': not errors,
+        'cached': result.cached,
+        'errors': errors,
+        'warnings': result.warnings,
+        'optimization': result.optimization,
+        'allocation': result.allocation,
+    }
+
+    output = None
+    if execute and not errors:
+        try:
+            with phase('run'):
+                if execute == 'python':
+                    output = transpile.execute(result.ir, max_steps)
+                else:
+                    output = VM(max_steps).run(lower(result.ir))
+        except VMError as e:
+            record['ok'] = False
+            errors.append(f"Runtime error: {e}")
+
+    if out_dir is not None:
+        write_mark = profile.mark() if profile is not None else None
+        base = os.path.join(out_dir, os.path.splitext(output_name)[0])
+        os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+        with open(base + '.ir', 'w', encoding='utf-8') as f:
+            f.write("\n".join(intermediate) + "\n")
+        with open(base + '.asm', 'w', encoding='utf-8') as f:
+            f.write("\n".join(result.assembly) + "\n")
+        with open(base + '.err', 'w', encoding='utf-8') as f:
+            f.write("".join(line + "\n" for line in format_diagnostics(errors)))
+            f.write("".join(f"warning: {warning}\n" for warning in result.warnings))
+        artifact.save(base + artifact.SUFFIX, result.cache_entry(), result.ast)
+        if output is not None:
+            with open(base + '.out', 'w', encoding='utf-8') as f:
+                f.write("".join(line + "\n" for line in output))
+        if profile is not None:
+            profile.record('write', write_mark)
+    else:
+        record['intermediate_code'] = intermediate
+        record['assembly'] = result.assembly
+        if output is not None:
+            record['output'] = output
+
+    if profile is not None:
+        record['profile'] = profile.to_dict()
+    return record
+
+
+def stream_file(source_path, output_name, out_dir=None, profile=False):
+    """Compile one file a top-level statement at a time (see
+    CompilerSession.compile_statements()), writing the IR and assembly of
+    each statement as soon as it is parsed: to <name>.ir / <name>.asm /
+    <name>.err under out_dir, or the assembly alone to stdout. Memory use
+    does not grow with the file. The IR is not optimized, and variables
+    live in memory between statements (see codegen.AssemblyEmitter)."""
+    profile = Profile() if profile else None
+    mark = profile.mark() if profile is not None else None
+    try:
+        with open(source_path, 'rb') as f:
+            lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+    except OSError as e:
+        return unreadable_file(source_path, output_name, out_dir, e, profile)
+
+    registers = len(_session.code_generator.registers)
+    if out_dir is not None:
+        base = os.path.join(out_dir, os.path.splitext(output_name)[0])
+        os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+        ir_file = open(base + '.ir', 'w', encoding='utf-8')
+        asm_file = open(base + '.asm', 'w', encoding='utf-8')
+    else:
+        ir_file = None
+        asm_file = sys.stdout
+    try:
+        emitter = AssemblyEmitter(asm_file, registers)
+
+        def consume(statement, ir):
+            if ir_file is not None:
+                ir_file.write("".join(format_instruction(inst) + "\n" for inst in ir.to_dicts()))
+            emitter.add(ir)
+
+        try:
+            with open(source_path, encoding='utf-8') as source:
+                result = _session.compile_statements(source, consume)
+        except UnicodeDecodeError as e:
+            # What was parsed before the undecodable bytes stays written
+            return unreadable_file(source_path, output_name, out_dir, e, profile)
+        allocation = emitter.close()
+    finally:
+        if ir_file is not None:
+            ir_file.close()
+            asm_file.close()
+        else:
+            asm_file.flush()
+    errors = result.all_errors
+    if out_dir is not None:
+        with open(base + '.err', 'w', encoding='utf-8') as f:
+            f.write("".join(line + "\n" for line in format_diagnostics(errors)))
+            f.write("".join(f"warning: {warning}\n" for warning in result.warnings))
+
+    record = {
+        'file': source_path,
+        'lines': lines,
+        'ok': not errors,
+        'cached': False,
+        'errors': errors,
+        'warnings': result.warnings,
+        'optimization': None,
+        'allocation': allocation,
+    }
+    if profile is not None:
+        # Reading, parsing, code generation and writing are interleaved
+        profile.record('stream', mark)
+        record['profile'] = profile.to_dict()
+    return record
+
+
+def unreadable_file(source_path, output_name, out_dir, error, profile=None):
+    """Record of a source that could not be read or decoded as UTF-8; with
+    out_dir the error is written to <name>.err, so that one bad file does
+    not stop the batch"""
+    errors = [f"Cannot read source file: {error}"]
+    record = {
+        'file': source_path,
+        'lines': 0,
+        'ok': False,
+        'cached': False,
+        'errors': errors,
+        'warnings': [],
+        'optimization': None,
+        'allocation': None,
+    }
+    if out_dir is not None:
+        base = os.path.join(out_dir, os.path.splitext(output_name)[0])
+        os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+        with open(base + '.err', 'w', encoding='utf-8') as f:
+            f.write("".join(line + "\n" for line in format_diagnostics(errors)))
+    else:
+        record['intermediate_code'] = []
+        record['assembly'] = []
+    if profile is not None:
+        record['profile'] = profile.to_dict()
+    return record
+
+
+def summarize_optimization(records):
+    """Per-pass totals of the optimizer reports over all compiled files"""
+    reports = [record['optimization'] for record in records if record['optimization']]
+    if not reports:
+        return []
+    passes = {}
+    for report in reports:
+        for total in report['passes']:
+            summary = passes.setdefault(total['pass'], {'pass': total['pass'], 'runs': 0,
+                                                        'removed': 0, 'seconds': 0.0})
+            for key in ('runs', 'removed', 'seconds'):
+                summary[key] += total[key]
+    return format_report({
+        'before': sum(report['before'] for report in reports),
+        'after': sum(report['after'] for report in reports),
+        'passes': list(passes.values()),
+    })
+
+
+def summarize_allocation(records):
+    """Register allocation totals over all compiled files"""
+    reports = [record['allocation'] for record in records if record['allocation']]
+    if not reports:
+        return []
+    totals = {key: sum(report[key] for report in reports)
+              for key in ('values', 'spilled', 'reloads', 'stores', 'copies', 'moves_eliminated')}
+    totals['registers'] = reports[0]['registers']
+    return format_allocation(totals)
+
+
+def write_profiles(records, json_path=None, trace_path=None):
+    """Print the profile totals over all records to stderr, and write them
+    (with the per-file profiles) as JSON and as a Chrome trace"""
+    profiles = [record['profile'] for record in records]
+    totals = merge_profiles(profiles)
+    print("", file=sys.stderr)
+    for line in format_profile(totals):
+        print(line, file=sys.stderr)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({'total': totals,
+                       'files': [dict(record['profile'], file=record['file']) for record in records]},
+                      f, indent=1)
+    if trace_path:
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            json.dump(chrome_trace(profiles, [record['file'] for record in records]), f)
+
+
+def _compile_job(job):
+    return compile_file(*job)
+
+
+def run(sources, out_dir=None, jsonl=None, jobs=None, chunksize=16, cache_dir=None,
+        opt_level=0, registers=DEFAULT_REGISTERS, execute=None, max_steps=None,
+        lexer_backend='ply', parser_backend='ply', profile=False, trace_memory=False,
+        stream=False):
+    """Compile (and with execute, run) every source and return
+    (records, elapsed_seconds). With profile each record has a 'profile';
+    trace_memory adds peak memory to it (and slows compiles down). stream
+    compiles each file with stream_file()."""
+    jobs = jobs or os.cpu_count() or 1
+    work = [(path, name, out_dir, execute, max_steps, profile, stream) for path, name in sources]
+    records = []
+
+    start = time.perf_counter()
+    if jobs == 1:
+        _init_worker(cache_dir, opt_level, registers, lexer_backend, parser_backend, trace_memory)
+        results = map(_compile_job, work)
+    else:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                       initargs=(cache_dir, opt_level, registers, lexer_backend,
+                                                 parser_backend, trace_memory))
+        results = executor.map(_compile_job, work, chunksize=chunksize)
+
+    try:
+        for record in results:
+            if jsonl is not None:
+                jsonl.write(json.dumps(record) + "\n")
+            records.append({key: record.get(key) for key in
+                            ('file', 'lines', 'ok', 'cached', 'errors', 'optimization',
+                             'allocation', 'profile')})
+    finally:
+        if jobs != 1:
+            executor.shutdown()
+    elapsed = time.perf_counter() - start
+
+    return records, elapsed
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Compile mini-language sources without the GUI")
+    arg_parser.add_argument('sources', nargs='+', help="source files or directories")
+    arg_parser.add_argument('--ext', default=DEFAULT_EXTENSION,
+                            help=f"file extension to pick up from directories (default {DEFAULT_EXTENSION})")
+    output = arg_parser.add_mutually_exclusive_group()
+    output.add_argument('--out-dir', help="write <name>.ir, <name>.asm, <name>.err and <name>.mca per file")
+    output.add_argument('--jsonl', help="write one JSON record per file ('-' for stdout)")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None,
+                            help="worker processes (default: all cores)")
+    arg_parser.add_argument('--chunksize', type=int, default=16,
+                            help="files handed to a worker at a time")
+    arg_parser.add_argument('--cache-dir',
+                            help="share compile results across runs and workers through this directory")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=OPT_LEVELS, default=0,
+                            help="optimization level: -O0 (none), -O1 or -O2")
+    arg_parser.add_argument('--registers', type=int, default=DEFAULT_REGISTERS,
+                            help=f"registers available to the code generator (default {DEFAULT_REGISTERS})")
+    arg_parser.add_argument('--run', nargs='?', const='vm', choices=TIERS,
+                            help="run each program that compiles cleanly and keep what it prints, "
+                                 "on the bytecode VM (default) or translated to Python")
+    arg_parser.add_argument('--max-steps', type=int, default=None,
+                            help="with --run, stop a program after this many jumps (loop "
+                                 "iterations for --run python)")
+    arg_parser.add_argument('--lexer', choices=BACKENDS, default='ply',
+                            help="lexer backend; 'fast' scans with one regex instead of PLY")
+    arg_parser.add_argument('--parser', choices=sorted(PARSER_BACKENDS), default='ply',
+                            help="parser backend; 'descent' is hand-written instead of PLY's LALR")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="time every phase of each compile and print the totals")
+    arg_parser.add_argument('--trace-memory', action='store_true',
+                            help="with --profile, also measure peak memory per phase with "
+                                 "tracemalloc (several times slower)")
+    arg_parser.add_argument('--profile-json', metavar='FILE',
+                            help="write the totals and per-file profiles as JSON (implies --profile)")
+    arg_parser.add_argument('--profile-trace', metavar='FILE',
+                            help="write the per-file phases in Chrome trace event format, for "
+                                 "chrome://tracing or Perfetto (implies --profile)")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="compile a statement at a time, writing IR and assembly as they are "
+                                 "generated (to stdout without --out-dir); memory stays flat however "
+                                 "large the file")
+    args = arg_parser.parse_args(argv)
+    if args.registers <= SCRATCH_REGISTERS:
+        arg_parser.error(f"--registers must be more than {SCRATCH_REGISTERS}")
+    if args.max_steps is not None and args.max_steps < 1:
+        arg_parser.error("--max-steps must be at least 1")
+    if args.stream:
+        for option, value in (('--jsonl', args.jsonl), ('-O', args.opt_level),
+                              ('--run', args.run), ('--cache-dir', args.cache_dir)):
+            if value:
+                arg_parser.error(f"--stream cannot be combined with {option}")
+        if args.out_dir is None:
+            # Assembly goes to stdout, one file after another
+            args.jobs = 1
+
+    sources = collect_sources(args.sources, args.ext)
+    if not sources:
+        print("No source files found", file=sys.stderr)
+        return 2
+
+    profile = bool(args.profile or args.profile_json or args.profile_trace)
+
+    # Generate the lexer and parse table modules once so workers only ever
+    # read them; backends that do not use PLY have no tables to generate
+    CompilerSession(quiet=True, lexer_backend=args.lexer, parser_backend=args.parser).build()
+
+    jsonl = None
+    if args.jsonl == '-':
+        jsonl = sys.stdout
+    elif args.jsonl:
+        jsonl = open(args.jsonl, 'w', encoding='utf-8')
+
+    try:
+        records, elapsed = run(sources, out_dir=args.out_dir, jsonl=jsonl,
+                               jobs=args.jobs, chunksize=args.chunksize,
+                               cache_dir=args.cache_dir, opt_level=args.opt_level,
+                               registers=args.registers, execute=args.run,
+                               max_steps=args.max_steps, lexer_backend=args.lexer,
+                               parser_backend=args.parser, profile=profile,
+                               trace_memory=profile and args.trace_memory, stream=args.stream)
+    finally:
+        if jsonl is not None and jsonl is not sys.stdout:
+            jsonl.close()
+
+    failed = sum(1 for record in records if not record['ok'])
+    cached = sum(1 for record in records if record['cached'])
+    lines = sum(record['lines'] for record in records)
+    rate = len(records) / elapsed if elapsed else float('inf')
+    print(f"Compiled {len(records)} files ({lines} lines) in {elapsed:.2f}s: "
+          f"{rate:.1f} files/s, {lines / elapsed if elapsed else 0:.0f} lines/s, "
+          f"{failed} with errors, {cached} cache hits", file=sys.stderr)
+    for line in summarize_optimization(records) + summarize_allocation(records):
+        print(line, file=sys.stderr)
+    if profile:
+        write_profiles(records, args.profile_json, args.profile_trace)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# benchmarks/bench_artifact.py
+"""Round-trip check and load times of binary artifacts vs JSON and pickle.
+
+For generated programs of each size, compiles once, writes the result as
+a binary artifact (artifact.py), as JSON in the dict format and as a
+pickle, and checks the artifact reads back to the parser's own
+intermediate code, symbols, errors and AST. Then times loading each file
+until its IR is usable, until the whole compile is back as IR, symbols,
+diagnostics and assembly, and until it is all in the dict format.
+
+Usage: python benchmarks/bench_artifact.py [statements ...]
+"""
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifact
+from session import CompilerSession
+from programs import generate
+
+
+def best_of(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check(session, source):
+    """Compile source, round-trip it through an artifact, and return the result"""
+    result = session.compile(source)
+    parser = session.parser
+    data = artifact.dumps(result.cache_entry(), result.ast)
+    with artifact.Artifact(data) as loaded:
+        if (loaded.ir.to_dicts() != parser.intermediate_code
+                or loaded.symbols != parser.symbol_table.get_all()
+                or loaded.errors != parser.errors
+                or loaded.assembly != result.assembly
+                or repr(loaded.ast) != repr(parser.ast)):
+            raise SystemExit("artifact round trip differs from the parser's output")
+    return result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [20, 2000, 40000]
+    session = CompilerSession(quiet=True)
+    directory = tempfile.mkdtemp()
+
+    print(f"{'statements':>10} {'format':<8} {'bytes':>10} {'IR':>10} {'entry':>10} {'dicts':>10}")
+    for size in sizes:
+        result = check(session, generate(size, seed=size))
+        entry = result.cache_entry()
+        plain = dict(entry, intermediate_code=result.intermediate_code)
+        del plain['ir']
+
+        paths = {name: os.path.join(directory, f"{size}.{name}") for name in ('mca', 'json', 'pickle')}
+        artifact.save(paths['mca'], entry, result.ast)
+        with open(paths['json'], 'w', encoding='utf-8') as f:
+            json.dump(plain, f)
+        with open(paths['pickle'], 'wb') as f:
+            pickle.dump(plain, f, pickle.HIGHEST_PROTOCOL)
+
+        # Time until the IR is usable, until the whole compile is back in the
+        # form the compiler uses (CompileResult.cache_entry()), and until it
+        # is back in the dict format
+        def artifact_ir():
+            with artifact.load(paths['mca']) as loaded:
+                loaded.ir
+
+        def artifact_entry():
+            with artifact.load(paths['mca']) as loaded:
+                return loaded.cache_entry()
+
+        def artifact_dicts():
+            artifact_entry()['ir'].to_dicts()
+
+        def load_json():
+            with open(paths['json'], encoding='utf-8') as f:
+                return json.load(f)
+
+        def load_pickle():
+            with open(paths['pickle'], 'rb') as f:
+                return pickle.load(f)
+
+        def from_dicts(load):
+            return lambda: type(result.ir).from_dicts(load()['intermediate_code'])
+
+        repeat = max(3, min(2000, 200000 // size))
+        for name, load_ir, load_entry, load_dicts in (
+                ('mca', artifact_ir, artifact_entry, artifact_dicts),
+                ('json', from_dicts(load_json), from_dicts(load_json), load_json),
+                ('pickle', from_dicts(load_pickle), from_dicts(load_pickle), load_pickle)):
+            times = [best_of(load, repeat) * 1e6 for load in (load_ir, load_entry, load_dicts)]
+            print(f"{size:>10} {name:<8} {os.path.getsize(paths[name]):>10} "
+                  + " ".join(f"{t:>8.0f}us" for t in times))
+
+
+if __name__ == "__main__":
+    main()
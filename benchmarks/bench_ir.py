@@ -0,0 +1,80 @@
+# benchmarks/bench_ir.py
+"""Memory and code generation time of the compact IR vs the dict format.
+
+Builds a synthetic program of N three-address instructions in both forms,
+measures their size with tracemalloc, and times CodeGenerator on each.
+
+Usage: python benchmarks/bench_ir.py [instructions]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codegen import CodeGenerator
+from ir import IntermediateCode, temp_operand, label_operand, NONE
+
+
+def build_dicts(count):
+    code = []
+    temp = label = 0
+    while len(code) < count:
+        temp += 1
+        label += 1
+        code.append({'op': '*', 'arg1': 'x', 'arg2': 2, 'result': f"t{temp}"})
+        code.append({'op': '+', 'arg1': f"t{temp}", 'arg2': 'y', 'result': f"t{temp + 1}"})
+        code.append({'op': '=', 'arg1': f"t{temp + 1}", 'arg2': None, 'result': 'total'})
+        code.append({'op': 'label', 'arg1': f"L{label}", 'arg2': None, 'result': None})
+        temp += 1
+    return code[:count]
+
+
+def build_ir(count):
+    ir = IntermediateCode()
+    x, y, total, two = ir.var('x'), ir.var('y'), ir.var('total'), ir.const(2)
+    temp = label = 0
+    while len(ir) < count:
+        temp += 1
+        label += 1
+        ir.emit('*', x, two, temp_operand(temp))
+        ir.emit('+', temp_operand(temp), y, temp_operand(temp + 1))
+        ir.emit('=', temp_operand(temp + 1), NONE, total)
+        ir.emit('label', label_operand(label))
+        temp += 1
+    return ir
+
+
+def measure(build, count):
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    code = build(count)
+    size = sum(stat.size_diff for stat in
+               tracemalloc.take_snapshot().compare_to(start, 'filename'))
+    tracemalloc.stop()
+    return code, size
+
+
+def time_codegen(code):
+    start = time.perf_counter()
+    CodeGenerator().generate(code)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    dicts, dict_bytes = measure(build_dicts, count)
+    ir, ir_bytes = measure(build_ir, count)
+    print(f"{count} instructions")
+    print(f"memory   dicts {dict_bytes / 2**20:8.1f} MiB   compact {ir_bytes / 2**20:8.1f} MiB   "
+          f"{dict_bytes / ir_bytes:.1f}x smaller")
+
+    converted = time_codegen(dicts)
+    compact = time_codegen(ir)
+    print(f"codegen  dicts {converted:8.2f} s     compact {compact:8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
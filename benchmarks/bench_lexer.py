@@ -0,0 +1,47 @@
+# benchmarks/bench_lexer.py
+"""Throughput of the two lexer backends.
+
+Both are timed on a large generated program, in tokens per second. That
+they agree is checked by tests/test_lexer.py.
+
+Usage: python benchmarks/bench_lexer.py [lines]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexer import Lexer, BACKENDS
+
+PROGRAM = """int counter{n};
+counter{n} = {n} * 2 + 1;
+/* a comment */
+while (counter{n} < 100) {{
+    if (counter{n} % 2 == 0) {{ counter{n} = counter{n} + 3.5; }} // trailing
+}}
+print(counter{n});
+"""
+
+
+def build(backend):
+    lexer = Lexer()
+    lexer.build(backend)
+    return lexer
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 70000
+    lexers = {backend: build(backend) for backend in BACKENDS}
+
+    source = "".join(PROGRAM.format(n=n) for n in range(lines // 7))
+    print(f"{'backend':<8} {'tokens':>9} {'time':>8} {'tokens/s':>11}")
+    for backend, lexer in lexers.items():
+        start = time.perf_counter()
+        tokens, _ = lexer.tokenize(source)
+        elapsed = time.perf_counter() - start
+        print(f"{backend:<8} {len(tokens):9} {elapsed:7.2f}s {len(tokens) / elapsed:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# benchmarks/bench_parser.py
+"""Time the PLY and the recursive-descent parser backends on large
+generated programs, checking they produce the same IR and errors.
+
+Usage: python benchmarks/bench_parser.py [statements ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import CompilerSession, PARSER_BACKENDS
+from programs import generate
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [2000, 10000, 40000]
+    sessions = {(parser, lexer): CompilerSession(quiet=True, lexer_backend=lexer,
+                                                 parser_backend=parser)
+                for parser in PARSER_BACKENDS for lexer in ('ply', 'fast')}
+
+    print(f"{'statements':>10} {'parser':<8} {'lexer':<6} {'parse':>9} {'statements/s':>13}")
+    for size in sizes:
+        source = generate(size)
+        reference = None
+        for (parser_backend, lexer_backend), session in sessions.items():
+            parser = session.parser
+            start = time.perf_counter()
+            parser.parse(source)
+            elapsed = time.perf_counter() - start
+            result = (parser.intermediate_code, parser.errors, parser.symbol_table.get_all())
+            if reference is None:
+                reference = result
+            elif result != reference:
+                raise SystemExit(f"{parser_backend}/{lexer_backend} disagrees on {size} statements")
+            print(f"{size:>10} {parser_backend:<8} {lexer_backend:<6} {elapsed:8.3f}s {size / elapsed:13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/bench_server.py
+"""Load-test the compile server.
+
+Starts server.py on a temporary Unix socket and opens a number of
+concurrent connections, each sending compile requests one after another.
+The first round compiles distinct generated programs (each reaching a
+worker); the second resubmits them, as an editor or grader re-checking
+unchanged files would, and is answered from the reply cache. Prints the
+latency percentiles and throughput of each round, the time until the
+server answered its first request, and for comparison the time to compile
+one of the programs in a fresh `python batch.py` process.
+
+Usage: python benchmarks/bench_server.py [--connections N] [--programs N]
+                                         [--statements N] [--jobs N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from programs import generate
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def client(path, sources, latencies, method='compile'):
+    reader, writer = await asyncio.open_unix_connection(path, limit=64 * 1024 * 1024)
+    for request_id, source in enumerate(sources):
+        request = {'jsonrpc': '2.0', 'id': request_id, 'method': method,
+                   'params': {'source': source} if method == 'compile' else {}}
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode('utf-8') + b"\n")
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        if 'error' in response:
+            raise SystemExit(f"server error: {response['error']}")
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_round(path, connections, sources):
+    """Send sources, dealt out round-robin, over connections at once;
+    returns (latencies, seconds)"""
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(path, sources[i::connections], latencies)
+                           for i in range(connections)))
+    return latencies, time.perf_counter() - start
+
+
+async def first_reply(path, source, started):
+    """Seconds from starting the server until it answered a compile"""
+    while True:
+        try:
+            await client(path, [source], [])
+            return time.perf_counter() - started
+        except (FileNotFoundError, ConnectionRefusedError):
+            await asyncio.sleep(0.005)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--connections', type=int, default=4)
+    arg_parser.add_argument('--programs', type=int, default=2000)
+    arg_parser.add_argument('--statements', type=int, default=10,
+                            help="top-level statements per generated program")
+    arg_parser.add_argument('--jobs', type=int, default=None, help="server worker processes")
+    args = arg_parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'server.sock')
+    # Few identifiers, so that even short programs differ from seed to seed
+    sources = [generate(args.statements, seed=seed, identifiers=4)
+               for seed in range(args.programs)]
+    command = [sys.executable, os.path.join(ROOT, 'server.py'), '--socket', path]
+    if args.jobs:
+        command += ['--jobs', str(args.jobs)]
+
+    started = time.perf_counter()
+    server = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+    try:
+        ready = asyncio.run(first_reply(path, sources[0], started))
+        print(f"server answered its first compile {ready * 1000:.0f}ms after starting")
+        print(f"{'round':<8} {'requests':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'requests/s':>11}")
+        for name in ('compile', 'cached'):
+            latencies, elapsed = asyncio.run(run_round(path, args.connections, sources))
+            print(f"{name:<8} {len(latencies):>8} "
+                  + " ".join(f"{percentile(latencies, fraction) * 1000:7.2f}ms"
+                             for fraction in (0.5, 0.95, 0.99))
+                  + f" {len(latencies) / elapsed:11.0f}")
+    finally:
+        if server.poll() is None:
+            asyncio.run(client(path, [None], [], method='shutdown'))
+        server.wait()
+
+    source_path = os.path.join(directory, 'program.mc')
+    with open(source_path, 'w', encoding='utf-8') as f:
+        f.write(sources[0])
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT, 'batch.py'), source_path, '--jobs', '1',
+                    '--out-dir', directory], check=True, stderr=subprocess.DEVNULL)
+    print(f"one program in a fresh batch.py process: "
+          f"{(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
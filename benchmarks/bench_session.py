@@ -0,0 +1,72 @@
+# benchmarks/bench_session.py
+"""Compare a cold compile (fresh Parser + tables per run) with a warm session.
+
+Usage: python benchmarks/bench_session.py [runs]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexer import Lexer
+from parser import Parser
+from codegen import CodeGenerator
+from session import CompilerSession
+
+SAMPLE = """int x;
+int y;
+x = 10;
+y = 20;
+int sum;
+sum = x + y;
+print(sum);
+if (x < y) {
+    int diff;
+    diff = y - x;
+    print(diff);
+}
+int counter;
+counter = 0;
+while (counter < 5) {
+    int temp;
+    temp = counter * 2;
+    counter = counter + 1;
+}
+"""
+
+
+def cold_compile(source):
+    # What CompilerGUI.compile_code used to do on every click
+    lexer = Lexer()
+    lexer.build()
+    lexer.tokenize(source)
+    parser = Parser()
+    parser.build()
+    parser.parse(source)
+    CodeGenerator().generate(parser.ir)
+
+
+def bench(label, func, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<6} {runs} runs  {elapsed * 1000:9.2f} ms total  "
+          f"{elapsed / runs * 1e6:9.1f} us/compile")
+    return elapsed
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    cold = bench("cold", lambda: cold_compile(SAMPLE), runs)
+
+    session = CompilerSession()
+    warm = bench("warm", lambda: session.compile(SAMPLE), runs)
+
+    print(f"speedup {cold / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# benchmarks/bench_startup.py
+"""Measure time to first compile in a fresh interpreter.
+
+Runs each startup path in new Python processes: the library with PLY's
+lexer and parser, the library with the fast lexer and the descent parser
+(which never import PLY), and the GUI, from importing gui to its worker
+thread handing back the first compile. Where there is no display, the GUI
+path runs the GUI's worker and compile function without a window. For
+each path it prints the median of the whole process, the imports and the
+first compile (building the tables included), whether tkinter and PLY
+were loaded, and from one run under `python -X importtime` the modules
+that took longest to import.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--top N]
+"""
+import argparse
+import compileall
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SOURCE = "int x;\nx = 10;\nwhile (x > 0) {\n    print(x);\n    x = x - 1;\n}\n"
+
+LIBRARY = """
+import time
+start = time.perf_counter()
+from session import CompilerSession
+imported = time.perf_counter()
+session = CompilerSession(quiet=True, lexer_backend={lexer!r}, parser_backend={parser!r})
+assert not session.compile({source!r}).all_errors
+compiled = time.perf_counter()
+window = None
+"""
+
+GUI = """
+import time
+start = time.perf_counter()
+import gui
+imported = time.perf_counter()
+try:
+    root = gui.tk.Tk()
+except gui.tk.TclError:
+    # No display: drive the GUI's worker with the GUI's compile function
+    from profiling import Profile
+    session = gui.CompilerSession(cache=gui.CompileCache())
+    incremental = gui.IncrementalCompiler(session)
+    worker = gui.CompileWorker(lambda source, cancel: incremental.compile(source, cancel, Profile()),
+                               warm_up=session.build)
+    worker.submit({source!r})
+    while worker.poll() is None:
+        time.sleep(0.0005)
+    window = False
+else:
+    root.withdraw()
+    app = gui.CompilerGUI(root)
+    app.input_text.delete('1.0', gui.tk.END)
+    app.input_text.insert('1.0', {source!r})
+    app.compile_code()
+    while app.status.cget('text') != "Ready":
+        root.update()
+        time.sleep(0.0005)
+    window = True
+compiled = time.perf_counter()
+"""
+
+REPORT = """
+import json, sys
+print(json.dumps({'import': imported - start, 'compile': compiled - imported, 'window': window,
+                  'tkinter': 'tkinter' in sys.modules, 'ply': 'ply.lex' in sys.modules}))
+"""
+
+PATHS = (
+    ('library', LIBRARY.format(lexer='ply', parser='ply', source=SOURCE)),
+    ('library fast', LIBRARY.format(lexer='fast', parser='descent', source=SOURCE)),
+    ('gui', GUI.format(source=SOURCE)),
+)
+
+
+def run(code, *options):
+    """(seconds, report dict, stderr) of one fresh interpreter running code"""
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, *options, '-c', code + REPORT], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, json.loads(process.stdout.splitlines()[-1]), process.stderr
+
+
+def slowest_imports(importtime, top):
+    """The top modules by self time from -X importtime output"""
+    modules = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((int(self_us), int(cumulative_us), name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--runs', type=int, default=9)
+    arg_parser.add_argument('--top', type=int, default=6, help="slowest imports listed per path")
+    args = arg_parser.parse_args()
+
+    # Byte-compile the sources, and let a first run write the PLY table
+    # modules, so every timed run starts the way an installed copy would
+    compileall.compile_dir(ROOT, quiet=1)
+    for _, code in PATHS:
+        run(code)
+
+    print(f"{'path':<14} {'process':>9} {'imports':>9} {'compile':>9}  loaded")
+    slowest = {}
+    for name, code in PATHS:
+        runs = [run(code) for _ in range(args.runs)]
+        report = runs[-1][1]
+        loaded = [module for module in ('tkinter', 'ply') if report[module]]
+        note = " (no display: worker only)" if report['window'] is False else ""
+        print(f"{name:<14} "
+              + " ".join(f"{statistics.median(values) * 1000:7.1f}ms" for values in (
+                  [elapsed for elapsed, _, _ in runs],
+                  [report['import'] for _, report, _ in runs],
+                  [report['compile'] for _, report, _ in runs]))
+              + f"  {', '.join(loaded) or '-'}{note}")
+        slowest[name] = slowest_imports(run(code, '-X', 'importtime')[2], args.top)
+
+    for name, modules in slowest.items():
+        print(f"\nslowest imports, {name} (self / cumulative):")
+        for self_us, cumulative_us, module in modules:
+            print(f"  {self_us / 1000:6.1f}ms {cumulative_us / 1000:7.1f}ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
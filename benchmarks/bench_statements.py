@@ -0,0 +1,73 @@
+# benchmarks/bench_statements.py
+"""Compare a whole-program compile with a statement-streaming one.
+
+For generated programs of each size, times CompilerSession.compile() and
+compile_statements() (with a consumer that only counts instructions) and
+measures their peak traced memory, both reading the source from a file.
+The streamed IR must add up to the same number of instructions;
+statements per second should stay flat as programs grow, and the
+streaming peak only grows with the global variables (each loop of the
+generated programs declares its counter) and distinct constants.
+
+Usage: python benchmarks/bench_statements.py [statements ...]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import CompilerSession
+from programs import generate
+
+
+def measure(function):
+    """(seconds, peak traced bytes) of function, timed in a run of its own
+    as tracing slows it down"""
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        function()
+        return elapsed, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [5000, 20000, 80000]
+    session = CompilerSession(quiet=True)
+    path = os.path.join(tempfile.mkdtemp(), "program.mc")
+
+    print(f"{'statements':>10} {'mode':<8} {'time':>9} {'statements/s':>13} {'peak memory':>12}")
+    for size in sizes:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(generate(size, seed=size))
+        streamed = []
+
+        def whole():
+            with open(path, encoding='utf-8') as f:
+                streamed.append(len(session.compile(f.read()).ir))
+
+        def streaming():
+            count = 0
+
+            def consume(statement, ir):
+                nonlocal count
+                count += len(ir)
+            with open(path, encoding='utf-8') as f:
+                session.compile_statements(f, consume)
+            streamed.append(count)
+
+        for mode, function in (('whole', whole), ('stream', streaming)):
+            elapsed, peak = measure(function)
+            print(f"{size:>10} {mode:<8} {elapsed:8.2f}s {size / elapsed:13.0f} {peak / 2**20:10.1f}MB")
+        if streamed[0] != streamed[2]:
+            raise SystemExit(f"streamed {streamed[2]} instructions, not {streamed[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/bench_stream.py
+"""Stream-lex a large generated source and check memory stays flat.
+
+A program of the given size (in MB) is written to a temporary file, then
+tokenized through StreamingLexer.tokens() from the open file. The growth
+of the process's peak resident memory is reported: a lexer that held the
+source or its tokens would grow by a multiple of the file size, a
+streaming one by about nothing. (Reading through tokenize_file()'s mmap
+instead counts the mapped file pages as resident, though the kernel can
+drop them at any time.)
+
+Usage: python benchmarks/bench_stream.py [megabytes] [chunk_size]
+"""
+import os
+import sys
+import tempfile
+import resource
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexer import StreamingLexer
+
+BLOCK = """int counter{n};
+counter{n} = {n} * 2 + 1;
+/* a comment spanning
+   a few lines */
+while (counter{n} < 100) {{
+    counter{n} = counter{n} + 3.5; // trailing comment
+}}
+print(counter{n});
+"""
+
+
+def write_source(path, megabytes):
+    target = megabytes * 1024 * 1024
+    written = 0
+    n = 0
+    with open(path, 'w') as f:
+        while written < target:
+            text = "".join(BLOCK.format(n=n + i) for i in range(1000))
+            f.write(text)
+            written += len(text)
+            n += 1000
+    return written
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else StreamingLexer.CHUNK_SIZE
+
+    fd, path = tempfile.mkstemp(suffix='.mc')
+    os.close(fd)
+    try:
+        size = write_source(path, megabytes)
+        lexer = StreamingLexer(chunk_size)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        count = 0
+        last = None
+        with open(path, 'rb') as f:
+            for last in lexer.tokens(f):
+                count += 1
+        elapsed = time.perf_counter() - start
+        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    finally:
+        os.unlink(path)
+
+    print(f"source {size / 1e6:8.1f} MB, {count} tokens, last at line {last.line if last else 0}")
+    print(f"lex    {elapsed:8.2f} s  ({size / elapsed / 1e6:.2f} MB/s)")
+    print(f"peak   +{growth} KB resident")
+    print(f"errors {len(lexer.errors)}")
+
+
+if __name__ == "__main__":
+    main()
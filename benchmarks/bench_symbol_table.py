@@ -0,0 +1,93 @@
+# benchmarks/bench_symbol_table.py
+"""Symbol table cost on deeply nested, identifier-heavy programs.
+
+Compiles a generated program whose innermost blocks read globals many
+scopes up, and times the same lookups directly against SymbolTable and
+against the old flat "scope:name" dict layout.
+
+Usage: python benchmarks/bench_symbol_table.py [depth] [uses]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from symbol_table import SymbolTable
+from session import CompilerSession
+
+
+class FlatSymbolTable:
+    """The previous layout: one dict keyed by f"{scope}:{name}" """
+
+    def __init__(self):
+        self.symbols = {}
+        self.scope_stack = ['global']
+        self.scope_counter = 0
+
+    def enter_scope(self):
+        self.scope_counter += 1
+        self.scope_stack.append(f"scope_{self.scope_counter}")
+
+    def insert(self, name, symbol_type):
+        key = f"{self.scope_stack[-1]}:{name}"
+        self.symbols[key] = {'name': name, 'type': symbol_type, 'value': None,
+                             'scope': self.scope_stack[-1]}
+
+    def lookup(self, name):
+        for scope in reversed(self.scope_stack):
+            key = f"{scope}:{name}"
+            if key in self.symbols:
+                return self.symbols[key]
+        return None
+
+
+def nested_program(depth, uses):
+    """Globals g0..g9 used `uses` times inside `depth` nested blocks"""
+    lines = [f"int g{i};" for i in range(10)]
+    for level in range(depth):
+        lines.append("{" + f" int v{level}; v{level} = {level};")
+    expr = " + ".join(f"g{i % 10}" for i in range(uses))
+    lines.append(f"g0 = {expr};")
+    lines.extend("}" for _ in range(depth))
+    return "\n".join(lines) + "\n"
+
+
+def bench_lookups(table_class, depth, rounds):
+    table = table_class()
+    for i in range(10):
+        table.insert(f"g{i}", 'int')
+    for level in range(depth):
+        table.enter_scope()
+        table.insert(f"v{level}", 'int')
+    names = [f"g{i}" for i in range(10)]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for name in names:
+            table.lookup(name)
+    return time.perf_counter() - start
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    uses = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    rounds = 2000
+    flat = bench_lookups(FlatSymbolTable, depth, rounds)
+    chain = bench_lookups(SymbolTable, depth, rounds)
+    lookups = rounds * 10
+    print(f"lookup at depth {depth}: flat {flat / lookups * 1e6:8.2f} us  "
+          f"scope chain {chain / lookups * 1e6:8.2f} us  speedup {flat / chain:.1f}x")
+
+    source = nested_program(depth, uses)
+    session = CompilerSession(quiet=True)
+    start = time.perf_counter()
+    result = session.compile(source)
+    elapsed = time.perf_counter() - start
+    print(f"compile depth {depth}, {uses} uses: {elapsed * 1000:9.2f} ms  "
+          f"({len(result.symbols)} symbols, {len(result.all_errors)} errors)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_tiers.py
+"""Compare the bytecode VM with the Python-translated tier on loops.
+
+Each program is compiled once, then run on both tiers; their output must
+match. Compile-to-Python time is shown separately from run time.
+
+Usage: python benchmarks/bench_tiers.py [iterations] [opt_level]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import CompilerSession
+from transpile import compile_ir
+from vm import VM, lower
+
+PROGRAMS = {
+    'counter': """int counter;
+counter = 0;
+while (counter < {n}) {{
+    int temp;
+    temp = counter * 2;
+    counter = counter + 1;
+}}
+print(counter);
+""",
+    'nested': """int i;
+int j;
+int sum;
+sum = 0;
+i = 0;
+while (i < {root}) {{
+    j = 0;
+    while (j < {root}) {{
+        sum = (sum + i * j + 3) % 1000003;
+        j = j + 1;
+    }}
+    i = i + 1;
+}}
+print(sum);
+""",
+    'branchy': """int i;
+int odd;
+int even;
+i = 0;
+odd = 0;
+even = 0;
+while (i < {n}) {{
+    if (i % 2 == 0) {{
+        even = even + i / 3;
+    }} else {{
+        odd = odd - i * 2;
+    }}
+    i = i + 1;
+}}
+print(even);
+print(odd);
+""",
+}
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    opt_level = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    session = CompilerSession(quiet=True, opt_level=opt_level)
+
+    print(f"{'program':<10} {'vm':>9} {'python':>9} {'compile':>9} {'speedup':>8}")
+    for name, template in PROGRAMS.items():
+        source = template.format(n=iterations, root=int(iterations ** 0.5))
+        ir = session.compile(source).ir
+
+        start = time.perf_counter()
+        vm_output = VM().run(lower(ir))
+        interpreted = time.perf_counter()
+        program = compile_ir(ir)
+        compiled = time.perf_counter()
+        output = program.run()
+        done = time.perf_counter()
+
+        if output != vm_output:
+            raise SystemExit(f"{name}: tiers disagree: {vm_output} != {output}")
+        vm_time = interpreted - start
+        python_time = done - compiled
+        print(f"{name:<10} {vm_time:8.2f}s {python_time:8.2f}s "
+              f"{(compiled - interpreted) * 1000:7.1f}ms {vm_time / python_time:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
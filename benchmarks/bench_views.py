@@ -0,0 +1,76 @@
+# benchmarks/bench_views.py
+"""Measure what the GUI's output tabs cost for large programs.
+
+For generated programs of each size, compiles once and times
+render_outputs() (the work done on the compile worker), formatting every
+row of each view (what filling a text widget with the whole output would
+need before drawing anything), formatting one window of rows at the top,
+middle and end (what a virtualized view does on a tab switch or scroll),
+and a find of text no row contains: in all, and the longest slice of it
+run between two Tk events. Tk is not needed;
+drawing the window itself adds a fixed cost that does not depend on the
+number of rows.
+
+Usage: python benchmarks/bench_views.py [statements ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import CompilerSession
+from worker import render_outputs
+from programs import generate
+
+# Rows in one window of a maximized view
+WINDOW = 60
+# Rows searched between two Tk events, as listview.FIND_SLICE
+FIND_SLICE = 10000
+VIEWS = ('tokens_view', 'symbol_view', 'intermediate_view', 'assembly_view')
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def find_row(rows, text, start, stop):
+    """listview.find_row, without importing tkinter"""
+    stop = min(stop, len(rows))
+    if hasattr(rows, 'find'):
+        return rows.find(text, start, stop)
+    for i in range(start, stop):
+        if text in rows[i]:
+            return i
+    return None
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [5000, 20000, 80000]
+    session = CompilerSession(quiet=True)
+
+    print(f"{'statements':>10} {'view':<18} {'rows':>9} {'all rows':>9} "
+          f"{'window':>9} {'find':>9} {'slice':>9}")
+    for size in sizes:
+        result = session.compile(generate(size, seed=size))
+        outputs = {}
+        elapsed = timed(lambda: outputs.update(render_outputs(result)))
+        print(f"{size:>10} {'render_outputs':<18} {'':>9} {elapsed * 1000:8.1f}ms")
+        for view in VIEWS:
+            rows = outputs[view]
+            total = len(rows)
+            every_row = timed(lambda: "\n".join([rows[i] for i in range(total)]))
+            windows = [max(0, min(start, total - WINDOW)) for start in (0, total // 2, total)]
+            window = max(timed(lambda: "\n".join([rows[i] for i in range(start, min(total, start + WINDOW))]))
+                         for start in windows)
+            slices = [timed(lambda: find_row(rows, "#", start, start + FIND_SLICE))
+                      for start in range(0, total, FIND_SLICE)]
+            print(f"{size:>10} {view:<18} {total:>9} {every_row * 1000:8.1f}ms "
+                  f"{window * 1000:8.3f}ms {sum(slices) * 1000:8.1f}ms "
+                  f"{max(slices, default=0) * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# benchmarks/bench_vm.py
+"""Time the bytecode VM on the GUI sample's while loop.
+
+Usage: python benchmarks/bench_vm.py [iterations] [opt_level]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import CompilerSession
+from vm import VM, lower
+
+LOOP = """int counter;
+counter = 0;
+while (counter < {iterations}) {{
+    int temp;
+    temp = counter * 2;
+    counter = counter + 1;
+}}
+print(counter);
+"""
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 7
+    opt_level = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    session = CompilerSession(quiet=True, opt_level=opt_level)
+    result = session.compile(LOOP.format(iterations=iterations))
+
+    start = time.perf_counter()
+    bytecode = lower(result.ir)
+    lowered = time.perf_counter()
+    output = VM().run(bytecode)
+    done = time.perf_counter()
+
+    print(f"{len(result.intermediate_code)} IR instructions -> {len(bytecode)} bytecode instructions")
+    print(f"lower  {(lowered - start) * 1000:8.2f} ms")
+    print(f"run    {done - lowered:8.2f} s  ({iterations / (done - lowered) / 1e6:.2f}M iterations/s)")
+    print(f"output {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# benchmarks/programs.py
+"""Seeded generator of synthetic programs for the benchmarks.
+
+generate() returns the same program for the same arguments on every
+run and platform. The programs are valid, warning-free and terminate:
+
+- identifiers global variables (about one in five float) are declared
+  first; blocks may declare locals, some shadowing a global;
+- int variables are only assigned int expressions, reduced '% 997' so
+  values stay small; '/' and '%' only ever divide by a non-zero constant;
+- every while loop runs a counter of its own from 0 to loop_iterations,
+  so nested loops of depth d run their body loop_iterations ** d times.
+"""
+import random
+
+# Bound on int values after every assignment
+MODULUS = 997
+
+
+class ProgramGenerator:
+    def __init__(self, seed=0, depth=2, expression_depth=3, identifiers=20, loop_iterations=10):
+        self.rng = random.Random(seed)
+        self.depth = depth
+        self.expression_depth = expression_depth
+        self.loop_iterations = loop_iterations
+        self.ints = [f"v{i}" for i in range(identifiers) if i % 5 != 4] or ['v0']
+        self.floats = [f"f{i}" for i in range(identifiers) if i % 5 == 4]
+        self.counters = 0
+        self.locals = 0
+        self.count = 0
+
+    def program(self, statements):
+        lines = [f"int {name} = {i % MODULUS};" for i, name in enumerate(self.ints)]
+        lines.extend(f"float {name} = {i}.5;" for i, name in enumerate(self.floats))
+        self.count = len(lines)
+        while self.count < statements:
+            lines.extend(self.statement(self.depth, ""))
+        return "\n".join(lines) + "\n"
+
+    def statement(self, depth, indent):
+        """Lines of one statement, nesting blocks at most depth deep"""
+        rng = self.rng
+        self.count += 1
+        kind = rng.random()
+        if depth > 0 and kind < 0.12:
+            return self.if_statement(depth, indent)
+        if depth > 0 and kind < 0.2:
+            return self.while_statement(depth, indent)
+        if kind < 0.3:
+            return [f"{indent}print({self.int_expression()});"]
+        if kind < 0.4 and self.floats:
+            return [f"{indent}{rng.choice(self.floats)} = {self.float_expression()};"]
+        return [f"{indent}{rng.choice(self.ints)} = ({self.int_expression()}) % {MODULUS};"]
+
+    def block(self, depth, indent):
+        inner = indent + "    "
+        lines = []
+        if self.rng.random() < 0.3:
+            # A local, sometimes shadowing a global
+            self.locals += 1
+            name = self.rng.choice(self.ints) if self.rng.random() < 0.3 else f"t{self.locals}"
+            lines.append(f"{inner}int {name} = ({self.int_expression()}) % {MODULUS};")
+            self.count += 1
+        for _ in range(self.rng.randint(1, 4)):
+            lines.extend(self.statement(depth - 1, inner))
+        return lines
+
+    def if_statement(self, depth, indent):
+        relop = self.rng.choice(('<', '<=', '>', '>=', '==', '!='))
+        lines = [f"{indent}if ({self.int_expression()} {relop} {self.int_expression()}) {{"]
+        lines.extend(self.block(depth, indent))
+        if self.rng.random() < 0.5:
+            lines.append(f"{indent}}} else {{")
+            lines.extend(self.block(depth, indent))
+        lines.append(f"{indent}}}")
+        return lines
+
+    def while_statement(self, depth, indent):
+        self.counters += 1
+        counter = f"w{self.counters}"
+        lines = [f"{indent}int {counter} = 0;",
+                 f"{indent}while ({counter} < {self.loop_iterations}) {{"]
+        lines.extend(self.block(depth, indent))
+        lines.append(f"{indent}    {counter} = {counter} + 1;")
+        lines.append(f"{indent}}}")
+        self.count += 2
+        return lines
+
+    def int_expression(self, depth=0):
+        rng = self.rng
+        if depth >= self.expression_depth or rng.random() < 0.3:
+            return rng.choice(self.ints) if rng.random() < 0.6 else str(rng.randint(0, 99))
+        op = rng.choice('+-*/%')
+        if op in '/%':
+            text = f"{self.int_expression(depth + 1)} {op} {rng.randint(1, 9)}"
+        else:
+            text = f"{self.int_expression(depth + 1)} {op} {self.int_expression(depth + 1)}"
+        return f"({text})" if rng.random() < 0.4 else text
+
+    def float_expression(self, depth=0):
+        rng = self.rng
+        if depth >= self.expression_depth or rng.random() < 0.3:
+            roll = rng.random()
+            if roll < 0.4:
+                return rng.choice(self.floats)
+            if roll < 0.7:
+                return rng.choice(self.ints)
+            return f"{rng.randint(0, 99)}.25"
+        op = rng.choice('+-*/')
+        if op == '/':
+            text = f"{self.float_expression(depth + 1)} / {rng.randint(1, 9)}.5"
+        else:
+            text = f"{self.float_expression(depth + 1)} {op} {self.float_expression(depth + 1)}"
+        return f"({text})" if rng.random() < 0.4 else text
+
+
+def generate(statements, seed=0, depth=2, expression_depth=3, identifiers=20, loop_iterations=10):
+    """A program of about the given number of statements.
+
+    depth is the deepest nesting of if/while blocks, expression_depth the
+    deepest nesting of binary operators, identifiers the number of global
+    variables and loop_iterations the trip count of every loop.
+    """
+    generator = ProgramGenerator(seed, depth, expression_depth, identifiers, loop_iterations)
+    return generator.program(statements)
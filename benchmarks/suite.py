@@ -0,0 +1,247 @@
+# benchmarks/suite.py
+"""Reproducible benchmark suite of the whole pipeline, with regression checks.
+
+Each case is a program from programs.generate() with fixed parameters and
+seed, so every run times the same sources (their SHA-256 is recorded to
+catch generator changes). For each case every stage is timed on its own,
+on the output of the stage before it:
+
+  lex            Lexer.tokenize with the PLY scanner
+  lex_fast       Lexer.tokenize with the regex scanner
+  parse          Parser.parse (PLY, lexing included)
+  parse_descent  DescentParser.parse (lexing included)
+  analyze        the semantic pass over the AST
+  lower          AST to IR
+  optimize_O1    Optimizer(1).optimize
+  optimize_O2    Optimizer(2).optimize
+  codegen        CodeGenerator.generate on the unoptimized IR
+  bytecode       vm.lower, IR to bytecode
+  vm             VM.run of that bytecode
+  translate      transpile.translate, IR to Python source
+  python         running the compiled Python translation
+
+Each stage is run --repeat times with the garbage collector off; the
+minimum and median are kept. --output writes the results as JSON;
+--baseline compares the minimums with an earlier such file and exits
+with status 1 if a stage got slower than its threshold allows.
+
+Usage: python benchmarks/suite.py [--quick] [--cases NAME ...] [--repeat N]
+           [--output FILE] [--baseline FILE] [--threshold [STAGE=]RATIO ...]
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transpile
+from codegen import CodeGenerator
+from lowering import lower
+from optimizer import Optimizer
+from semantic import analyze
+from session import CompilerSession, COMPILER_VERSION
+from vm import VM, lower as lower_bytecode
+from programs import generate
+
+# Bump when cases or stages change meaning, so old baselines are not compared
+SUITE_VERSION = 1
+
+CASES = {
+    'small': dict(statements=200),
+    'medium': dict(statements=5000),
+    'large': dict(statements=40000),
+    'nested': dict(statements=5000, depth=6, loop_iterations=3),
+    'expressions': dict(statements=2000, expression_depth=8),
+    'identifiers': dict(statements=5000, identifiers=2000),
+}
+QUICK_CASES = ['small', 'medium', 'nested', 'expressions', 'identifiers']
+
+DEFAULT_THRESHOLD = 0.15
+# Slowdowns smaller than this many seconds are noise, whatever the ratio
+NOISE = 0.001
+
+
+def time_stage(function, repeat):
+    """Minimum and median seconds of repeat calls of function"""
+    times = []
+    enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    return {'min': min(times), 'median': statistics.median(times)}
+
+
+class Suite:
+    """Sessions for every backend, built once for all cases"""
+
+    def __init__(self):
+        self.ply = CompilerSession(quiet=True)
+        self.fast = CompilerSession(quiet=True, lexer_backend='fast')
+        self.descent = CompilerSession(quiet=True, parser_backend='descent')
+
+    def run_case(self, name, params, repeat):
+        source = generate(**params)
+        parser = self.ply.parser
+        parser.parse(source)
+        if parser.errors:
+            raise SystemExit(f"{name}: generated program does not compile: {parser.errors[0]}")
+        ir = parser.ir.copy()
+        ast = parser.ast
+        self.descent.parser.parse(source)
+        if self.descent.parser.intermediate_code != ir.to_dicts():
+            raise SystemExit(f"{name}: the parser backends disagree")
+        optimized = Optimizer(2).optimize(ir)
+        bytecode = lower_bytecode(ir)
+        compiled = transpile.compile_ir(ir)
+        output = VM().run(bytecode)
+        if compiled.run() != output:
+            raise SystemExit(f"{name}: the VM and the Python tier disagree")
+
+        stages = {
+            'lex': lambda: self.ply.tokenize(source),
+            'lex_fast': lambda: self.fast.tokenize(source),
+            'parse': lambda: self.ply.parser.parse(source),
+            'parse_descent': lambda: self.descent.parser.parse(source),
+            'analyze': lambda: analyze(ast),
+            'lower': lambda: lower(ast),
+            'optimize_O1': lambda: Optimizer(1).optimize(ir),
+            'optimize_O2': lambda: Optimizer(2).optimize(ir),
+            'codegen': lambda: list(CodeGenerator().generate(ir)),
+            'bytecode': lambda: lower_bytecode(ir),
+            'vm': lambda: VM().run(bytecode),
+            'translate': lambda: transpile.translate(ir),
+            'python': compiled.run,
+        }
+        return {
+            'params': params,
+            'source_sha256': hashlib.sha256(source.encode('utf-8')).hexdigest(),
+            'sizes': {
+                'bytes': len(source),
+                'lines': source.count("\n"),
+                'tokens': len(self.ply.tokenize(source)[0]),
+                'ir_instructions': len(ir),
+                'optimized_instructions': len(optimized),
+                'output_lines': len(output),
+            },
+            'stages': {stage: time_stage(function, repeat) for stage, function in stages.items()},
+        }
+
+
+def run(cases, repeat):
+    suite = Suite()
+    results = {}
+    for name in cases:
+        results[name] = suite.run_case(name, CASES[name], repeat)
+        print(f"{name}: done", file=sys.stderr)
+    return {
+        'suite_version': SUITE_VERSION,
+        'compiler_version': COMPILER_VERSION,
+        'python': f"{platform.python_implementation()} {platform.python_version()}",
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'cases': results,
+    }
+
+
+def format_results(results):
+    lines = [f"{'case':<12} {'stage':<14} {'min ms':>10} {'median ms':>10}"]
+    for name, case in results['cases'].items():
+        for stage, times in case['stages'].items():
+            lines.append(f"{name:<12} {stage:<14} {times['min'] * 1000:10.2f} "
+                         f"{times['median'] * 1000:10.2f}")
+    return lines
+
+
+def parse_thresholds(values):
+    """{stage: ratio} from 'RATIO' and 'STAGE=RATIO' options; None is the default"""
+    thresholds = {None: DEFAULT_THRESHOLD}
+    for value in values or []:
+        stage, _, ratio = value.rpartition('=')
+        thresholds[stage or None] = float(ratio)
+    return thresholds
+
+
+def compare(results, baseline, thresholds):
+    """(report lines, number of regressions) of results against baseline"""
+    lines = []
+    if baseline.get('suite_version') != results['suite_version']:
+        return [f"baseline is from suite version {baseline.get('suite_version')}, "
+                f"not {results['suite_version']}; not compared"], 0
+    for key in ('python', 'platform'):
+        if baseline.get(key) != results[key]:
+            lines.append(f"warning: baseline {key} {baseline.get(key)!r} differs from {results[key]!r}")
+    regressions = 0
+    lines.append(f"{'case':<12} {'stage':<14} {'base ms':>10} {'now ms':>10} {'change':>8}")
+    for name, case in results['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            lines.append(f"{name:<12} (not in baseline)")
+            continue
+        if base['source_sha256'] != case['source_sha256']:
+            lines.append(f"{name:<12} (generated source differs from the baseline's; not compared)")
+            continue
+        for stage, times in case['stages'].items():
+            if stage not in base['stages']:
+                continue
+            before = base['stages'][stage]['min']
+            now = times['min']
+            change = now / before - 1 if before else 0.0
+            threshold = thresholds.get(stage, thresholds[None])
+            status = ""
+            if change > threshold and now - before > NOISE:
+                status = "REGRESSION"
+                regressions += 1
+            elif change < -threshold and before - now > NOISE:
+                status = "faster"
+            lines.append(f"{name:<12} {stage:<14} {before * 1000:10.2f} {now * 1000:10.2f} "
+                         f"{change:+8.1%} {status}".rstrip())
+    lines.append(f"{regressions} regression(s)")
+    return lines, regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark every compiler stage on generated programs")
+    arg_parser.add_argument("--cases", nargs="+", choices=list(CASES), help="cases to run (default: all)")
+    arg_parser.add_argument("--quick", action="store_true", help="skip the large case and repeat 3 times")
+    arg_parser.add_argument("--repeat", type=int, default=None, help="runs per stage (default 7, 3 with --quick)")
+    arg_parser.add_argument("--output", metavar="FILE", help="write the results as JSON")
+    arg_parser.add_argument("--baseline", metavar="FILE", help="compare with the JSON results of an earlier run")
+    arg_parser.add_argument("--threshold", nargs="+", metavar="[STAGE=]RATIO",
+                            help=f"allowed slowdown, overall or per stage (default {DEFAULT_THRESHOLD})")
+    args = arg_parser.parse_args()
+
+    cases = args.cases or (QUICK_CASES if args.quick else list(CASES))
+    repeat = args.repeat or (3 if args.quick else 7)
+    thresholds = parse_thresholds(args.threshold)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = run(cases, repeat)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    if baseline is None:
+        print("\n".join(format_results(results)))
+        return 0
+    lines, regressions = compare(results, baseline, thresholds)
+    print("\n".join(lines))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
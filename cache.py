@@ -0,0 +1,200 @@
+# cache.py
+"""Content-addressed cache of compile results.
+
+Entries are keyed on a hash of the normalized source plus the compiler and
+grammar versions, so a whitespace-only edit or a resubmission of the same
+program is served without running the parser or code generator again.
+"""
+import hashlib
+import os
+import re
+from collections import OrderedDict
+
+import artifact
+
+_SPACE_RUN = re.compile(r'[ \t]+')
+
+# The disk tier re-reads its directory, which other processes may also be
+# writing, after this many writes or once its own count is over budget
+DISK_RESCAN_INTERVAL = 64
+# and then evicts down to this fraction of the budget, so a full cache
+# does not rescan on every write
+DISK_LOW_WATER = 0.9
+
+
+def normalize_source(source_code):
+    """Collapse whitespace that cannot change the compiler's output.
+
+    Runs of spaces/tabs become a single space and leading/trailing
+    spaces/tabs and blank lines at the end are dropped. Other whitespace
+    (\r, \f, ...) is an illegal character to the lexer, so it is kept.
+    Newlines are kept, so the line numbers in diagnostics stay valid for
+    the original source.
+    """
+    lines = [_SPACE_RUN.sub(' ', line).strip(' \t') for line in source_code.split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    return '\n'.join(lines)
+
+
+def cache_key(source_code, version):
+    digest = hashlib.sha256()
+    digest.update(str(version).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_source(source_code).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """Two-tier (memory LRU + optional disk) cache of compile results.
+
+    Values are dicts shaped like CompileResult.cache_entry(): the IR,
+    symbol table, diagnostics and assembly of a compile. The disk tier
+    stores them as binary artifacts (see artifact.py).
+    """
+
+    def __init__(self, max_entries=256, disk_dir=None, disk_max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.memory = OrderedDict()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        # key -> size in bytes, ordered from least to most recently used
+        self.disk_index = OrderedDict()
+        self.disk_bytes = 0
+        self.disk_writes = 0
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return value
+
+        if self.disk_dir is not None:
+            value = self._disk_get(key)
+            if value is not None:
+                self.disk_hits += 1
+                self._memory_put(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._memory_put(key, value)
+        if self.disk_dir is not None:
+            self._disk_put(key, value)
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'memory_entries': len(self.memory),
+            'evictions': self.evictions,
+            'disk_entries': len(self.disk_index),
+            'disk_bytes': self.disk_bytes,
+            'disk_evictions': self.disk_evictions,
+        }
+
+    # Memory tier
+
+    def _memory_put(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.evictions += 1
+
+    # Disk tier
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + artifact.SUFFIX)
+
+    def _load_disk_index(self):
+        self.disk_index.clear()
+        self.disk_bytes = 0
+        entries = []
+        for filename in os.listdir(self.disk_dir):
+            if not filename.endswith(artifact.SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.disk_dir, filename))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, filename[:-len(artifact.SUFFIX)], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self.disk_index[key] = size
+            self.disk_bytes += size
+
+    def _disk_get(self, key):
+        path = self._path(key)
+        try:
+            with artifact.load(path) as stored:
+                value = stored.cache_entry()
+            os.utime(path)
+        except OSError:
+            return None
+        except Exception:
+            # Truncated or corrupt entry: drop it and count a miss
+            self._disk_remove(key)
+            return None
+
+        if key in self.disk_index:
+            self.disk_index.move_to_end(key)
+        return value
+
+    def _disk_put(self, key, value):
+        data = artifact.dumps(value)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        self.disk_bytes -= self.disk_index.pop(key, 0)
+        self.disk_index[key] = len(data)
+        self.disk_bytes += len(data)
+        self.disk_writes += 1
+        if self.disk_bytes > self.disk_max_bytes or self.disk_writes >= DISK_RESCAN_INTERVAL:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        # Other processes (batch or server workers) may share disk_dir, so
+        # the budget is checked against what is actually on disk
+        self._load_disk_index()
+        self.disk_writes = 0
+        if self.disk_bytes <= self.disk_max_bytes:
+            return
+        low_water = self.disk_max_bytes * DISK_LOW_WATER
+        while self.disk_bytes > low_water and len(self.disk_index) > 1:
+            key = next(iter(self.disk_index))
+            self._disk_remove(key)
+            self.disk_evictions += 1
+
+    def _disk_remove(self, key):
+        self.disk_bytes -= self.disk_index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
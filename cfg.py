@@ -0,0 +1,393 @@
+# cfg.py
+"""Basic blocks, control-flow graph and dataflow analysis over the IR.
+
+ControlFlowGraph partitions an IntermediateCode into basic blocks and links
+them by the goto / if_false / fall-through edges. solve() is a generic
+worklist solver for gen/kill problems whose sets are bit vectors held in
+Python ints, so union, intersection and difference are single operations
+on machine words. Liveness and ReachingDefinitions are built on it.
+"""
+import heapq
+
+from ir import (OP_ASSIGN, OP_LABEL, OP_GOTO, OP_IF_FALSE, OP_PRINT, OPCODE, OPCODES,
+                KIND_BITS, KIND_MASK, NONE, TEMP, VAR)
+
+FORWARD = 'forward'
+BACKWARD = 'backward'
+UNION = 'union'
+INTERSECTION = 'intersection'
+
+BINARY = frozenset(OPCODE[op] for op in ('+', '-', '*', '/', '%',
+                                         '<', '<=', '>', '>=', '==', '!='))
+
+# Per opcode: how many of arg1/arg2 it reads, and whether it writes result
+READS = tuple(2 if code in BINARY else 1 if code in (OP_ASSIGN, OP_PRINT, OP_IF_FALSE) else 0
+              for code in range(len(OPCODES)))
+WRITES = tuple(code == OP_ASSIGN or code in BINARY for code in range(len(OPCODES)))
+# Per operand kind: whether it names storage (a temp or variable)
+STORAGE = tuple(kind in (TEMP, VAR) for kind in range(KIND_MASK + 1))
+
+
+def instruction_uses(op, arg1, arg2):
+    """Operands read by an instruction (temps and variables only)"""
+    reads = READS[op]
+    if reads == 2:
+        uses = (arg1, arg2)
+    elif reads:
+        uses = (arg1,)
+    else:
+        return ()
+    return tuple(operand for operand in uses if STORAGE[operand & KIND_MASK])
+
+
+def instruction_defines(op, result):
+    """The operand written by an instruction, or NONE"""
+    return result if WRITES[op] else NONE
+
+
+class BasicBlock:
+    """Instructions [start, end) of the IR, entered only at start"""
+
+    __slots__ = ('index', 'start', 'end', 'successors', 'predecessors')
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.successors = []
+        self.predecessors = []
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"BasicBlock({self.index}, [{self.start}, {self.end}), succ={self.successors})"
+
+
+class ControlFlowGraph:
+    """Basic blocks of an IntermediateCode and the edges between them.
+
+    Block 0 is the entry. A jump to a label the program never defines has
+    no edge, like falling off the end of the program.
+    """
+
+    def __init__(self, ir):
+        self.ir = ir
+        self.blocks = []
+        # label operand -> index of the block it starts
+        self.label_block = {}
+        self._build()
+
+    def _build(self):
+        ops = self.ir.ops
+        count = len(ops)
+
+        starts = [0] if count else []
+        for i, op in enumerate(ops):
+            if op == OP_LABEL:
+                if i and starts[-1] != i:
+                    starts.append(i)
+            elif (op == OP_GOTO or op == OP_IF_FALSE) and i + 1 < count:
+                starts.append(i + 1)
+
+        blocks = self.blocks
+        for n, start in enumerate(starts):
+            end = starts[n + 1] if n + 1 < len(starts) else count
+            blocks.append(BasicBlock(n, start, end))
+
+        arg1 = self.ir.arg1
+        label_block = self.label_block
+        for block in blocks:
+            i = block.start
+            while i < block.end and ops[i] == OP_LABEL:
+                label_block.setdefault(arg1[i], block.index)
+                i += 1
+
+        arg2 = self.ir.arg2
+        last = len(blocks) - 1
+        for block in blocks:
+            op = ops[block.end - 1]
+            if op == OP_GOTO:
+                targets = (label_block.get(arg1[block.end - 1]),)
+            elif op == OP_IF_FALSE:
+                targets = (block.index + 1 if block.index < last else None,
+                           label_block.get(arg2[block.end - 1]))
+            else:
+                targets = (block.index + 1 if block.index < last else None,)
+            for target in targets:
+                if target is not None and target not in block.successors:
+                    block.successors.append(target)
+                    blocks[target].predecessors.append(block.index)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def postorder(self):
+        """Block indices in postorder from the entry, then unreachable blocks.
+
+        Jump targets are explored before the fall-through, so in reverse
+        postorder a loop body comes right after its header rather than
+        after the rest of the program.
+        """
+        blocks = self.blocks
+        if not blocks:
+            return []
+        order = []
+        visited = bytearray(len(blocks))
+        visited[0] = 1
+        stack = [(0, reversed(blocks[0].successors))]
+        while stack:
+            index, successors = stack[-1]
+            for successor in successors:
+                if not visited[successor]:
+                    visited[successor] = 1
+                    stack.append((successor, reversed(blocks[successor].successors)))
+                    break
+            else:
+                stack.pop()
+                order.append(index)
+        order.extend(i for i in range(len(blocks)) if not visited[i])
+        return order
+
+    def reverse_postorder(self):
+        order = self.postorder()
+        order.reverse()
+        return order
+
+    def reachable(self):
+        """Indices of the blocks reachable from the entry"""
+        seen = set()
+        work = [0] if self.blocks else []
+        while work:
+            index = work.pop()
+            if index not in seen:
+                seen.add(index)
+                work.extend(self.blocks[index].successors)
+        return seen
+
+
+def solve(cfg, gen, kill, direction=FORWARD, meet=UNION, boundary=0, universe=0):
+    """Solve a gen/kill dataflow problem with a worklist.
+
+    gen and kill are per-block bit vectors (ints). The transfer function is
+    out = gen | (in & ~kill) in the direction of the analysis. boundary is
+    the value flowing into the entry (forward) or out of the exits
+    (backward). For an INTERSECTION meet, universe must hold every bit.
+    Returns (ins, outs), each a list of ints indexed by block, where for a
+    backward problem "in" is the value at the top of the block.
+    """
+    blocks = cfg.blocks
+    count = len(blocks)
+    keep = [~mask for mask in kill]
+    empty = universe if meet == INTERSECTION else 0
+    ins = [empty] * count
+    outs = [empty] * count
+
+    if direction == FORWARD:
+        order = cfg.reverse_postorder()
+        sources = [block.predecessors for block in blocks]
+        sinks = [block.successors for block in blocks]
+        before, after = ins, outs
+    else:
+        order = cfg.postorder()
+        sources = [block.successors for block in blocks]
+        sinks = [block.predecessors for block in blocks]
+        before, after = outs, ins
+
+    # Blocks whose incoming value includes the boundary: the entry going
+    # forward, or blocks that leave the program going backward
+    on_boundary = [not incoming for incoming in sources]
+    if direction == FORWARD and count:
+        on_boundary[0] = True
+
+    # The worklist always yields the pending block earliest in the order, so
+    # changes coming round a loop are merged before they flow further on
+    rank = [0] * count
+    for position, index in enumerate(order):
+        rank[index] = position
+    work = list(range(count))
+    queued = bytearray([1]) * count
+    while work:
+        index = order[heapq.heappop(work)]
+        queued[index] = 0
+
+        value = boundary if on_boundary[index] else empty
+        if meet == UNION:
+            for source in sources[index]:
+                value |= after[source]
+        else:
+            for source in sources[index]:
+                value &= after[source]
+        before[index] = value
+
+        value = gen[index] | (before[index] & keep[index])
+        if value != after[index]:
+            after[index] = value
+            for sink in sinks[index]:
+                if not queued[sink]:
+                    queued[sink] = 1
+                    heapq.heappush(work, rank[sink])
+    return ins, outs
+
+
+def bits(mask):
+    """Yield the indices of the set bits of mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class Liveness:
+    """Live temps and variables at block boundaries.
+
+    operands lists every temp/variable operand; bit i of a set stands for
+    operands[i]. Variables are global storage, so with all_variables_live
+    (the default) every variable is live at the program's exit.
+    """
+
+    def __init__(self, cfg, all_variables_live=True):
+        self.cfg = cfg
+        ir = cfg.ir
+        ops, arg1, arg2, result = ir.ops, ir.arg1, ir.arg2, ir.result
+
+        # Variables take the low bits so the sets that cross blocks, which
+        # are mostly variables, stay short ints; temps follow
+        operands = [VAR | (n << KIND_BITS) for n in range(len(ir.names))]
+        for column in (result, arg1, arg2):
+            operands.extend(operand for operand in column
+                            if operand & KIND_MASK == TEMP)
+        self.operands = operands = list(dict.fromkeys(operands))
+        self.index = index = {operand: n for n, operand in enumerate(operands)}
+
+        gen = []
+        kill = []
+        exposed = 0
+        for block in cfg.blocks:
+            used = defined = 0
+            for i in range(block.start, block.end):
+                op = ops[i]
+                reads = READS[op]
+                if reads:
+                    operand = arg1[i]
+                    if STORAGE[operand & KIND_MASK]:
+                        bit = 1 << index[operand]
+                        if not defined & bit:
+                            used |= bit
+                    if reads == 2:
+                        operand = arg2[i]
+                        if STORAGE[operand & KIND_MASK]:
+                            bit = 1 << index[operand]
+                            if not defined & bit:
+                                used |= bit
+                if WRITES[op]:
+                    defined |= 1 << index[result[i]]
+            gen.append(used)
+            kill.append(defined)
+            exposed |= used
+
+        # Variables hold the low bits, so they are all live at the exit
+        exit_live = (1 << len(ir.names)) - 1 if all_variables_live else 0
+        self.exit_live = exit_live
+
+        # An operand never read before being written in any block is never
+        # live at a block boundary, so its kill bits can be dropped
+        exposed |= exit_live
+        kill = [mask & exposed for mask in kill]
+
+        self.live_in, self.live_out = solve(cfg, gen, kill, BACKWARD, UNION, boundary=exit_live)
+
+    def bit(self, operand):
+        return 1 << self.index[operand]
+
+    def live_after(self, block):
+        """Live set after each instruction of a block, as a list of ints
+        indexed like range(block.start, block.end)"""
+        ir = self.cfg.ir
+        ops, arg1, arg2, result = ir.ops, ir.arg1, ir.arg2, ir.result
+        index = self.index
+        live = self.live_out[block.index]
+        after = [0] * len(block)
+        for i in range(block.end - 1, block.start - 1, -1):
+            after[i - block.start] = live
+            target = instruction_defines(ops[i], result[i])
+            if target != NONE:
+                live &= ~(1 << index[target])
+            for operand in instruction_uses(ops[i], arg1[i], arg2[i]):
+                live |= 1 << index[operand]
+        return after
+
+    def names(self, mask):
+        """Text of the operands in a set"""
+        value = self.cfg.ir.value
+        return [value(self.operands[i]) for i in bits(mask)]
+
+
+class ReachingDefinitions:
+    """Which definitions may reach each block.
+
+    definitions lists the indices of the instructions that write a tracked
+    operand; bit i of a set stands for definitions[i]. Only operands that
+    some block reads before writing are tracked: every use of any other
+    operand is reached by the nearest definition above it in its own
+    block. That leaves out almost every temp, whose definitions would
+    otherwise reach, unkilled, to the end of the program.
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        ir = cfg.ir
+        ops, arg1, arg2, result = ir.ops, ir.arg1, ir.arg2, ir.result
+
+        tracked = set()
+        for block in cfg.blocks:
+            defined = set()
+            for i in range(block.start, block.end):
+                op = ops[i]
+                reads = READS[op]
+                if reads:
+                    if arg1[i] not in defined:
+                        tracked.add(arg1[i])
+                    if reads == 2 and arg2[i] not in defined:
+                        tracked.add(arg2[i])
+                if WRITES[op]:
+                    defined.add(result[i])
+        self.tracked = tracked
+
+        self.definitions = definitions = []
+        # operand -> bit vector of all its definitions
+        self.by_operand = by_operand = {}
+        block_defs = []
+        for block in cfg.blocks:
+            defs = []
+            for i in range(block.start, block.end):
+                if WRITES[ops[i]]:
+                    target = result[i]
+                    if target in tracked:
+                        bit = 1 << len(definitions)
+                        definitions.append(i)
+                        by_operand[target] = by_operand.get(target, 0) | bit
+                        defs.append((target, bit))
+            block_defs.append(defs)
+
+        gen = []
+        kill = []
+        for defs in block_defs:
+            # The last definition of each operand in the block reaches its end
+            last = dict(defs)
+            generated = killed = 0
+            for target, bit in last.items():
+                generated |= bit
+                killed |= by_operand[target]
+            gen.append(generated)
+            kill.append(killed)
+
+        self.reach_in, self.reach_out = solve(cfg, gen, kill, FORWARD, UNION)
+
+    def definitions_of(self, operand, mask):
+        """Instruction indices of the definitions of a tracked operand in a set"""
+        mask &= self.by_operand.get(operand, 0)
+        return [self.definitions[i] for i in bits(mask)]
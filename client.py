@@ -0,0 +1,129 @@
+# client.py
+"""Client for the compile server (see server.py).
+
+CompileClient talks JSON-RPC to a server listening on a Unix socket, or
+starts a server of its own and talks to it over stdio. Each call waits for
+its reply. Only the standard library is imported, so the client starts in
+a few milliseconds however long the server took to build its tables.
+
+Usage:
+    python client.py [--socket PATH] compile|tokenize|diagnostics FILE [-O LEVEL] [--registers N]
+    python client.py [--socket PATH] stats|shutdown
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+
+
+class ServerError(Exception):
+    """An error response from the server"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class CompileClient:
+    """Synchronous JSON-RPC client; with no socket_path, runs
+    server.py server_args as a child process and talks over its stdio"""
+
+    def __init__(self, socket_path=None, server_args=()):
+        self.process = None
+        if socket_path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(socket_path)
+            self.reader = self.socket.makefile('rb')
+            self.writer = self.socket.makefile('wb')
+        else:
+            self.socket = None
+            self.process = subprocess.Popen([sys.executable, SERVER, *server_args],
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.reader = self.process.stdout
+            self.writer = self.process.stdin
+        self.next_id = 1
+
+    def call(self, method, **params):
+        """Send one request and return its result; raises ServerError for
+        an error response"""
+        request_id = self.next_id
+        self.next_id += 1
+        request = {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}
+        self.writer.write(json.dumps(request).encode('utf-8') + b"\n")
+        self.writer.flush()
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("compile server closed the connection")
+        response = json.loads(line)
+        if 'error' in response:
+            raise ServerError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    def compile(self, source, **options):
+        return self.call('compile', source=source, **options)
+
+    def tokenize(self, source):
+        return self.call('tokenize', source=source)
+
+    def diagnostics(self, source, **options):
+        return self.call('diagnostics', source=source, **options)
+
+    def stats(self):
+        return self.call('stats')
+
+    def shutdown(self):
+        return self.call('shutdown')
+
+    def close(self):
+        self.writer.close()
+        self.reader.close()
+        if self.socket is not None:
+            self.socket.close()
+        if self.process is not None:
+            # End of input stops a stdio server
+            self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Send a request to the compile server")
+    arg_parser.add_argument('method', choices=('compile', 'tokenize', 'diagnostics', 'stats', 'shutdown'))
+    arg_parser.add_argument('file', nargs='?', help="source file for compile, tokenize and diagnostics")
+    arg_parser.add_argument('--socket', help="server's Unix socket (default: start a server for this request)")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, default=None, help="optimization level")
+    arg_parser.add_argument('--registers', type=int, default=None, help="registers for the code generator")
+    args = arg_parser.parse_args(argv)
+
+    params = {}
+    if args.method in ('compile', 'tokenize', 'diagnostics'):
+        if args.file is None:
+            arg_parser.error(f"{args.method} needs a source file")
+        with open(args.file, encoding='utf-8') as f:
+            params['source'] = f.read()
+        if args.method != 'tokenize':
+            for option in ('opt_level', 'registers'):
+                if getattr(args, option) is not None:
+                    params[option] = getattr(args, option)
+
+    server_args = () if args.socket else ('--jobs', '1')
+    try:
+        with CompileClient(args.socket, server_args) as client:
+            result = client.call(args.method, **params)
+    except ServerError as e:
+        print(f"error {e.code}: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(result, indent=1))
+    return 0 if not isinstance(result, dict) or result.get('ok', True) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
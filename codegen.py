@@ -1,89 +1,470 @@
 # codegen.py
+"""Code generation from the IR to the toy assembly.
+
+Temps and variables are kept in registers assigned by linear scan over
+their live intervals (see cfg.Liveness), so a register is reused as soon as
+the value in it is dead. When more values are live than there are
+registers, the one whose interval ends last is spilled: it lives in a slot
+of the stack area in .data and is reloaded into a scratch register around
+each instruction that touches it. Copies are coalesced where the live
+ranges allow: such a MOV is not emitted at all.
+
+generate() returns the lines; write() sends them to a stream through an
+AssemblyWriter instead, and AssemblyEmitter generates a program arriving
+one chunk of IR at a time, so neither keeps the assembly in memory.
+"""
+import io
+from bisect import insort
+
+from cfg import ControlFlowGraph, Liveness, READS, WRITES, STORAGE, bits
+from ir import (IntermediateCode, OPCODES, OP_ASSIGN, OP_LABEL, OP_GOTO, OP_IF_FALSE,
+                OP_PRINT, KIND_MASK, KIND_BITS, TEMP, VAR)
+
+ARITHMETIC = {'+': 'ADD', '-': 'SUB', '*': 'MUL', '/': 'DIV', '%': 'MOD'}
+COMPARISONS = ('<', '<=', '>', '>=', '==', '!=')
+_ARITHMETIC_OPS = {OPCODES.index(op): name for op, name in ARITHMETIC.items()}
+_COMPARISON_OPS = {OPCODES.index(op): op for op in COMPARISONS}
+
+DEFAULT_REGISTERS = 4
+# Registers held back for reloading spilled values once anything spills
+SCRATCH_REGISTERS = 2
+SLOT_SIZE = 4
+# Characters an AssemblyWriter collects before writing them out
+BUFFER_SIZE = 1 << 16
+
+
+def _as_ir(intermediate_code):
+    if isinstance(intermediate_code, IntermediateCode):
+        return intermediate_code
+    return IntermediateCode.from_dicts(intermediate_code)
+
+
+def live_intervals(cfg, liveness):
+    """(start, end) of every temp and variable, in instruction points.
+
+    Instruction i reads its operands at point 2*i and writes its result at
+    2*i + 1, so a value last read by an instruction can share a register
+    with that instruction's result.
+    """
+    ir = cfg.ir
+    operands = liveness.operands
+    ops, arg1, arg2, result = ir.ops, ir.arg1, ir.arg2, ir.result
+
+    # Points are visited in increasing order, so the first one seen is the
+    # start and the last one seen is the end
+    start = {}
+    end = {}
+    for block in cfg.blocks:
+        first = 2 * block.start
+        for n in bits(liveness.live_in[block.index]):
+            operand = operands[n]
+            start.setdefault(operand, first)
+            end[operand] = first
+        for i in range(block.start, block.end):
+            op = ops[i]
+            reads = READS[op]
+            if reads:
+                for operand in ((arg1[i], arg2[i]) if reads == 2 else (arg1[i],)):
+                    if STORAGE[operand & KIND_MASK]:
+                        start.setdefault(operand, 2 * i)
+                        end[operand] = 2 * i
+            if WRITES[op]:
+                operand = result[i]
+                start.setdefault(operand, 2 * i + 1)
+                end[operand] = 2 * i + 1
+        last = 2 * block.end - 1
+        for n in bits(liveness.live_out[block.index]):
+            operand = operands[n]
+            start.setdefault(operand, last)
+            end[operand] = last
+    return {operand: (start[operand], end[operand]) for operand in start}
+
+
+def copy_aliases(cfg, liveness, intervals):
+    """Temps that can share their variable's location in 't = ...; x = t'.
+
+    The temp must be born and die inside one block, with x neither live
+    nor written while the temp is, so the value can be computed straight
+    into x. Returns {temp: variable}.
+    """
+    ir = cfg.ir
+    ops, arg1, result = ir.ops, ir.arg1, ir.result
+    index = liveness.index
+    aliases = {}
+    for block in cfg.blocks:
+        live_after = liveness.live_after(block)
+        written = {}
+        for i in range(block.start, block.end):
+            op = ops[i]
+            if op == OP_ASSIGN and arg1[i] & KIND_MASK == TEMP and result[i] & KIND_MASK == VAR:
+                temp, variable = arg1[i], result[i]
+                born = written.get(temp)
+                if (born is not None and intervals[temp] == (2 * born + 1, 2 * i)
+                        and intervals[variable][0] < 2 * born + 1
+                        and written.get(variable, -1) < born
+                        and not live_after[born - block.start] >> index[variable] & 1):
+                    aliases[temp] = variable
+            if WRITES[op]:
+                written[result[i]] = i
+    return aliases
+
 
 class CodeGenerator:
-    def __init__(self):
+    def __init__(self, registers=DEFAULT_REGISTERS):
+        if registers <= SCRATCH_REGISTERS:
+            raise ValueError(f"Need more than {SCRATCH_REGISTERS} registers, got {registers}")
+        self.assembly_code = []
+        self.registers = [f"R{n}" for n in range(1, registers + 1)]
+        self.scratch = []
+        # operand -> register, or -> stack slot for spilled operands
+        self.reg_map = {}
+        self.spill_slots = {}
+        # operand -> memory operand of everything not in a register
+        self.memory = {}
+        # Distinct values allocated, not counting aliased temps
+        self.values = 0
+        self.stats = None
+
+    def reset(self):
+        """Forget register assignments from a previous program"""
         self.assembly_code = []
-        self.registers = ['R1', 'R2', 'R3', 'R4']
+        self.scratch = []
         self.reg_map = {}
-        self.next_reg = 0
+        self.spill_slots = {}
+        self.memory = {}
+        self.values = 0
+        self.stats = None
+
+    def allocate(self, ir):
+        """Assign a register or a stack slot to every temp and variable"""
+        cfg = ControlFlowGraph(ir)
+        # Variables are treated like locals of _start: their interval ends
+        # at their last use, not at the exit
+        liveness = Liveness(cfg, all_variables_live=False)
+        intervals = live_intervals(cfg, liveness)
+        aliases = copy_aliases(cfg, liveness, intervals)
+        for temp in aliases:
+            del intervals[temp]
+
+        # Copies 'x = y' where y dies and x is born: try to give x y's register
+        hints = {}
+        for i, (op, source, target) in enumerate(zip(ir.ops, ir.arg1, ir.result)):
+            if (op == OP_ASSIGN and source in intervals and target in intervals
+                    and intervals[source][1] == 2 * i and intervals[target][0] == 2 * i + 1):
+                hints[target] = source
+
+        self.reg_map, self.spill_slots = self._linear_scan(intervals, hints, self.registers)
+        if self.spill_slots:
+            # Spilled values need registers to be reloaded into, so redo the
+            # assignment without them
+            allocatable = self.registers[:-SCRATCH_REGISTERS]
+            self.scratch = self.registers[-SCRATCH_REGISTERS:]
+            self.reg_map, self.spill_slots = self._linear_scan(intervals, hints, allocatable)
+
+        # Aliases share their variable's location, but are not values or
+        # stack slots of their own
+        self.values = len(self.reg_map) + len(self.spill_slots)
+        self.memory = {operand: f"[stack+{slot * SLOT_SIZE}]"
+                       for operand, slot in self.spill_slots.items()}
+        for temp, variable in aliases.items():
+            if variable in self.reg_map:
+                self.reg_map[temp] = self.reg_map[variable]
+            else:
+                self.memory[temp] = self.memory[variable]
+
+    def allocate_chunk(self, ir, variables):
+        """Allocate one chunk of a program generated chunk by chunk (see
+        AssemblyEmitter): its temps get registers, its variables the
+        memory slot given by variables (name -> slot, extended for new
+        names). The chunk must not read temps it does not write."""
+        cfg = ControlFlowGraph(ir)
+        liveness = Liveness(cfg, all_variables_live=False)
+        intervals = live_intervals(cfg, liveness)
+        temps = {}
+        memory = {}
+        for operand, interval in intervals.items():
+            if operand & KIND_MASK == TEMP:
+                if interval[0] == 0:
+                    raise ValueError(f"Chunk reads temp {ir.value(operand)} before writing it")
+                temps[operand] = interval
+            else:
+                slot = variables.setdefault(ir.names[operand >> KIND_BITS], len(variables))
+                memory[operand] = f"[vars+{slot * SLOT_SIZE}]"
 
-    def get_register(self, var):
-        if var in self.reg_map:
-            return self.reg_map[var]
+        self.scratch = self.registers[-SCRATCH_REGISTERS:]
+        self.reg_map, self.spill_slots = self._linear_scan(
+            temps, {}, self.registers[:-SCRATCH_REGISTERS])
+        for operand, slot in self.spill_slots.items():
+            memory[operand] = f"[stack+{slot * SLOT_SIZE}]"
+        self.memory = memory
+        self.values = len(self.reg_map) + len(self.spill_slots)
 
-        reg = self.registers[self.next_reg % len(self.registers)]
-        self.next_reg += 1
-        self.reg_map[var] = reg
-        return reg
+    @staticmethod
+    def _linear_scan(intervals, hints, registers):
+        order = sorted(intervals, key=lambda operand: intervals[operand][0])
+        free = list(reversed(registers))
+        # (end, operand) of the intervals holding a register, by end
+        active = []
+        reg_map = {}
+        spilled = []
+
+        for operand in order:
+            start, end = intervals[operand]
+            while active and active[0][0] < start:
+                free.append(reg_map[active.pop(0)[1]])
+
+            hint = reg_map.get(hints.get(operand))
+            if hint is not None and hint in free:
+                free.remove(hint)
+                reg_map[operand] = hint
+            elif free:
+                reg_map[operand] = free.pop()
+            elif active[-1][0] > end:
+                # Spill whichever value stays live longest
+                victim = active.pop()[1]
+                reg_map[operand] = reg_map.pop(victim)
+                spilled.append(victim)
+            else:
+                spilled.append(operand)
+                continue
+            insort(active, (end, operand))
+
+        return reg_map, {operand: slot for slot, operand in enumerate(spilled)}
+
+    def report(self):
+        """Register allocation counts for the last generate() call"""
+        return self.stats
 
     def generate(self, intermediate_code):
-        self.assembly_code = []
-        self.assembly_code.append("; Assembly Code Generated")
-        self.assembly_code.append("section .data")
-        self.assembly_code.append("section .text")
-        self.assembly_code.append("global _start")
-        self.assembly_code.append("_start:")
-
-        for instruction in intermediate_code:
-            op = instruction['op']
-            arg1 = instruction['arg1']
-            arg2 = instruction['arg2']
-            result = instruction['result']
-
-            if op == '=':
-                reg_src = self.get_register(arg1) if isinstance(arg1, str) and arg1.startswith('t') else None
-                reg_dest = self.get_register(result)
-
-                if reg_src:
-                    self.assembly_code.append(f"    MOV {reg_dest}, {reg_src}")
-                else:
-                    self.assembly_code.append(f"    MOV {reg_dest}, {arg1}")
+        """Generate assembly from an IntermediateCode (or the dict format)"""
+        self.reset()
+        self._write_program(_as_ir(intermediate_code), self.assembly_code.append)
+        return self.assembly_code
+
+    def write(self, intermediate_code, stream, buffer_size=BUFFER_SIZE):
+        """Write the assembly of intermediate_code to stream (see
+        AssemblyWriter) rather than keeping it; returns the line count.
+
+        An IntermediateCode or dict-format list gives the same lines as
+        generate(). Any other iterable is a program arriving in chunks,
+        each an IntermediateCode or dict-format list, such as the
+        statements CompilerSession.compile_statements() streams; see
+        AssemblyEmitter for how those are generated.
+        """
+        if isinstance(intermediate_code, (IntermediateCode, list)):
+            self.reset()
+            writer = AssemblyWriter(stream, buffer_size)
+            self._write_program(_as_ir(intermediate_code), writer.write)
+            writer.flush()
+            return writer.lines
+        emitter = AssemblyEmitter(stream, len(self.registers), buffer_size)
+        for chunk in intermediate_code:
+            emitter.add(chunk)
+        self.stats = emitter.close()
+        return emitter.writer.lines
+
+    def _write_program(self, ir, emit):
+        self.allocate(ir)
+        emit("; Assembly Code Generated")
+        emit("section .data")
+        if self.spill_slots:
+            emit(f"stack: times {len(self.spill_slots)} dd 0")
+        emit("section .text")
+        emit("global _start")
+        emit("_start:")
+        counts = self._translate(ir, emit)
+        emit("    MOV EAX, 1")
+        emit("    INT 0x80")
+        self.stats = {
+            'registers': len(self.registers),
+            'values': self.values,
+            'spilled': len(self.spill_slots),
+            **counts,
+        }
+
+    def _translate(self, ir, emit):
+        """Emit the instructions of ir as allocated; returns the counts of
+        reloads, stores, copies and eliminated moves"""
+        value = ir.value
+        reg_map = self.reg_map
+        memory = self.memory
+        scratch = self.scratch
+        reloads = stores = copies = moves_eliminated = 0
+
+        def operand(x, n=0):
+            # Registers for temps and variables, reloading ones in memory
+            # into scratch register n; constants are immediates
+            nonlocal reloads
+            reg = reg_map.get(x)
+            if reg is not None:
+                return reg
+            if x in memory:
+                reloads += 1
+                emit(f"    MOV {scratch[n]}, {memory[x]}")
+                return scratch[n]
+            return value(x)
+
+        def target(x):
+            reg = reg_map.get(x)
+            return reg if reg is not None else scratch[0]
 
-            elif op in ['+', '-', '*', '/', '%']:
-                reg1 = self.get_register(arg1) if isinstance(arg1, str) else None
-                reg2 = self.get_register(arg2) if isinstance(arg2, str) else None
-                reg_result = self.get_register(result)
+        def store(x):
+            nonlocal stores
+            if x in memory:
+                stores += 1
+                emit(f"    MOV {memory[x]}, {scratch[0]}")
 
-                op_map = {'+': 'ADD', '-': 'SUB', '*': 'MUL', '/': 'DIV', '%': 'MOD'}
+        arithmetic = _ARITHMETIC_OPS
+        comparisons = _COMPARISON_OPS
 
-                if reg1 and reg2:
-                    self.assembly_code.append(f"    {op_map[op]} {reg_result}, {reg1}, {reg2}")
-                elif reg1:
-                    self.assembly_code.append(f"    {op_map[op]} {reg_result}, {reg1}, {arg2}")
-                elif reg2:
-                    self.assembly_code.append(f"    {op_map[op]} {reg_result}, {arg1}, {reg2}")
+        for op, arg1, arg2, result in zip(ir.ops, ir.arg1, ir.arg2, ir.result):
+            if op == OP_ASSIGN:
+                if STORAGE[arg1 & KIND_MASK]:
+                    copies += 1
+                    if arg1 in memory and memory[arg1] == memory.get(result):
+                        moves_eliminated += 1
+                        continue
+                source = operand(arg1)
+                if result in memory:
+                    stores += 1
+                    emit(f"    MOV {memory[result]}, {source}")
+                elif source == reg_map[result]:
+                    moves_eliminated += 1
                 else:
-                    self.assembly_code.append(f"    {op_map[op]} {reg_result}, {arg1}, {arg2}")
+                    emit(f"    MOV {reg_map[result]}, {source}")
+
+            elif op in arithmetic:
+                val1 = operand(arg1, 0)
+                val2 = operand(arg2, 1)
+                emit(f"    {arithmetic[op]} {target(result)}, {val1}, {val2}")
+                store(result)
+
+            elif op in comparisons:
+                val1 = operand(arg1, 0)
+                val2 = operand(arg2, 1)
+                emit(f"    CMP {val1}, {val2}")
+                emit(f"    SET{comparisons[op]} {target(result)}")
+                store(result)
+
+            elif op == OP_LABEL:
+                emit(f"{value(arg1)}:")
+
+            elif op == OP_GOTO:
+                emit(f"    JMP {value(arg1)}")
+
+            elif op == OP_IF_FALSE:
+                emit(f"    CMP {operand(arg1)}, 0")
+                emit(f"    JE {value(arg2)}")
+
+            elif op == OP_PRINT:
+                emit(f"    PRINT {operand(arg1)}")
+
+        return {'reloads': reloads, 'stores': stores, 'copies': copies,
+                'moves_eliminated': moves_eliminated}
+
+
+class AssemblyWriter:
+    """Collects assembly lines and writes them out in bulk, about
+    buffer_size characters at a time, to a text stream as str or to a
+    binary one (a file opened 'wb', socket.makefile('wb'), ...) as UTF-8"""
+
+    def __init__(self, stream, buffer_size=BUFFER_SIZE):
+        self.stream = stream
+        if isinstance(stream, io.TextIOBase):
+            self.binary = False
+        elif isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+            self.binary = True
+        else:
+            self.binary = 'b' in str(getattr(stream, 'mode', ''))
+        self.buffer_size = buffer_size
+        self.pending = []
+        self.size = 0
+        # Lines written out so far
+        self.lines = 0
+
+    def write(self, line):
+        self.pending.append(line)
+        self.size += len(line) + 1
+        if self.size >= self.buffer_size:
+            self.flush()
 
-            elif op in ['<', '<=', '>', '>=', '==', '!=']:
-                reg1 = self.get_register(arg1) if isinstance(arg1, str) else None
-                reg2 = self.get_register(arg2) if isinstance(arg2, str) else None
-                reg_result = self.get_register(result)
+    def flush(self):
+        """Write out the collected lines (the stream itself is not flushed)"""
+        if self.pending:
+            data = "\n".join(self.pending) + "\n"
+            self.stream.write(data.encode('utf-8') if self.binary else data)
+            self.lines += len(self.pending)
+            self.pending = []
+            self.size = 0
 
-                val1 = reg1 if reg1 else arg1
-                val2 = reg2 if reg2 else arg2
 
-                self.assembly_code.append(f"    CMP {val1}, {val2}")
-                self.assembly_code.append(f"    SET{op} {reg_result}")
+class AssemblyEmitter:
+    """Generates a program that arrives one chunk of IR at a time, e.g. the
+    statements CompilerSession.compile_statements() streams, writing its
+    assembly to a stream as it goes (see AssemblyWriter).
 
-            elif op == 'label':
-                self.assembly_code.append(f"{arg1}:")
+    Each chunk's temps are allocated by the linear scan as in a whole
+    program, so a chunk must not use the temps of another. Its variables,
+    whose values pass between chunks, live in memory (a 'vars' area) and
+    are loaded into the scratch registers where used; jumps between
+    chunks are fine, as no register is live across them. The .data
+    section follows the code, once its size is known. Memory use does not
+    grow with the number of chunks.
+    """
 
-            elif op == 'goto':
-                self.assembly_code.append(f"    JMP {arg1}")
+    def __init__(self, stream, registers=DEFAULT_REGISTERS, buffer_size=BUFFER_SIZE):
+        self.generator = CodeGenerator(registers)
+        self.writer = AssemblyWriter(stream, buffer_size)
+        # variable name -> slot in vars
+        self.variables = {}
+        self.stack_size = 0
+        self.temps = 0
+        self.spilled = 0
+        self.counts = {'reloads': 0, 'stores': 0, 'copies': 0, 'moves_eliminated': 0}
+        write = self.writer.write
+        write("; Assembly Code Generated")
+        write("section .text")
+        write("global _start")
+        write("_start:")
 
-            elif op == 'if_false':
-                reg = self.get_register(arg1) if isinstance(arg1, str) else None
-                val = reg if reg else arg1
-                self.assembly_code.append(f"    CMP {val}, 0")
-                self.assembly_code.append(f"    JE {arg2}")
+    def add(self, intermediate_code):
+        """Generate one chunk, an IntermediateCode or in the dict format"""
+        # A chunk sharing the tables of the whole program would cost as much
+        # to analyze as all of its names
+        ir = _as_ir(intermediate_code).compact()
+        generator = self.generator
+        generator.allocate_chunk(ir, self.variables)
+        self.temps += len(generator.reg_map) + len(generator.spill_slots)
+        self.spilled += len(generator.spill_slots)
+        self.stack_size = max(self.stack_size, len(generator.spill_slots))
+        for name, count in generator._translate(ir, self.writer.write).items():
+            self.counts[name] += count
 
-            elif op == 'print':
-                reg = self.get_register(arg1) if isinstance(arg1, str) else None
-                val = reg if reg else arg1
-                self.assembly_code.append(f"    PRINT {val}")
+    def close(self):
+        """End the program and write out the rest; returns the allocation
+        counts, as CodeGenerator.report()"""
+        write = self.writer.write
+        write("    MOV EAX, 1")
+        write("    INT 0x80")
+        if self.variables or self.stack_size:
+            write("section .data")
+            if self.variables:
+                write(f"vars: times {len(self.variables)} dd 0")
+            if self.stack_size:
+                write(f"stack: times {self.stack_size} dd 0")
+        self.writer.flush()
+        return {
+            'registers': len(self.generator.registers),
+            'values': self.temps + len(self.variables),
+            'spilled': self.spilled,
+            **self.counts,
+        }
 
-        self.assembly_code.append("    MOV EAX, 1")
-        self.assembly_code.append("    INT 0x80")
 
-        return self.assembly_code
\ No newline at end of file
+def format_allocation(stats):
+    """Render CodeGenerator.report() as text lines"""
+    return [
+        f"{stats['values']} values in {stats['registers']} registers: "
+        f"{stats['spilled']} spilled ({stats['reloads']} reloads, {stats['stores']} stores)",
+        f"{stats['moves_eliminated']} of {stats['copies']} MOVs eliminated",
+    ]
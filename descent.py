@@ -0,0 +1,315 @@
+# descent.py
+"""Hand-written parser backend: recursive descent for statements, Pratt
+(binding power) parsing for expressions.
+
+It is a drop-in for the PLY parser: same IR, symbol table, parse tree and
+errors, produced by the same semantic actions (Parser.declare() and
+friends). An LALR parser only reduces a rule, and so only runs its
+action, once the lookahead token is one the rule may be followed by.
+Before each action this parser checks the lookahead against the same
+set, so on bad input it stops at the same token with the same actions
+already done. Error recovery follows PLY's too: report the first error,
+drop the offending token, start over as if at the top of a program, and
+stay quiet until three tokens have been accepted.
+"""
+from lexer import RecordingLexer, TokenFeed
+from parser import Parser
+from syntax_tree import Block
+
+# Tokens an LALR reduction may see as lookahead (from the parse tables)
+STATEMENT_START = frozenset(('INT', 'FLOAT', 'ID', 'PRINT', 'IF', 'WHILE', 'LBRACE'))
+AFTER_STATEMENT = STATEMENT_START | {'RBRACE', '$end'}
+AFTER_TOP_STATEMENT = STATEMENT_START | {'$end'}
+AFTER_BLOCK = AFTER_STATEMENT | {'ELSE'}
+AFTER_FACTOR = frozenset(('PLUS', 'MINUS', 'TIMES', 'DIVIDE', 'MODULO', 'SEMICOLON', 'RPAREN',
+                          'LT', 'LE', 'GT', 'GE', 'EQ', 'NE'))
+RELOPS = frozenset(('LT', 'LE', 'GT', 'GE', 'EQ', 'NE'))
+
+# Left binding power of the binary operators; all are left associative
+BINDING_POWER = {'PLUS': 1, 'MINUS': 1, 'TIMES': 2, 'DIVIDE': 2, 'MODULO': 2}
+
+# Tokens to accept after a syntax error before reporting another, as PLY
+ERROR_COUNT = 3
+
+# Methods that recognize one grammar construct each
+GRAMMAR_FUNCTIONS = ('program', 'program_body', 'statement_list', 'statement', 'block', 'condition_clause',
+                     'expression', 'factor')
+
+
+class _SyntaxError(Exception):
+    """Unwinds the parse to the top after a syntax error"""
+
+
+class DescentParser(Parser):
+    """Parser backend that needs no PLY parse tables"""
+
+    def __init__(self):
+        super().__init__()
+        self.next_token = None
+        self.token = None
+        self.kind = '$end'
+        self.error_count = 0
+
+    def build(self, tabmodule=None, debug=False, lexer_backend='ply', **kwargs):
+        """Build the lexer; the PLY table options are accepted and ignored"""
+        self.lexer = RecordingLexer()
+        self.lexer.build(lexer_backend)
+
+    def rule_actions(self):
+        """The grammar methods, standing in for PLY's rule actions when
+        counting productions (see profiling.py)"""
+        return [(self, name) for name in GRAMMAR_FUNCTIONS]
+
+    def parse(self, data, record_tokens=False, symbol_table=None, cancel=None, consumer=None):
+        """Same interface and results as Parser.parse"""
+        self.reset()
+        if symbol_table is not None:
+            self.symbol_table = symbol_table
+        self.consumer = consumer
+        self.lexer.reset(record_tokens, cancel)
+        self.lexer.lexer.input(data)
+
+        result = self._run(self.lexer.lexer.token)
+        if record_tokens:
+            self.lexer.drain()
+        return result
+
+    def parse_stream(self, tokens, symbol_table=None, cancel=None, consumer=None):
+        """Same interface and results as Parser.parse_stream"""
+        self.reset()
+        if symbol_table is not None:
+            self.symbol_table = symbol_table
+        self.consumer = consumer
+        feed = TokenFeed(tokens, cancel)
+        result = self._run(feed.token)
+        while feed.token():
+            pass
+        return result
+
+    # Token handling
+
+    def _run(self, next_token):
+        self.next_token = next_token
+        self.error_count = 0
+        self.read()
+        while True:
+            try:
+                return self.program()
+            except _SyntaxError:
+                if self.kind == '$end':
+                    return None
+                # Drop the offending token and start over
+                self.read()
+
+    def read(self):
+        token = self.token = self.next_token()
+        self.kind = token.type if token is not None else '$end'
+
+    def advance(self):
+        """Accept the current token and read the next"""
+        if self.error_count:
+            self.error_count -= 1
+        token = self.token = self.next_token()
+        self.kind = token.type if token is not None else '$end'
+
+    def syntax_error(self):
+        if not self.error_count:
+            self.p_error(self.token)
+        self.error_count = ERROR_COUNT
+        raise _SyntaxError()
+
+    def expect(self, kind):
+        """Value of the current token, which must be kind; accepts it"""
+        if self.kind != kind:
+            self.syntax_error()
+        value = self.token.value
+        self.advance()
+        return value
+
+    # Grammar
+    #
+    # Blocks and parentheses may nest deeper than Python's recursion limit,
+    # as they may for PLY's parser, so neither recurses. Statements, blocks
+    # and statement lists are generators that yield the generator of each
+    # construct nested in them and are sent back its node; nested() drives
+    # them from an explicit stack. expression() keeps its open operators and
+    # parentheses on a stack of its own.
+
+    def nested(self, generator):
+        """Run a grammar generator, and those nested in it, to its node"""
+        stack = [generator]
+        node = None
+        while True:
+            try:
+                generator = stack[-1].send(node)
+            except StopIteration as done:
+                stack.pop()
+                node = done.value
+                if not stack:
+                    return node
+            else:
+                stack.append(generator)
+                node = None
+
+    def program(self):
+        statements = self.program_body()
+        if self.kind != '$end':
+            self.syntax_error()
+        return self.end_program(statements)
+
+    def program_body(self):
+        statement = self.nested(self.statement())
+        self.check(AFTER_TOP_STATEMENT)
+        statements = self.top_statement([], statement)
+        while self.kind in STATEMENT_START:
+            statement = self.nested(self.statement())
+            self.check(AFTER_TOP_STATEMENT)
+            statements = self.top_statement(statements, statement)
+        return statements
+
+    def statement_list(self):
+        statements = [(yield self.statement())]
+        while self.kind in STATEMENT_START:
+            statements.append((yield self.statement()))
+        return statements
+
+    def statement(self):
+        kind = self.kind
+        token = self.token
+        if kind == 'ID':
+            self.advance()
+            self.expect('ASSIGN')
+            expr = self.expression()
+            self.end_statement()
+            return self.assign(token.value, expr, token.lineno, token.lexpos)
+        if kind == 'INT' or kind == 'FLOAT':
+            self.advance()
+            if self.kind != 'ID':
+                self.syntax_error()
+            name = self.token
+            self.advance()
+            init = None
+            if self.kind == 'ASSIGN':
+                self.advance()
+                init = self.expression()
+            self.end_statement()
+            return self.declare(token.value, name.value, init, name.lineno, name.lexpos)
+        if kind == 'PRINT':
+            self.advance()
+            self.expect('LPAREN')
+            expr = self.expression()
+            self.expect('RPAREN')
+            self.end_statement()
+            return self.print_value(expr, token.lineno, token.lexpos)
+        if kind == 'IF':
+            self.advance()
+            self.expect('LPAREN')
+            condition = self.condition_clause()
+            then = yield self.block()
+            otherwise = end_label = None
+            if self.kind == 'ELSE':
+                end_label = self.else_jump(condition)
+                self.advance()
+                otherwise = yield self.block()
+            self.check(AFTER_STATEMENT)
+            return self.end_if(condition, then, otherwise, end_label, token.lineno, token.lexpos)
+        if kind == 'WHILE':
+            self.advance()
+            if self.kind != 'LPAREN':
+                self.syntax_error()
+            start_label = self.loop_label()
+            self.advance()
+            condition = self.condition_clause()
+            body = yield self.block()
+            self.check(AFTER_STATEMENT)
+            return self.end_while(start_label, condition, body, token.lineno, token.lexpos)
+        if kind == 'LBRACE':
+            node = yield self.block()
+            self.check(AFTER_STATEMENT)
+            return node
+        self.syntax_error()
+
+    def end_statement(self):
+        """Accept the closing ';' of a simple statement"""
+        if self.kind != 'SEMICOLON':
+            self.syntax_error()
+        self.advance()
+        self.check(AFTER_STATEMENT)
+
+    def check(self, allowed):
+        if self.kind not in allowed:
+            self.syntax_error()
+
+    def block(self):
+        if self.kind != 'LBRACE':
+            self.syntax_error()
+        token = self.token
+        self.advance()
+        self.check(STATEMENT_START)
+        self.symbol_table.enter_scope()
+        statements = yield self.statement_list()
+        if self.kind != 'RBRACE':
+            self.syntax_error()
+        self.advance()
+        self.check(AFTER_BLOCK)
+        self.symbol_table.exit_scope()
+        return Block(statements, token.lineno, token.lexpos)
+
+    def condition_clause(self):
+        """condition ')' -- the '(' is already accepted"""
+        left = self.expression()
+        if self.kind not in RELOPS:
+            self.syntax_error()
+        relop = self.token.value
+        self.advance()
+        right = self.expression()
+        if self.kind != 'RPAREN':
+            self.syntax_error()
+        condition = self.condition(relop, left, right)
+        self.advance()
+        return condition
+
+    def expression(self):
+        """Pratt parsing over an explicit stack: frames holds, innermost
+        last, each operator awaiting its right operand as (min_power, left,
+        operator token) and each open '(' as the min_power around it"""
+        frames = []
+        min_power = 1
+        while True:
+            while self.kind == 'LPAREN':
+                self.advance()
+                frames.append(min_power)
+                min_power = 1
+            left = self.factor()
+            while True:
+                power = BINDING_POWER.get(self.kind)
+                if power is not None and power >= min_power:
+                    break
+                if not frames:
+                    return left
+                frame = frames.pop()
+                if type(frame) is int:
+                    if self.kind != 'RPAREN':
+                        self.syntax_error()
+                    self.advance()
+                    self.check(AFTER_FACTOR)
+                    min_power = frame
+                else:
+                    min_power, operand, op = frame
+                    left = self.binary(op.value, operand, left, op.lineno, op.lexpos)
+            op = self.token
+            self.advance()
+            frames.append((min_power, left, op))
+            min_power = power + 1
+
+    def factor(self):
+        """A name or number; parentheses are handled by expression()"""
+        kind = self.kind
+        if kind != 'ID' and kind != 'NUMBER' and kind != 'FLOAT_NUM':
+            self.syntax_error()
+        token = self.token
+        self.advance()
+        self.check(AFTER_FACTOR)
+        if kind == 'ID':
+            return self.variable(token.value, token.lineno, token.lexpos)
+        return self.number(token.value, token.lineno, token.lexpos)
@@ -0,0 +1,339 @@
+# incremental.py
+"""Incremental recompilation for compile-as-you-type.
+
+The program is split into top-level statements ("chunks"). Each chunk is
+parsed on its own, with its temps, labels and block scopes numbered from
+one, and the results are kept between compiles. After an edit only the
+source from the nearest statement boundary is re-lexed, only chunks whose
+text (or the globals they can see) changed are re-parsed, and the kept
+intermediate code is renumbered and spliced into the output.
+"""
+import re
+from contextlib import nullcontext
+
+from lexer import CompileCancelled
+from ir import IntermediateCode
+from symbol_table import SymbolTable
+from semantic import SemanticAnalyzer
+from session import CompileResult
+from profiling import phase_timer
+
+_TEMP = re.compile(r't(\d+)$')
+_SCOPE = re.compile(r'scope_(\d+)$')
+_ERROR_LINE = re.compile(r'(at line |\(line )(\d+)')
+_GENERATED_NAME = re.compile(r'[tL]\d+$')
+
+
+class Chunk:
+    """Parse results of one top-level statement, numbered locally"""
+
+    __slots__ = ('ir', 'symbols', 'lex_errors', 'errors', 'warnings',
+                 'temp_count', 'label_count', 'scope_count', 'relocatable',
+                 'placed')
+
+    def __init__(self, ir, symbols, lex_errors, errors, warnings,
+                 temp_count, label_count, scope_count, relocatable):
+        self.ir = ir
+        self.symbols = symbols
+        self.lex_errors = lex_errors
+        self.errors = errors
+        self.warnings = warnings
+        self.temp_count = temp_count
+        self.label_count = label_count
+        self.scope_count = scope_count
+        # False if the statement uses identifiers that look like temps or
+        # labels; the IR keeps them apart, but the symbol values do not
+        self.relocatable = relocatable
+        # (offsets, symbols) from the last splice
+        self.placed = None
+
+
+def split_statements(tokens):
+    """Return the indices of the tokens that start a top-level statement.
+
+    A statement ends at a ';' outside any block, or at a '}' that closes a
+    top-level block unless an 'else' follows it.
+    """
+    starts = []
+    depth = 0
+    at_start = True
+    count = len(tokens)
+    for i, tok in enumerate(tokens):
+        if at_start:
+            starts.append(i)
+            at_start = False
+        kind = tok['type']
+        if kind == 'LBRACE':
+            depth += 1
+        elif kind == 'RBRACE':
+            depth = max(depth - 1, 0)
+            if depth == 0 and not (i + 1 < count and tokens[i + 1]['type'] == 'ELSE'):
+                at_start = True
+        elif kind == 'SEMICOLON' and depth == 0:
+            at_start = True
+    return starts
+
+
+def _shift_temp(value, offset):
+    if isinstance(value, str):
+        match = _TEMP.match(value)
+        if match:
+            return f"t{int(match.group(1)) + offset}"
+    return value
+
+
+def _shift_lines(messages, offset):
+    if not offset:
+        return list(messages)
+    return [_ERROR_LINE.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + offset}", message)
+            for message in messages]
+
+
+def relocate_symbols(chunk, temp_offset, scope_offset):
+    """Renumber the temps and scopes in a chunk's symbols for its place in the program"""
+    symbols = []
+    for symbol in chunk.symbols:
+        symbol = dict(symbol)
+        symbol['value'] = _shift_temp(symbol['value'], temp_offset)
+        match = _SCOPE.match(symbol['scope'])
+        if match and scope_offset:
+            symbol['scope'] = f"scope_{int(match.group(1)) + scope_offset}"
+        symbols.append(symbol)
+    return symbols
+
+
+class IncrementalCompiler:
+    """Recompiles only the statements touched by an edit.
+
+    Uses the lexer, parser and code generator of a CompilerSession. Sources
+    the chunked path cannot reproduce exactly (syntax errors, or identifiers
+    that look like generated temps/labels) fall back to a full compile.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.source = ''
+        self.tokens = []
+        self.starts = []
+        # (chunk text, visible globals) -> Chunk, for the latest compile only
+        self.chunks = {}
+        # chunk text -> identifiers it mentions
+        self.names = {}
+        self.reparsed = 0
+
+    def relex(self, source_code, cancel=None):
+        """Update self.tokens for source_code.
+
+        Lexing restarts at the statement boundary nearest to the first
+        edited character and stops as soon as it reaches a statement start
+        in the unchanged tail of the old source; the old tokens from there
+        on are reused with shifted positions and line numbers.
+        """
+        old_source = self.source
+        old_tokens = self.tokens
+        limit = min(len(old_source), len(source_code))
+        changed = 0
+        while changed < limit and old_source[changed] == source_code[changed]:
+            changed += 1
+        if changed == len(old_source) == len(source_code):
+            return False
+
+        same_tail = 0
+        while (same_tail < limit - changed
+               and old_source[-1 - same_tail] == source_code[-1 - same_tail]):
+            same_tail += 1
+        delta = len(source_code) - len(old_source)
+
+        # Keep the tokens of every statement that starts before the edit
+        keep = 0
+        resume = {}
+        for start in self.starts:
+            position = old_tokens[start]['position']
+            if position < changed:
+                keep = start
+            elif position > len(old_source) - same_tail:
+                # Statement starts in the unchanged tail, by new position
+                resume[position + delta] = start
+        boundary = old_tokens[keep]['position'] if keep else 0
+
+        # Illegal characters are reported to the session lexer's error
+        # list; start it afresh, as Lexer.tokenize and a full compile do
+        self.session.lexer.errors = []
+        lexer = self.session.lexer.lexer
+        lexer.lineno = old_tokens[keep]['line'] if keep else 1
+        lexer.input(source_code[boundary:])
+        tokens = old_tokens[:keep]
+        token_entry = self.session.lexer.token_entry
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise CompileCancelled()
+            tok = lexer.token()
+            if not tok:
+                break
+            entry = token_entry(tok)
+            entry['position'] += boundary
+            old_index = resume.get(entry['position'])
+            if old_index is not None:
+                # Back in sync with the old token stream
+                line_delta = entry['line'] - old_tokens[old_index]['line']
+                for old in old_tokens[old_index:]:
+                    tokens.append({'type': old['type'], 'value': old['value'],
+                                   'line': old['line'] + line_delta,
+                                   'position': old['position'] + delta})
+                break
+            tokens.append(entry)
+
+        self.tokens = tokens
+        self.starts = split_statements(tokens)
+        self.source = source_code
+        return True
+
+    def parse_chunk(self, text, visible_globals, cancel=None, profile=None):
+        """Parse one statement on its own; line numbers in its diagnostics
+        are relative to the statement's first line"""
+        parser = self.session.parser
+        symbol_table = profile.symbol_table() if profile is not None else SymbolTable()
+        for name, symbol_type in visible_globals:
+            symbol_table.insert(name, symbol_type)
+        seeded = len(visible_globals)
+
+        counting = profile.counting_productions(parser) if profile is not None else nullcontext()
+        with counting:
+            parser.parse(text, record_tokens=True, symbol_table=symbol_table, cancel=cancel)
+        self.reparsed += 1
+
+        relocatable = not any(tok['type'] == 'ID' and _GENERATED_NAME.match(tok['value'])
+                              for tok in parser.lexer.tokens_list)
+        warnings = []
+        if parser.ast is not None:
+            globals_table = SymbolTable()
+            for name, symbol_type in visible_globals:
+                globals_table.insert(name, symbol_type)
+            warnings = SemanticAnalyzer(globals_table).analyze(parser.ast).warnings
+        return Chunk(
+            ir=parser.ir,
+            symbols=symbol_table.get_all()[seeded:],
+            lex_errors=list(parser.lexer.errors),
+            errors=list(parser.errors),
+            warnings=warnings,
+            temp_count=parser.temp_count,
+            label_count=parser.label_count,
+            scope_count=symbol_table.scope_counter,
+            relocatable=relocatable,
+        )
+
+    def compile(self, source_code, cancel=None, profile=None):
+        """Compile source_code, reusing the statements of the last compile.
+
+        If the optional cancel event is set, CompileCancelled is raised and
+        the chunks kept from the last completed compile stay valid. An
+        optional Profile records the phases, as in CompilerSession.compile.
+        """
+        phase = phase_timer(profile)
+        self.reparsed = 0
+        with phase('lex'):
+            self.relex(source_code, cancel)
+        tokens = self.tokens
+        starts = self.starts
+        if not starts:
+            # No statements: the full parser reports an empty program
+            return self._full_compile(source_code, cancel, profile)
+
+        chunks = {}
+        names_by_text = {}
+        global_types = {}
+        ir = IntermediateCode()
+        symbols = []
+        lex_errors = []
+        errors = []
+        warnings = []
+        temp_offset = label_offset = scope_offset = 0
+
+        # Re-parsing and splicing the statements
+        parse_mark = profile.mark() if profile is not None else None
+        for n, start in enumerate(starts):
+            end = starts[n + 1] if n + 1 < len(starts) else len(tokens)
+            text_start = tokens[start]['position'] if n else 0
+            text_end = tokens[end]['position'] if end < len(tokens) else len(source_code)
+            start_line = tokens[start]['line'] if n else 1
+            text = source_code[text_start:text_end]
+
+            # A chunk's diagnostics depend only on which of the names it
+            # mentions were declared by the statements before it
+            names = names_by_text.get(text) or self.names.get(text)
+            if names is None:
+                names = frozenset(tok['value'] for tok in tokens[start:end] if tok['type'] == 'ID')
+            names_by_text[text] = names
+            visible = tuple(sorted((name, global_types[name]) for name in names
+                                   if name in global_types))
+            key = (text, visible)
+
+            chunk = chunks.get(key) or self.chunks.get(key)
+            if chunk is None:
+                chunk = self.parse_chunk(text, visible, cancel, profile)
+            chunks[key] = chunk
+            if not chunk.relocatable or any(error.startswith('Syntax error') for error in chunk.errors):
+                self.chunks = chunks
+                self.names = names_by_text
+                if profile is not None:
+                    profile.record('parse', parse_mark)
+                return self._full_compile(source_code, cancel, profile)
+
+            ir.extend(chunk.ir, temp_offset, label_offset)
+            offsets = (temp_offset, scope_offset)
+            if chunk.placed is not None and chunk.placed[0] == offsets:
+                _, chunk_symbols = chunk.placed
+            else:
+                chunk_symbols = relocate_symbols(chunk, *offsets)
+                chunk.placed = (offsets, chunk_symbols)
+            symbols.extend(dict(symbol) for symbol in chunk_symbols)
+
+            line_offset = start_line - 1
+            if chunk.lex_errors:
+                lex_errors.extend(_shift_lines(chunk.lex_errors, line_offset))
+            if chunk.errors:
+                errors.extend(_shift_lines(chunk.errors, line_offset))
+            if chunk.warnings:
+                warnings.extend(_shift_lines(chunk.warnings, line_offset))
+            for symbol in chunk_symbols:
+                if symbol['scope'] == 'global':
+                    global_types.setdefault(symbol['name'], symbol['type'])
+
+            temp_offset += chunk.temp_count
+            label_offset += chunk.label_count
+            scope_offset += chunk.scope_count
+
+        self.chunks = chunks
+        self.names = names_by_text
+        if profile is not None:
+            profile.record('parse', parse_mark)
+
+        # Optimization and register assignment span the whole program, so
+        # both run over the spliced IR (each a linear pass)
+        with phase('optimize'):
+            ir, report = self.session.optimize(ir)
+        with phase('codegen'):
+            assembly, allocation = self.session.generate(ir)
+
+        result = CompileResult(
+            tokens=list(tokens),
+            lex_errors=lex_errors,
+            symbols=symbols,
+            intermediate_code=ir,
+            assembly=assembly,
+            errors=errors,
+        )
+        result.warnings = warnings
+        result.optimization = report
+        result.allocation = allocation
+        if profile is not None:
+            profile.count('tokens', len(tokens))
+            profile.count('statements_reparsed', self.reparsed)
+            profile.count('instructions', len(ir))
+            profile.count('assembly_lines', len(assembly))
+            result.profile = profile
+        return result
+
+    def _full_compile(self, source_code, cancel=None, profile=None):
+        self.reparsed += 1
+        return self.session.compile(source_code, cancel, profile)
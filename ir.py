@@ -0,0 +1,233 @@
+# ir.py
+"""Compact intermediate representation.
+
+Instructions are stored column-wise in typed arrays: one opcode byte and
+three operand words per instruction. An operand word packs a kind into its
+low three bits and an index above them:
+
+    temp      index is the temp number       (t3  -> 3 << 3 | TEMP)
+    label     index is the label number      (L2  -> 2 << 3 | LABEL)
+    variable  index into the names table
+    constant  index into the constants table
+
+so temps, variables, constants and labels can never be confused, and
+repeated names and constants are stored once. to_dicts() / from_dicts()
+convert losslessly to and from the list-of-dicts format shown in the GUI.
+"""
+import re
+from array import array
+
+OPCODES = ('=', '+', '-', '*', '/', '%', '<', '<=', '>', '>=', '==', '!=',
+           'label', 'goto', 'if_false', 'print')
+OPCODE = {op: code for code, op in enumerate(OPCODES)}
+
+OP_ASSIGN = OPCODE['=']
+OP_LABEL = OPCODE['label']
+OP_GOTO = OPCODE['goto']
+OP_IF_FALSE = OPCODE['if_false']
+OP_PRINT = OPCODE['print']
+
+# Operand kinds
+NONE = 0
+TEMP = 1
+VAR = 2
+CONST = 3
+LABEL = 4
+
+KIND_BITS = 3
+KIND_MASK = (1 << KIND_BITS) - 1
+
+_TEMP_NAME = re.compile(r't(0|[1-9]\d*)$')
+_LABEL_NAME = re.compile(r'L(0|[1-9]\d*)$')
+
+
+def temp_operand(number):
+    return (number << KIND_BITS) | TEMP
+
+
+def label_operand(number):
+    return (number << KIND_BITS) | LABEL
+
+
+class IntermediateCode:
+    """Three-address code in parallel array columns with interned operands"""
+
+    __slots__ = ('ops', 'arg1', 'arg2', 'result',
+                 'names', 'name_index', 'constants', 'constant_index')
+
+    def __init__(self):
+        self.ops = array('B')
+        self.arg1 = array('q')
+        self.arg2 = array('q')
+        self.result = array('q')
+        self.names = []
+        self.name_index = {}
+        self.constants = []
+        # (type, value) -> index, so 1 and 1.0 stay distinct
+        self.constant_index = {}
+
+    def __len__(self):
+        return len(self.ops)
+
+    # Operands
+
+    def var(self, name):
+        index = self.name_index.get(name)
+        if index is None:
+            index = self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return (index << KIND_BITS) | VAR
+
+    def const(self, value):
+        key = (type(value), value)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return (index << KIND_BITS) | CONST
+
+    def value(self, operand):
+        """Decode an operand into its dict-format value"""
+        kind = operand & KIND_MASK
+        index = operand >> KIND_BITS
+        if kind == TEMP:
+            return f"t{index}"
+        if kind == VAR:
+            return self.names[index]
+        if kind == CONST:
+            return self.constants[index]
+        if kind == LABEL:
+            return f"L{index}"
+        return None
+
+    # Instructions
+
+    def emit(self, op, arg1=NONE, arg2=NONE, result=NONE):
+        """Append an instruction; op is an opcode name, operands are encoded"""
+        self.ops.append(OPCODE[op])
+        self.arg1.append(arg1)
+        self.arg2.append(arg2)
+        self.result.append(result)
+
+    def instruction(self, i):
+        value = self.value
+        return {'op': OPCODES[self.ops[i]], 'arg1': value(self.arg1[i]),
+                'arg2': value(self.arg2[i]), 'result': value(self.result[i])}
+
+    def to_dicts(self):
+        value = self.value
+        return [{'op': OPCODES[op], 'arg1': value(a1), 'arg2': value(a2), 'result': value(res)}
+                for op, a1, a2, res in zip(self.ops, self.arg1, self.arg2, self.result)]
+
+    @classmethod
+    def from_dicts(cls, intermediate_code):
+        """Build compact IR from the dict format.
+
+        Strings shaped like generated temps (t<n>) become temps, and like
+        generated labels (L<n>) become labels where a label is expected;
+        any other string is a variable name.
+        """
+        ir = cls()
+        for inst in intermediate_code:
+            op = inst['op']
+            ir.emit(op,
+                    ir._encode(inst['arg1'], op in ('label', 'goto')),
+                    ir._encode(inst['arg2'], op == 'if_false'),
+                    ir._encode(inst['result'], False))
+        return ir
+
+    @classmethod
+    def from_columns(cls, ops, arg1, arg2, result, names, constants):
+        """Build IR from its four columns (any buffers of the column types)
+        and its name and constant tables"""
+        ir = cls()
+        for column, data in ((ir.ops, ops), (ir.arg1, arg1), (ir.arg2, arg2), (ir.result, result)):
+            with memoryview(data) as view:
+                column.frombytes(view.cast('B'))
+        ir.names = list(names)
+        ir.name_index = {name: index for index, name in enumerate(ir.names)}
+        ir.constants = list(constants)
+        ir.constant_index = {(type(value), value): index
+                             for index, value in enumerate(ir.constants)}
+        return ir
+
+    def continuation(self):
+        """An empty IntermediateCode sharing this one's name and constant
+        tables, for the code that follows it: operands stay valid in both"""
+        ir = IntermediateCode()
+        ir.names = self.names
+        ir.name_index = self.name_index
+        ir.constants = self.constants
+        ir.constant_index = self.constant_index
+        return ir
+
+    def compact(self):
+        """A copy whose name and constant tables hold only the operands its
+        instructions use, e.g. for one chunk of a continuation()"""
+        ir = IntermediateCode()
+        names = self.names
+        constants = self.constants
+        moved = {}
+
+        def move(operand):
+            kind = operand & KIND_MASK
+            if kind != VAR and kind != CONST:
+                return operand
+            new = moved.get(operand)
+            if new is None:
+                index = operand >> KIND_BITS
+                new = moved[operand] = (ir.var(names[index]) if kind == VAR
+                                        else ir.const(constants[index]))
+            return new
+
+        ir.ops.extend(self.ops)
+        ir.arg1.extend(map(move, self.arg1))
+        ir.arg2.extend(map(move, self.arg2))
+        ir.result.extend(map(move, self.result))
+        return ir
+
+    def copy(self):
+        return self.from_columns(self.ops, self.arg1, self.arg2, self.result,
+                                 self.names, self.constants)
+
+    def _encode(self, value, is_label):
+        if value is None:
+            return NONE
+        if isinstance(value, str):
+            match = (_LABEL_NAME if is_label else _TEMP_NAME).match(value)
+            if match:
+                number = int(match.group(1))
+                return label_operand(number) if is_label else temp_operand(number)
+            return self.var(value)
+        return self.const(value)
+
+    def extend(self, other, temp_offset=0, label_offset=0):
+        """Append the instructions of other, renumbering its temps and labels"""
+        remap = [self._remap_operand(other, kind, index)
+                 for kind, table in ((VAR, other.names), (CONST, other.constants))
+                 for index in range(len(table))]
+        names = len(other.names)
+        temp_shift = temp_offset << KIND_BITS
+        label_shift = label_offset << KIND_BITS
+
+        def move(operand):
+            kind = operand & KIND_MASK
+            if kind == TEMP:
+                return operand + temp_shift
+            if kind == LABEL:
+                return operand + label_shift
+            if kind == VAR:
+                return remap[operand >> KIND_BITS]
+            if kind == CONST:
+                return remap[names + (operand >> KIND_BITS)]
+            return operand
+
+        self.ops.extend(other.ops)
+        self.arg1.extend(map(move, other.arg1))
+        self.arg2.extend(map(move, other.arg2))
+        self.result.extend(map(move, other.result))
+
+    def _remap_operand(self, other, kind, index):
+        if kind == VAR:
+            return self.var(other.names[index])
+        return self.const(other.constants[index])
@@ -1,6 +1,27 @@
 # lexer.py
+import codecs
+import mmap
 import re
-import ply.lex as lex
+from collections import namedtuple
+from functools import lru_cache
+
+# Bump whenever the token rules change so a stale precomputed lexer table
+# is never loaded
+LEXER_VERSION = 1
+LEX_TABLE_MODULE = f"lextab_v{LEXER_VERSION}"
+
+
+class CompileCancelled(Exception):
+    """Raised from inside a parse when its cancel event has been set"""
+
+
+class LexToken:
+    """A token with the attributes PLY's parser reads (type, value, lineno,
+    lexpos), for the scanners that do not use ply.lex"""
+
+    def __repr__(self):
+        return f"LexToken({self.type},{self.value!r},{self.lineno},{self.lexpos})"
+
 
 class Lexer:
     # Reserved keywords
@@ -89,47 +110,339 @@ class Lexer:
         self.tokens_list = []
         self.errors = []
 
-    def build(self):
-        self.lexer = lex.lex(module=self)
+    def build(self, backend='ply'):
+        """Build the scanner: 'ply' for PLY's lexer, 'fast' for FastScanner.
+        Both produce the same tokens and errors."""
+        if backend == 'ply':
+            # Imported here, so the 'fast' backend never loads PLY
+            import ply.lex as lex
+            # The first build writes the rules to the versioned lextab module;
+            # later ones load them from it without validating them again
+            self.lexer = lex.lex(module=self, optimize=True, lextab=LEX_TABLE_MODULE)
+        elif backend == 'fast':
+            self.lexer = FastScanner(self)
+        else:
+            raise ValueError(f"Unknown lexer backend {backend!r}; expected one of {BACKENDS}")
 
-    def tokenize(self, data):
+    def tokenize(self, data, lineno=1):
         self.tokens_list = []
         self.errors = []
+        self.lexer.lineno = lineno
         self.lexer.input(data)
 
+        if isinstance(self.lexer, FastScanner):
+            # Straight from the scan, without building LexTokens
+            self.tokens_list = [{'type': type_, 'value': value, 'line': line, 'position': position}
+                                for type_, value, line, position in self.lexer.scan()]
+            return self.tokens_list, self.errors
+
         while True:
             tok = self.lexer.token()
             if not tok:
                 break
-            self.tokens_list.append({
-                'type': tok.type,
-                'value': tok.value,
-                'line': tok.lineno,
-                'position': tok.lexpos
-            })
+            self.tokens_list.append(self.token_entry(tok))
 
         return self.tokens_list, self.errors
 
+    @staticmethod
+    def token_entry(tok):
+        """Convert a PLY LexToken into the token dict shown in the Tokens tab"""
+        return {
+            'type': tok.type,
+            'value': tok.value,
+            'line': tok.lineno,
+            'position': tok.lexpos
+        }
+
+
+class RecordingLexer(Lexer):
+    """Lexer used by the parser that can record the tokens it hands out.
 
-class ScopeTrackingLexer(Lexer):
-    """Extended lexer that tracks scope changes during tokenization"""
+    Scopes used to be entered/exited here when '{' / '}' were scanned, but
+    the parser reads lookahead tokens before reducing the preceding
+    statement, so that put declarations in the wrong scope. Scope changes
+    now happen in the parser's block rule instead.
+    """
 
-    def __init__(self, symbol_table):
+    def __init__(self):
         super().__init__()
-        self.symbol_table = symbol_table
         self.original_token = None
+        self.record_tokens = False
+        self.cancel = None
 
-    def build(self):
-        super().build()
-        # Wrap the token method to track scopes
+    def build(self, backend='ply'):
+        super().build(backend)
+        # Wrap the token method to record tokens
         self.original_token = self.lexer.token
-        self.lexer.token = self.token_with_scope_tracking
+        self.lexer.token = self.token_with_recording
+
+    def reset(self, record_tokens=False, cancel=None):
+        """Prepare the lexer for a new parse.
 
-    def token_with_scope_tracking(self):
+        With record_tokens set, every token handed to the parser is also
+        appended to tokens_list, so the source only has to be scanned once.
+        cancel is an optional threading.Event; once it is set the next token
+        request raises CompileCancelled, abandoning the parse.
+        """
+        self.record_tokens = record_tokens
+        self.cancel = cancel
+        self.tokens_list = []
+        self.errors = []
+        self.lexer.lineno = 1
+
+    def drain(self):
+        """Consume any tokens the parser did not read (e.g. after a syntax error)"""
+        while self.lexer.token():
+            pass
+
+    def token_with_recording(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise CompileCancelled()
         tok = self.original_token()
-        if tok:
-            if tok.type == 'LBRACE':
-                self.symbol_table.enter_scope()
-            elif tok.type == 'RBRACE':
-                self.symbol_table.exit_scope()
-        return tok
\ No newline at end of file
+        if tok and self.record_tokens:
+            self.tokens_list.append(self.token_entry(tok))
+        return tok
+
+
+BACKENDS = ('ply', 'fast')
+
+
+# A token from StreamingLexer: line and column count from 1, position is
+# the character offset from the start of the source
+Token = namedtuple('Token', ['type', 'value', 'line', 'column', 'position'])
+
+
+@lru_cache(maxsize=None)
+def _master_pattern(streaming=False):
+    """One regex with a named group per Lexer rule, tried in PLY's order:
+    function rules as defined, then string rules longest first.
+    Characters no rule matches fall to a final ERROR group."""
+    rules = [('NEWLINE', r'\n+'), ('IGNORE', f"[{re.escape(Lexer.t_ignore)}]+")]
+    functions = sorted((rule for name, rule in vars(Lexer).items()
+                        if name.startswith('t_') and callable(rule)
+                        and name not in ('t_error', 't_newline')),
+                       key=lambda rule: rule.__code__.co_firstlineno)
+    for rule in functions:
+        name = rule.__name__[2:]
+        rules.append((name, rule.__doc__))
+        if name == 'COMMENT_MULTI' and streaming:
+            # The start of a comment whose end is not in the buffer yet
+            rules.append(('COMMENT_OPEN', r'/\*'))
+    strings = [(name[2:], rule) for name, rule in vars(Lexer).items()
+               if name.startswith('t_') and name != 't_ignore' and isinstance(rule, str)]
+    rules.extend(sorted(strings, key=lambda rule: len(rule[1]), reverse=True))
+    if not streaming:
+        rules.append(('ERROR', '.'))
+    return re.compile('|'.join(f"(?P<{name}>{pattern})" for name, pattern in rules))
+
+
+def read_chunks(source, chunk_size):
+    """Yield text chunks from a text or binary file object, or an mmap"""
+    decoder = None
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if not isinstance(chunk, str):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+    if decoder is not None:
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+
+class StreamingLexer:
+    """Lexer that reads its source in chunks and yields Token tuples.
+
+    Same tokens as Lexer, but the source is never held in memory as a
+    whole: only the current chunk and the unfinished token carried over
+    from the previous one are. A /* */ comment is skipped as it streams
+    past, however many chunks it spans. Lexical errors collect in errors
+    as the stream is consumed; an unterminated comment is reported as one
+    (Lexer would instead scan it as '/' '*' and carry on).
+    """
+
+    CHUNK_SIZE = 1 << 16
+    # Characters that must follow a token before it is certain to be
+    # complete: '12.' may yet become '12.5'
+    LOOKAHEAD = 2
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.errors = []
+        # Compiled on first use rather than when the module is imported
+        self.pattern = _master_pattern(streaming=True)
+
+    def tokens(self, source):
+        """Generate the Tokens of a file object or mmap"""
+        self.errors = []
+        errors = self.errors
+        reserved = Lexer.reserved
+        match = self.pattern.match
+
+        buffer = ''
+        pos = 0
+        base = 0          # offset of buffer[0] in the source
+        line = 1
+        line_start = 0    # offset of the first character of the current line
+        comment_line = None
+        chunks = read_chunks(source, self.chunk_size)
+        eof = False
+
+        while not eof:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                base += pos
+                buffer = buffer[pos:] + chunk
+                pos = 0
+            end = len(buffer)
+
+            while pos < end:
+                if comment_line is not None:
+                    close = buffer.find('*/', pos)
+                    # Keep a last '*' back in case its '/' is in the next chunk
+                    stop = close + 2 if close >= 0 else (end if eof else end - 1)
+                    newlines = buffer.count('\n', pos, stop)
+                    if newlines:
+                        line += newlines
+                        line_start = base + buffer.rindex('\n', pos, stop) + 1
+                    pos = stop
+                    if close < 0:
+                        break
+                    comment_line = None
+                    continue
+
+                m = match(buffer, pos)
+                if not eof and (m.end() if m else pos) + self.LOOKAHEAD > end:
+                    # The next chunk could still extend or change the token
+                    break
+                if m is None:
+                    errors.append(f"Illegal character '{buffer[pos]}' at line {line}")
+                    pos += 1
+                    continue
+
+                kind = m.lastgroup
+                if kind == 'NEWLINE':
+                    line += m.end() - pos
+                    line_start = base + m.end()
+                elif kind == 'COMMENT_MULTI':
+                    newlines = buffer.count('\n', pos, m.end())
+                    if newlines:
+                        line += newlines
+                        line_start = base + buffer.rindex('\n', pos, m.end()) + 1
+                elif kind == 'COMMENT_OPEN':
+                    comment_line = line
+                elif kind != 'IGNORE' and kind != 'COMMENT_SINGLE':
+                    text = m.group()
+                    if kind == 'NUMBER':
+                        value = int(text)
+                    elif kind == 'FLOAT_NUM':
+                        value = float(text)
+                    else:
+                        value = text
+                        if kind == 'ID':
+                            kind = reserved.get(text, 'ID')
+                    yield Token(kind, value, line, base + pos - line_start + 1, base + pos)
+                pos = m.end()
+
+        if comment_line is not None:
+            errors.append(f"Unterminated comment starting at line {comment_line}")
+
+    def tokenize_file(self, path):
+        """Generate the Tokens of the file at path, read through mmap"""
+        with open(path, 'rb') as f:
+            try:
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                return
+            with source:
+                yield from self.tokens(source)
+
+
+class TokenFeed:
+    """Hands Token tuples to PLY's parser through the token() method it
+    calls, checking the optional cancel event on every token"""
+
+    def __init__(self, tokens, cancel=None):
+        self.tokens = iter(tokens)
+        self.cancel = cancel
+
+    def token(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise CompileCancelled()
+        token = next(self.tokens, None)
+        if token is None:
+            return None
+        tok = LexToken()
+        tok.type, tok.value, tok.lineno, tok.lexpos = (token.type, token.value, token.line,
+                                                       token.position)
+        return tok
+
+
+class FastScanner:
+    """Lexer backend that scans with one compiled regex, dispatching on the
+    name of the group that matched instead of calling a PLY rule function
+    per token.
+
+    Offers what the parser and Lexer use of PLY's lexer object: input(),
+    token() and lineno. Illegal characters are reported to the owning
+    Lexer's errors list, worded as its t_error does.
+    """
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.pattern = _master_pattern()
+        self.lineno = 1
+        self.lexdata = ''
+        self.lexpos = 0
+        self._tokens = iter(())
+
+    def input(self, data):
+        self.lexdata = data
+        self.lexpos = 0
+        self._tokens = self.scan()
+
+    def scan(self):
+        """Generate (type, value, line, position) for the rest of the input"""
+        reserved = Lexer.reserved
+        errors = self.owner.errors
+        data = self.lexdata
+        line = self.lineno
+        for m in self.pattern.finditer(data, self.lexpos):
+            kind = m.lastgroup
+            if kind == 'ID':
+                value = m.group()
+                yield reserved.get(value, 'ID'), value, line, m.start()
+            elif kind == 'IGNORE' or kind == 'COMMENT_SINGLE':
+                continue
+            elif kind == 'NEWLINE':
+                line += m.end() - m.start()
+                self.lineno = line
+            elif kind == 'NUMBER':
+                yield 'NUMBER', int(m.group()), line, m.start()
+            elif kind == 'FLOAT_NUM':
+                yield 'FLOAT_NUM', float(m.group()), line, m.start()
+            elif kind == 'COMMENT_MULTI':
+                line += data.count('\n', m.start(), m.end())
+                self.lineno = line
+            elif kind == 'ERROR':
+                errors.append(f"Illegal character '{m.group()}' at line {line}")
+            else:
+                yield kind, m.group(), line, m.start()
+        self.lexpos = len(data)
+
+    def token(self):
+        entry = next(self._tokens, None)
+        if entry is None:
+            return None
+        tok = LexToken()
+        tok.type, tok.value, tok.lineno, tok.lexpos = entry
+        tok.lexer = self
+        return tok
@@ -0,0 +1,189 @@
+# listview.py
+"""Virtualized list view for large outputs.
+
+VirtualListView shows a sequence of rows (anything supporting len() and
+int indexing, such as a list of lines or a worker.Rows) in a Text widget
+that holds only the rows fitting in the window. Scrolling swaps those rows
+for others, so drawing costs the same for ten rows as for ten million.
+A toolbar jumps to a line or finds the next line containing some text;
+long searches run a slice of rows at a time between Tk events.
+"""
+import tkinter as tk
+import tkinter.font as tkfont
+
+# Rows searched between two turns of the Tk event loop
+FIND_SLICE = 10000
+
+
+def find_row(rows, text, start=0, stop=None):
+    """Index of the first row in range(start, stop) containing text, or
+    None. Uses rows.find(text, start, stop) where rows has one, as
+    worker.Rows does."""
+    stop = len(rows) if stop is None else min(stop, len(rows))
+    find = getattr(rows, 'find', None)
+    if find is not None:
+        return find(text, start, stop)
+    for i in range(start, stop):
+        if text in rows[i]:
+            return i
+    return None
+
+
+class VirtualListView(tk.Frame):
+    """Scrollable, read-only view of the visible window of a row sequence"""
+
+    def __init__(self, master, font=('Courier', 9), **kwargs):
+        super().__init__(master, **kwargs)
+        self.rows = []
+        # Index of the first row shown, and of the row last found
+        self.top = 0
+        self.match = None
+        # Pending after() call of a search in progress
+        self.find_job = None
+
+        toolbar = tk.Frame(self)
+        toolbar.pack(side=tk.TOP, fill=tk.X)
+        tk.Label(toolbar, text="Line:").pack(side=tk.LEFT)
+        self.line_entry = tk.Entry(toolbar, width=10)
+        self.line_entry.pack(side=tk.LEFT, padx=2)
+        self.line_entry.bind('<Return>', self.on_go)
+        tk.Button(toolbar, text="Go", command=self.on_go).pack(side=tk.LEFT, padx=2)
+        tk.Label(toolbar, text="Find:").pack(side=tk.LEFT, padx=(10, 0))
+        self.find_entry = tk.Entry(toolbar, width=24)
+        self.find_entry.pack(side=tk.LEFT, padx=2)
+        self.find_entry.bind('<Return>', self.on_find)
+        tk.Button(toolbar, text="Next", command=self.on_find).pack(side=tk.LEFT, padx=2)
+        self.position = tk.Label(toolbar, anchor='e')
+        self.position.pack(side=tk.RIGHT)
+
+        body = tk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True, padx=2, pady=2)
+        body.rowconfigure(0, weight=1)
+        body.columnconfigure(0, weight=1)
+        self.text = tk.Text(body, font=font, height=10, wrap=tk.NONE, state=tk.DISABLED)
+        self.text.grid(row=0, column=0, sticky='nsew')
+        # The vertical scrollbar tracks rows, not the few lines in the widget
+        self.scrollbar = tk.Scrollbar(body, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        xscrollbar = tk.Scrollbar(body, orient=tk.HORIZONTAL, command=self.text.xview)
+        xscrollbar.grid(row=1, column=0, sticky='ew')
+        self.text.config(xscrollcommand=xscrollbar.set)
+        self.text.tag_configure('match', background='yellow')
+        self.line_height = tkfont.Font(font=self.text.cget('font')).metrics('linespace')
+
+        self.text.bind('<Configure>', lambda event: self.render())
+        self.text.bind('<MouseWheel>', self.on_wheel)
+        self.text.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.text.bind('<Button-5>', lambda event: self.scroll(3))
+        for key, step in (('<Up>', -1), ('<Down>', 1)):
+            self.text.bind(key, lambda event, step=step: self.scroll(step))
+        for key, pages in (('<Prior>', -1), ('<Next>', 1)):
+            self.text.bind(key, lambda event, pages=pages: self.scroll(pages * self.visible_rows()))
+        self.text.bind('<Control-Home>', lambda event: self.scroll(-len(self.rows)))
+        self.text.bind('<Control-End>', lambda event: self.scroll(len(self.rows)))
+        # Focus on click, so the keys work although the widget is disabled
+        self.text.bind('<Button-1>', lambda event: self.text.focus_set())
+
+    def set_rows(self, rows):
+        """Show rows, keeping the scroll position where it still fits"""
+        self.cancel_find()
+        self.rows = rows
+        self.match = None
+        self.render()
+
+    def visible_rows(self):
+        """How many whole rows fit in the text widget"""
+        text = self.text
+        inset = 2 * (int(text.cget('borderwidth')) + int(text.cget('highlightthickness'))
+                     + int(text.cget('pady')))
+        return max(1, (text.winfo_height() - inset) // self.line_height)
+
+    def render(self):
+        """Format and show the rows of the current window, and only those"""
+        rows = self.rows
+        total = len(rows)
+        count = self.visible_rows()
+        self.top = max(0, min(self.top, total - count))
+        end = min(total, self.top + count)
+
+        text = self.text
+        text.config(state=tk.NORMAL)
+        text.delete('1.0', tk.END)
+        text.insert('1.0', "\n".join([rows[i] for i in range(self.top, end)]))
+        if self.match is not None and self.top <= self.match < end:
+            line = self.match - self.top + 1
+            text.tag_add('match', f"{line}.0", f"{line}.end")
+        text.config(state=tk.DISABLED)
+
+        if total:
+            self.scrollbar.set(self.top / total, end / total)
+            self.position.config(text=f"{self.top + 1}-{end} of {total}")
+        else:
+            self.scrollbar.set(0, 1)
+            self.position.config(text="")
+
+    def scroll(self, rows):
+        self.top += rows
+        self.render()
+        return 'break'
+
+    def goto(self, index):
+        """Scroll row index into view, a few rows below the top"""
+        self.top = index - self.visible_rows() // 4
+        self.render()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == tk.MOVETO:
+            self.top = int(float(amount) * len(self.rows))
+            self.render()
+        elif unit == tk.PAGES:
+            self.scroll(int(amount) * self.visible_rows())
+        else:
+            self.scroll(int(amount))
+
+    def on_wheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def on_go(self, event=None):
+        try:
+            line = int(self.line_entry.get())
+        except ValueError:
+            self.position.config(text="Not a line number")
+            return
+        self.match = min(max(line, 1), len(self.rows)) - 1 if self.rows else None
+        self.goto(line - 1)
+
+    def on_find(self, event=None):
+        self.cancel_find()
+        text = self.find_entry.get()
+        if not text:
+            return
+        if not self.rows:
+            self.position.config(text="Not found")
+            return
+        start = self.top if self.match is None else self.match + 1
+        self.find_slice(text, start % len(self.rows), 0)
+
+    def find_slice(self, text, start, searched):
+        """Search the next FIND_SLICE rows, going on from start and wrapping
+        around to the top, with searched rows already done; schedules the
+        slice after it, so the window stays responsive"""
+        self.find_job = None
+        total = len(self.rows)
+        first = (start + searched) % total
+        last = min(total, first + FIND_SLICE, first + total - searched)
+        index = find_row(self.rows, text, first, last)
+        searched += last - first
+        if index is not None:
+            self.match = index
+            self.goto(index)
+        elif searched >= total:
+            self.position.config(text="Not found")
+        else:
+            self.position.config(text=f"Searching... {searched * 100 // total}%")
+            self.find_job = self.after(1, self.find_slice, text, start, searched)
+
+    def cancel_find(self):
+        if self.find_job is not None:
+            self.after_cancel(self.find_job)
+            self.find_job = None
@@ -0,0 +1,156 @@
+# lowering.py
+"""IR generation from the AST.
+
+lower() walks a Program and emits the same IntermediateCode the parser
+emits while parsing it: temps and labels are numbered in the same order,
+a shadowing declaration gets the same scope-qualified name (see
+SymbolTable), ints stored in float variables are converted the same way
+and a duplicate declaration emits nothing, as in the parser.
+This lets later stages run again from a stored AST without re-lexing or
+re-parsing.
+Every expression node's operand is set to the operand holding its value.
+"""
+from ir import IntermediateCode, temp_operand, label_operand, NONE, KIND_MASK, CONST
+from symbol_table import SymbolTable
+from syntax_tree import (Block, Declaration, Assignment, Print, If, While, Number, Name,
+                         binary_type)
+
+
+class Lowering:
+    def __init__(self):
+        self.ir = IntermediateCode()
+        self.temp_count = 0
+        self.label_count = 0
+        # Only scopes and IR names are needed, not closed blocks' symbols
+        self.symbol_table = SymbolTable(keep_closed=False)
+
+    def new_temp(self):
+        self.temp_count += 1
+        return temp_operand(self.temp_count)
+
+    def new_label(self):
+        self.label_count += 1
+        return label_operand(self.label_count)
+
+    def var(self, name):
+        symbol = self.symbol_table.lookup(name)
+        return self.ir.var(symbol.ir_name if symbol else name)
+
+    def store(self, name, node):
+        """Emit name = the value of node, converted as Parser.stored() does"""
+        ir = self.ir
+        symbol = self.symbol_table.lookup(name)
+        value = node.operand
+        if symbol is not None and symbol.type == 'float' and node.type == 'int':
+            if value & KIND_MASK == CONST:
+                value = ir.const(float(ir.value(value)))
+            else:
+                converted = self.new_temp()
+                ir.emit('+', value, ir.const(0.0), converted)
+                value = converted
+        ir.emit('=', value, NONE, self.var(name))
+
+    def lower(self, program):
+        """Emit the IR of a Program (or any statement node)"""
+        statements = getattr(program, 'statements', None)
+        for statement in statements if statements is not None else (program,):
+            self.statement(statement)
+        return self.ir
+
+    def statement(self, node):
+        """Emit the IR of a statement node and the statements nested in it"""
+        # Blocks may nest deeper than Python's recursion limit, so each
+        # statement is a generator yielding its nested statements, driven
+        # from an explicit stack
+        stack = [self.visit(node)]
+        while stack:
+            nested = next(stack[-1], None)
+            if nested is None:
+                stack.pop()
+            else:
+                stack.append(self.visit(nested))
+
+    def visit(self, node):
+        ir = self.ir
+        kind = type(node)
+        if kind is Assignment:
+            self.expression(node.value)
+            self.store(node.name, node.value)
+        elif kind is Declaration:
+            if node.init is not None:
+                self.expression(node.init)
+            if self.symbol_table.insert(node.name, node.var_type):
+                if node.init is not None:
+                    self.store(node.name, node.init)
+                elif node.var_type == 'float' and len(self.symbol_table.scope_stack) == 1:
+                    ir.emit('=', ir.const(0.0), NONE, self.var(node.name))
+        elif kind is Print:
+            ir.emit('print', self.expression(node.value))
+        elif kind is If:
+            false_label = self.condition(node.condition)
+            yield node.then
+            if node.otherwise is not None:
+                end_label = self.new_label()
+                ir.emit('goto', end_label)
+                ir.emit('label', false_label)
+                yield node.otherwise
+                ir.emit('label', end_label)
+            else:
+                ir.emit('label', false_label)
+        elif kind is While:
+            start_label = self.new_label()
+            ir.emit('label', start_label)
+            false_label = self.condition(node.condition)
+            yield node.body
+            ir.emit('goto', start_label)
+            ir.emit('label', false_label)
+        elif kind is Block:
+            self.symbol_table.enter_scope()
+            yield from node.statements
+            self.symbol_table.exit_scope()
+        else:
+            raise TypeError(f"Not a statement node: {node!r}")
+
+    def condition(self, node):
+        """Emit the comparison and its if_false; returns the false label"""
+        left = self.expression(node.left)
+        right = self.expression(node.right)
+        node.operand = self.new_temp()
+        self.ir.emit(node.op, left, right, node.operand)
+        node.false_label = self.new_label()
+        self.ir.emit('if_false', node.operand, node.false_label)
+        return node.false_label
+
+    def expression(self, node):
+        # Post-order over an explicit stack: a long chain of binary
+        # operators nests deeper than Python's recursion limit
+        ir = self.ir
+        operands = []
+        stack = [(node, False)]
+        while stack:
+            node, operands_done = stack.pop()
+            kind = type(node)
+            if kind is Number:
+                node.operand = ir.const(node.value)
+            elif kind is Name:
+                symbol = self.symbol_table.lookup(node.name)
+                node.type = symbol.type if symbol else None
+                node.operand = ir.var(symbol.ir_name if symbol else node.name)
+            elif not operands_done:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+                continue
+            else:
+                right = operands.pop()
+                left = operands.pop()
+                node.type = binary_type(node.left.type, node.right.type)
+                node.operand = self.new_temp()
+                ir.emit(node.op, left, right, node.operand)
+            operands.append(node.operand)
+        return operands.pop()
+
+
+def lower(program):
+    """IntermediateCode of an AST"""
+    return Lowering().lower(program)
@@ -0,0 +1,506 @@
+# optimizer.py
+"""Optimization passes over the three-address code.
+
+The optimizer sits between Parser.parse and CodeGenerator.generate. Each
+pass takes a Program (the instructions of an IntermediateCode as mutable
+[op, arg1, arg2, result] lists) and rewrites it in place. Passes are
+registered by name with register_pass, and an optimization level selects
+which ones run:
+
+    -O0  nothing
+    -O1  one round of folding, copy propagation, dead and unreachable code
+         removal and jump threading
+    -O2  the -O1 passes plus common-subexpression elimination, repeated
+         until the code stops shrinking
+
+Variables are treated as global storage that print can observe, so only
+temps (each assigned exactly once by the parser) are ever deleted as dead.
+"""
+import time
+
+from ir import (IntermediateCode, OPCODE, OPCODES, OP_ASSIGN, OP_LABEL, OP_GOTO,
+                OP_IF_FALSE, OP_PRINT, KIND_BITS, KIND_MASK, NONE, TEMP, VAR, CONST)
+from vm import divide
+
+OPT_LEVELS = (0, 1, 2)
+MAX_ROUNDS = 8
+
+ARITHMETIC = {OPCODE[op] for op in ('+', '-', '*', '/', '%')}
+COMPARISONS = {OPCODE[op] for op in ('<', '<=', '>', '>=', '==', '!=')}
+BINARY = ARITHMETIC | COMPARISONS
+COMMUTATIVE = {OPCODE[op] for op in ('+', '*', '==', '!=')}
+JUMPS = (OP_GOTO, OP_IF_FALSE)
+
+OP_ADD = OPCODE['+']
+OP_SUB = OPCODE['-']
+OP_MUL = OPCODE['*']
+OP_DIV = OPCODE['/']
+
+
+def _is_temp(operand):
+    return operand & KIND_MASK == TEMP
+
+
+def _jump_target(inst):
+    """The label operand an instruction jumps to, or None"""
+    op = inst[0]
+    if op == OP_GOTO:
+        return inst[1]
+    if op == OP_IF_FALSE:
+        return inst[2]
+    return None
+
+
+def _set_jump_target(inst, label):
+    if inst[0] == OP_GOTO:
+        inst[1] = label
+    else:
+        inst[2] = label
+
+
+def _uses(inst):
+    """Operands an instruction reads"""
+    op = inst[0]
+    if op == OP_ASSIGN or op == OP_PRINT or op == OP_IF_FALSE:
+        return (inst[1],)
+    if op in BINARY:
+        return (inst[1], inst[2])
+    return ()
+
+
+def _defines(inst):
+    """The operand an instruction writes, or NONE"""
+    if inst[0] == OP_ASSIGN or inst[0] in BINARY:
+        return inst[3]
+    return NONE
+
+
+def _rewrite_uses(inst, replace):
+    """Replace the operands inst reads through replace(operand)"""
+    op = inst[0]
+    if op == OP_ASSIGN or op == OP_PRINT or op == OP_IF_FALSE:
+        inst[1] = replace(inst[1])
+    elif op in BINARY:
+        inst[1] = replace(inst[1])
+        inst[2] = replace(inst[2])
+
+
+def evaluate(op, a, b):
+    """Fold a binary operation on constant values, or return None.
+
+    Division and remainder are vm.divide, so folding matches run time;
+    comparisons yield 1 or 0. Division by zero is left for run time.
+    """
+    name = OPCODES[op]
+    if name == '+':
+        return a + b
+    if name == '-':
+        return a - b
+    if name == '*':
+        return a * b
+    if name in ('/', '%'):
+        if b == 0:
+            return None
+        return divide(a, b, name == '%')
+    if name == '<':
+        return int(a < b)
+    if name == '<=':
+        return int(a <= b)
+    if name == '>':
+        return int(a > b)
+    if name == '>=':
+        return int(a >= b)
+    if name == '==':
+        return int(a == b)
+    if name == '!=':
+        return int(a != b)
+    return None
+
+
+class Program:
+    """Working copy of an IntermediateCode that passes edit in place"""
+
+    def __init__(self, ir):
+        # Passes may intern new constants, so work on a copy of the tables
+        self.ir = IntermediateCode()
+        self.ir.names = list(ir.names)
+        self.ir.name_index = dict(ir.name_index)
+        self.ir.constants = list(ir.constants)
+        self.ir.constant_index = dict(ir.constant_index)
+        self.code = [[op, arg1, arg2, result]
+                     for op, arg1, arg2, result in zip(ir.ops, ir.arg1, ir.arg2, ir.result)]
+
+    def constant(self, operand):
+        """(True, value) for a constant operand, else (False, None)"""
+        if operand & KIND_MASK == CONST:
+            return True, self.ir.constants[operand >> KIND_BITS]
+        return False, None
+
+    def to_ir(self):
+        ir = self.ir
+        for op, arg1, arg2, result in self.code:
+            ir.ops.append(op)
+            ir.arg1.append(arg1)
+            ir.arg2.append(arg2)
+            ir.result.append(result)
+        return ir
+
+
+PASSES = {}
+
+
+def register_pass(name):
+    """Decorator adding a pass function(program) to the registry"""
+    def register(func):
+        PASSES[name] = func
+        return func
+    return register
+
+
+@register_pass('constant_folding')
+def fold_constants(program):
+    """Propagate constants within basic blocks and fold what they feed.
+
+    Also applies the identities x+0, x-0, x*1 and x/1, and turns an
+    if_false on a constant into a goto or nothing.
+    """
+    ir = program.ir
+    constant = program.constant
+    known = {}
+    code = []
+
+    def replace(operand):
+        return known.get(operand, operand)
+
+    for inst in program.code:
+        op = inst[0]
+        if op == OP_LABEL:
+            known.clear()
+            code.append(inst)
+            continue
+        _rewrite_uses(inst, replace)
+
+        if op in BINARY:
+            is_a, a = constant(inst[1])
+            is_b, b = constant(inst[2])
+            value = evaluate(op, a, b) if is_a and is_b else None
+            if value is not None:
+                inst[:] = [OP_ASSIGN, ir.const(value), NONE, inst[3]]
+            elif is_b and isinstance(b, int) and (
+                    (b == 0 and op in (OP_ADD, OP_SUB)) or (b == 1 and op in (OP_MUL, OP_DIV))):
+                inst[:] = [OP_ASSIGN, inst[1], NONE, inst[3]]
+            elif is_a and isinstance(a, int) and (
+                    (a == 0 and op == OP_ADD) or (a == 1 and op == OP_MUL)):
+                inst[:] = [OP_ASSIGN, inst[2], NONE, inst[3]]
+        elif op == OP_IF_FALSE:
+            is_constant, value = constant(inst[1])
+            if is_constant:
+                if value:
+                    continue
+                inst[:] = [OP_GOTO, inst[2], NONE, NONE]
+
+        target = _defines(inst)
+        if target != NONE:
+            known.pop(target, None)
+            if inst[0] == OP_ASSIGN and inst[1] & KIND_MASK == CONST:
+                known[target] = inst[1]
+        if inst[0] == OP_GOTO or inst[0] == OP_IF_FALSE:
+            known.clear()
+        code.append(inst)
+
+    program.code = code
+
+
+@register_pass('copy_propagation')
+def propagate_copies(program):
+    """Forward copies within basic blocks, then fold single-use temps into
+    the assignment that consumes them.
+
+    After 't2 = x' later reads of t2 use x (until x is reassigned), and
+    't3 = a + b; x = t3' becomes 'x = a + b' when t3 has no other use.
+    """
+    copies = {}
+    # source -> destinations whose copy is invalidated when source changes
+    dependents = {}
+
+    def replace(operand):
+        return copies.get(operand, operand)
+
+    for inst in program.code:
+        op = inst[0]
+        if op == OP_LABEL:
+            copies.clear()
+            dependents.clear()
+            continue
+        _rewrite_uses(inst, replace)
+
+        target = _defines(inst)
+        if target != NONE:
+            copies.pop(target, None)
+            for dependent in dependents.pop(target, ()):
+                copies.pop(dependent, None)
+            source = inst[1]
+            if op == OP_ASSIGN and source != target and source & KIND_MASK in (TEMP, VAR) \
+                    and (_is_temp(target) or not _is_temp(source)):
+                # Copies into variables only forward other variables, so temps
+                # do not stay live past the statement that made them
+                copies[target] = source
+                dependents.setdefault(source, []).append(target)
+        if op == OP_GOTO or op == OP_IF_FALSE:
+            copies.clear()
+            dependents.clear()
+
+    uses = {}
+    for inst in program.code:
+        for operand in _uses(inst):
+            if _is_temp(operand):
+                uses[operand] = uses.get(operand, 0) + 1
+
+    code = []
+    for inst in program.code:
+        if (inst[0] == OP_ASSIGN and _is_temp(inst[1]) and uses.get(inst[1]) == 1
+                and code and code[-1][3] == inst[1] and _defines(code[-1]) == inst[1]):
+            code[-1][3] = inst[3]
+            continue
+        code.append(inst)
+    program.code = code
+
+
+@register_pass('cse')
+def eliminate_common_subexpressions(program):
+    """Reuse the result of an identical computation earlier in the block"""
+    available = {}
+    # result -> its expression key, and operand -> keys that read it
+    computed = {}
+    readers = {}
+
+    for inst in program.code:
+        op = inst[0]
+        if op == OP_LABEL or op == OP_GOTO or op == OP_IF_FALSE:
+            available.clear()
+            computed.clear()
+            readers.clear()
+            continue
+
+        key = None
+        if op in BINARY:
+            a, b = inst[1], inst[2]
+            if op in COMMUTATIVE and b < a:
+                a, b = b, a
+            key = (op, a, b)
+            previous = available.get(key)
+            if previous is not None and previous != inst[3]:
+                inst[:] = [OP_ASSIGN, previous, NONE, inst[3]]
+                key = None
+
+        target = _defines(inst)
+        if target != NONE:
+            # Forget expressions that read the target or were stored in it
+            for stale in readers.pop(target, ()):
+                if available.get(stale) is not None:
+                    computed.pop(available.pop(stale), None)
+            stale = computed.pop(target, None)
+            if stale is not None:
+                available.pop(stale, None)
+            if key is not None and target != key[1] and target != key[2]:
+                available[key] = target
+                computed[target] = key
+                readers.setdefault(key[1], []).append(key)
+                readers.setdefault(key[2], []).append(key)
+
+
+@register_pass('dead_code')
+def eliminate_dead_code(program):
+    """Drop temps that are never read, and self-assignments"""
+    code = program.code
+    uses = {}
+    for inst in code:
+        for operand in _uses(inst):
+            if _is_temp(operand):
+                uses[operand] = uses.get(operand, 0) + 1
+
+    # Walk backwards so removing a use can free the definition before it
+    kept = []
+    for inst in reversed(code):
+        target = _defines(inst)
+        if target != NONE and (
+                (_is_temp(target) and not uses.get(target))
+                or (inst[0] == OP_ASSIGN and inst[1] == target)):
+            for operand in _uses(inst):
+                if _is_temp(operand):
+                    uses[operand] -= 1
+            continue
+        kept.append(inst)
+    kept.reverse()
+    program.code = kept
+
+
+@register_pass('unreachable_code')
+def eliminate_unreachable_code(program):
+    """Drop labels nothing jumps to and code that follows a goto until the
+    next label that is still a jump target"""
+    changed = True
+    code = program.code
+    while changed:
+        targets = {_jump_target(inst) for inst in code if inst[0] in JUMPS}
+        kept = []
+        reachable = True
+        for inst in code:
+            op = inst[0]
+            if op == OP_LABEL:
+                if inst[1] not in targets:
+                    continue
+                reachable = True
+            if not reachable:
+                continue
+            kept.append(inst)
+            if op == OP_GOTO:
+                reachable = False
+        changed = len(kept) != len(code)
+        code = kept
+    program.code = code
+
+
+@register_pass('jump_threading')
+def thread_jumps(program):
+    """Merge adjacent labels, send jumps to a 'goto' straight to its
+    target, and drop jumps to the label that immediately follows"""
+    code = program.code
+
+    # Labels placed back to back all stand for the first of them
+    alias = {}
+    first = None
+    for inst in code:
+        if inst[0] == OP_LABEL:
+            if first is None:
+                first = inst[1]
+            else:
+                alias[inst[1]] = first
+        else:
+            first = None
+
+    # Where control goes after arriving at each label
+    forward = {}
+    for i, inst in enumerate(code):
+        if inst[0] == OP_LABEL:
+            j = i + 1
+            while j < len(code) and code[j][0] == OP_LABEL:
+                j += 1
+            if j < len(code) and code[j][0] == OP_GOTO:
+                forward[inst[1]] = code[j][1]
+
+    def resolve(label):
+        seen = set()
+        label = alias.get(label, label)
+        while label in forward and label not in seen:
+            seen.add(label)
+            label = alias.get(forward[label], forward[label])
+        return label
+
+    for inst in code:
+        if inst[0] in JUMPS:
+            _set_jump_target(inst, resolve(_jump_target(inst)))
+
+    # A jump to the very next label does nothing
+    kept = []
+    for i, inst in enumerate(code):
+        if inst[0] in JUMPS:
+            j = i + 1
+            falls_through = False
+            while j < len(code) and code[j][0] == OP_LABEL:
+                if code[j][1] == _jump_target(inst):
+                    falls_through = True
+                    break
+                j += 1
+            if falls_through:
+                continue
+        kept.append(inst)
+    program.code = kept
+
+
+LEVEL_PASSES = {
+    0: (),
+    1: ('constant_folding', 'copy_propagation', 'jump_threading', 'unreachable_code', 'dead_code'),
+    2: ('constant_folding', 'cse', 'copy_propagation', 'jump_threading', 'unreachable_code',
+        'dead_code'),
+}
+
+
+class PassStats:
+    """Instruction counts and time taken by one run of one pass"""
+
+    __slots__ = ('name', 'before', 'after', 'seconds')
+
+    def __init__(self, name, before, after, seconds):
+        self.name = name
+        self.before = before
+        self.after = after
+        self.seconds = seconds
+
+    def to_dict(self):
+        return {'pass': self.name, 'before': self.before, 'after': self.after,
+                'seconds': self.seconds}
+
+
+class Optimizer:
+    """Runs the passes of an optimization level over an IntermediateCode.
+
+    passes overrides the level's pass list with registered pass names.
+    stats holds a PassStats per pass run by the last optimize() call.
+    """
+
+    def __init__(self, level=1, passes=None):
+        if level not in OPT_LEVELS:
+            raise ValueError(f"Unknown optimization level: {level}")
+        self.level = level
+        self.passes = tuple(passes) if passes is not None else LEVEL_PASSES[level]
+        for name in self.passes:
+            if name not in PASSES:
+                raise ValueError(f"Unknown optimization pass: {name}")
+        self.stats = []
+
+    def optimize(self, ir):
+        self.stats = []
+        if not self.passes:
+            return ir
+
+        program = Program(ir)
+        rounds = MAX_ROUNDS if self.level >= 2 else 1
+        for _ in range(rounds):
+            previous = [tuple(inst) for inst in program.code]
+            for name in self.passes:
+                before = len(program.code)
+                start = time.perf_counter()
+                PASSES[name](program)
+                self.stats.append(PassStats(name, before, len(program.code),
+                                            time.perf_counter() - start))
+            if [tuple(inst) for inst in program.code] == previous:
+                break
+        return program.to_ir()
+
+    def report(self):
+        """Instruction counts before and after the last optimize() call and
+        per-pass totals over all rounds, or None if no pass ran"""
+        if not self.stats:
+            return None
+        totals = {}
+        for stat in self.stats:
+            total = totals.setdefault(stat.name, {'pass': stat.name, 'runs': 0, 'removed': 0,
+                                                  'seconds': 0.0})
+            total['runs'] += 1
+            total['removed'] += stat.before - stat.after
+            total['seconds'] += stat.seconds
+        return {
+            'before': self.stats[0].before,
+            'after': self.stats[-1].after,
+            'passes': list(totals.values()),
+        }
+
+
+def format_report(report):
+    """Render Optimizer.report() as text lines"""
+    lines = [f"Optimized {report['before']} -> {report['after']} instructions"]
+    for total in report['passes']:
+        lines.append(f"  {total['pass']:<18} -{total['removed']:<7} "
+                     f"{total['runs']} run(s)  {total['seconds'] * 1000:8.2f} ms")
+    return lines
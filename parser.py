@@ -1,50 +1,242 @@
 # parser.py
-import ply.yacc as yacc
-
-from lexer import Lexer, ScopeTrackingLexer
+from lexer import Lexer, RecordingLexer, TokenFeed
 from symbol_table import SymbolTable
+from ir import IntermediateCode, temp_operand, label_operand, NONE, KIND_MASK, CONST
+from syntax_tree import (Program, Block, Declaration, Assignment, Print, If, While, Number,
+                         Name, Binary, Condition, binary_type)
+
+# Bump whenever the grammar changes so stale parse tables are never reused
+GRAMMAR_VERSION = 4
+TABLE_MODULE = f"parsetab_v{GRAMMAR_VERSION}"
+
+
+def format_instruction(inst):
+    """Render one intermediate code instruction as shown in the GUI"""
+    op = inst['op']
+    arg1 = inst['arg1']
+    arg2 = inst['arg2']
+    result = inst['result']
+
+    if op == '=':
+        return f"{result} = {arg1}"
+    elif op in ['+', '-', '*', '/', '%']:
+        return f"{result} = {arg1} {op} {arg2}"
+    elif op == 'label':
+        return f"{arg1}:"
+    elif op == 'goto':
+        return f"goto {arg1}"
+    elif op == 'if_false':
+        return f"if_false {arg1} goto {arg2}"
+    elif op == 'print':
+        return f"print {arg1}"
+    else:
+        return f"{result} = {arg1} {op} {arg2}"
+
 
 class Parser:
     tokens = Lexer.tokens
 
     def __init__(self):
         self.symbol_table = SymbolTable()
-        self.intermediate_code = []
+        self.ir = IntermediateCode()
+        self.temp_count = 0
+        self.label_count = 0
+        self.errors = []
+        self.parse_tree = []
+        # When set, consumer(statement, ir) takes each top-level statement
+        # as it is parsed (see parse())
+        self.consumer = None
+        self.parser = None
+        self.lexer = None
+
+    @property
+    def ast(self):
+        """The Program node of the last parse, or None if it had to give up"""
+        return self.parse_tree[-1] if self.parse_tree else None
+
+    @property
+    def intermediate_code(self):
+        """The emitted code in the list-of-dicts format"""
+        return self.ir.to_dicts()
+
+    def reset(self):
+        """Reset the per-compile state, keeping the built parser and lexer"""
+        self.symbol_table = SymbolTable()
+        self.ir = IntermediateCode()
         self.temp_count = 0
         self.label_count = 0
         self.errors = []
         self.parse_tree = []
 
+    # Grammar values for temps, labels, variables and constants are encoded
+    # IR operands (see ir.py); self.ir.value() turns one back into its text
+
     def new_temp(self):
         self.temp_count += 1
-        return f"t{self.temp_count}"
+        return temp_operand(self.temp_count)
 
     def new_label(self):
         self.label_count += 1
-        return f"L{self.label_count}"
+        return label_operand(self.label_count)
 
-    def emit(self, op, arg1=None, arg2=None, result=None):
-        code = {'op': op, 'arg1': arg1, 'arg2': arg2, 'result': result}
-        self.intermediate_code.append(code)
+    def emit(self, op, arg1=NONE, arg2=NONE, result=NONE):
+        self.ir.emit(op, arg1, arg2, result)
         return result
 
     def backpatch(self, code_list, label):
-        """Backpatch a list of instructions with a label"""
-        for code in code_list:
-            if code['arg2'] == 'BACKPATCH':
-                code['arg2'] = label
+        """Point the jump target of the instructions at the given indices
+        to label, unless they already have one"""
+        arg2 = self.ir.arg2
+        for index in code_list:
+            if arg2[index] == NONE:
+                arg2[index] = label
+
+    # Semantic actions, shared with the recursive-descent backend (descent.py).
+    # Each builds the AST node for its construct (see syntax_tree.py) and
+    # emits its IR; expression nodes carry the operand holding their value.
+
+    def declare(self, var_type, var_name, init, line, position):
+        """Declare var_name, assigning it the value of init if given"""
+        node = Declaration(var_type, var_name, init, line, position)
+        # Check if variable already declared in current scope
+        if self.symbol_table.lookup_current_scope(var_name):
+            self.errors.append(f"Variable '{var_name}' already declared in current scope")
+        elif init is None:
+            self.symbol_table.insert(var_name, var_type)
+            symbol = self.symbol_table.lookup(var_name)
+            if var_type == 'float' and symbol.depth == 0:
+                # Every variable starts out as int 0; globals are zeroed, as in C
+                self.emit('=', self.ir.const(0.0), NONE, self.var(symbol, var_name))
+        else:
+            self.symbol_table.insert(var_name, var_type, self.ir.value(init.operand))
+            symbol = self.symbol_table.lookup(var_name)
+            self.emit('=', self.stored(symbol, init), NONE, self.var(symbol, var_name))
+        return node
+
+    def var(self, symbol, name):
+        """Operand of the variable symbol declares (name if undeclared)"""
+        return self.ir.var(symbol.ir_name if symbol else name)
+
+    def stored(self, symbol, expr):
+        """Operand of expr's value as stored in symbol's variable: an int
+        stored in a float variable is converted, folded for a constant"""
+        if symbol is None or symbol.type != 'float' or expr.type != 'int':
+            return expr.operand
+        if expr.operand & KIND_MASK == CONST:
+            return self.ir.const(float(self.ir.value(expr.operand)))
+        return self.emit('+', expr.operand, self.ir.const(0.0), self.new_temp())
+
+    def assign(self, var_name, expr, line, position):
+        symbol = self.symbol_table.lookup(var_name)
+        if not symbol:
+            self.errors.append(f"Variable '{var_name}' not declared")
+
+        self.emit('=', self.stored(symbol, expr), NONE, self.var(symbol, var_name))
+        return Assignment(var_name, expr, line, position)
+
+    def print_value(self, expr, line, position):
+        self.emit('print', expr.operand)
+        return Print(expr, line, position)
+
+    def binary(self, op, left, right, line, position):
+        """Emit left op right into a new temp"""
+        node = Binary(op, left, right, line, position)
+        node.type = binary_type(left.type, right.type)
+        node.operand = self.emit(op, left.operand, right.operand, self.new_temp())
+        return node
+
+    def number(self, value, line, position):
+        node = Number(value, line, position)
+        node.operand = self.ir.const(value)
+        return node
+
+    def variable(self, name, line, position):
+        symbol = self.symbol_table.lookup(name)
+        if not symbol:
+            self.errors.append(f"Variable '{name}' not declared")
+        node = Name(name, line, position)
+        node.type = symbol.type if symbol else None
+        node.operand = self.var(symbol, name)
+        return node
+
+    def condition(self, relop, left, right):
+        """Emit the comparison and the conditional jump past the guarded code"""
+        node = Condition(relop, left, right, left.line, left.position)
+        node.operand = self.emit(relop, left.operand, right.operand, self.new_temp())
+        # Emit conditional jump right after condition
+        node.false_label = self.new_label()
+        self.emit('if_false', node.operand, node.false_label)
+        return node
+
+    def else_jump(self, condition):
+        """Between the then block and ELSE: skip the else block when the
+        then block ran, and start the else block at the false label"""
+        end_label = self.new_label()
+        self.emit('goto', end_label)
+        self.emit('label', condition.false_label)
+        return end_label
+
+    def end_if(self, condition, then, otherwise, end_label, line, position):
+        # The condition already emitted 'if_false t goto false_label'
+        self.emit('label', end_label if otherwise is not None else condition.false_label)
+        return If(condition, then, otherwise, line, position)
+
+    def add_statement(self, statements, statement):
+        # Appended in place: building a new list per statement made parsing
+        # quadratic in the length of a statement list
+        statements.append(statement)
+        return statements
+
+    def top_statement(self, statements, statement):
+        """A top-level statement is complete. When streaming, hand it and
+        its IR to the consumer instead of keeping either."""
+        if self.consumer is None:
+            statements.append(statement)
+            return statements
+        ir = self.ir
+        self.ir = ir.continuation()
+        self.consumer(statement, ir)
+        return statements
+
+    def end_program(self, statements):
+        """The Program node, or None when its statements were streamed"""
+        if self.consumer is not None:
+            return None
+        node = Program(statements, statements[0].line, statements[0].position)
+        self.parse_tree.append(node)
+        return node
+
+    def loop_label(self):
+        label = self.new_label()
+        self.emit('label', label)
+        return label
+
+    def end_while(self, start_label, condition, body, line, position):
+        # Jump back to start, then the exit label
+        self.emit('goto', start_label)
+        self.emit('label', condition.false_label)
+        return While(condition, body, line, position)
 
     # Grammar rules
     def p_program(self, p):
-        '''program : statement_list'''
-        p[0] = ('program', p[1])
-        self.parse_tree.append(p[0])
+        '''program : program_body'''
+        p[0] = self.end_program(p[1])
+
+    def p_program_body(self, p):
+        '''program_body : program_body statement
+                        | statement'''
+        # The top-level statement list, apart from statement_list so that
+        # a top-level statement is known to be complete when it is reduced
+        if len(p) == 3:
+            p[0] = self.top_statement(p[1], p[2])
+        else:
+            p[0] = self.top_statement([], p[1])
 
     def p_statement_list(self, p):
         '''statement_list : statement_list statement
                          | statement'''
         if len(p) == 3:
-            p[0] = p[1] + [p[2]]
+            p[0] = self.add_statement(p[1], p[2])
         else:
             p[0] = [p[1]]
 
@@ -60,21 +252,7 @@ class Parser:
     def p_declaration(self, p):
         '''declaration : type ID SEMICOLON
                       | type ID ASSIGN expression SEMICOLON'''
-        var_type = p[1]
-        var_name = p[2]
-
-        # Check if variable already declared in current scope
-        if self.symbol_table.lookup_current_scope(var_name):
-            self.errors.append(f"Variable '{var_name}' already declared in current scope")
-        else:
-            if len(p) == 4:
-                self.symbol_table.insert(var_name, var_type)
-                p[0] = ('declaration', var_type, var_name)
-            else:
-                value = p[4]
-                self.symbol_table.insert(var_name, var_type, value)
-                self.emit('=', value, None, var_name)
-                p[0] = ('declaration_init', var_type, var_name, value)
+        p[0] = self.declare(p[1], p[2], p[4] if len(p) == 6 else None, p.lineno(2), p.lexpos(2))
 
     def p_type(self, p):
         '''type : INT
@@ -83,76 +261,47 @@ class Parser:
 
     def p_assignment(self, p):
         '''assignment : ID ASSIGN expression SEMICOLON'''
-        var_name = p[1]
-        expr = p[3]
-
-        if not self.symbol_table.lookup(var_name):
-            self.errors.append(f"Variable '{var_name}' not declared")
-
-        self.emit('=', expr, None, var_name)
-        p[0] = ('assignment', var_name, expr)
+        p[0] = self.assign(p[1], p[3], p.lineno(1), p.lexpos(1))
 
     def p_print_statement(self, p):
         '''print_statement : PRINT LPAREN expression RPAREN SEMICOLON'''
-        self.emit('print', p[3], None, None)
-        p[0] = ('print', p[3])
+        p[0] = self.print_value(p[3], p.lineno(1), p.lexpos(1))
 
     def p_if_statement(self, p):
-        '''if_statement : IF LPAREN condition RPAREN m_label block n_label
-                       | IF LPAREN condition RPAREN m_label block n_label ELSE m_label block'''
-        # Basic handling of labels; labels are created by m_label and n_label helpers.
-        if len(p) == 8:  # Simple if
-            false_label = p[5]
-            self.emit('label', false_label, None, None)
-        else:  # if-else (len == 11)
-            false_label = p[5]
-            end_label = p[9]
-            self.emit('label', false_label, None, None)
-            self.emit('label', end_label, None, None)
-
-        p[0] = ('if', p[3])
+        '''if_statement : IF LPAREN condition RPAREN block
+                       | IF LPAREN condition RPAREN block else_jump ELSE block'''
+        # if-else: else_jump placed false_label before the else block
+        if len(p) == 9:
+            p[0] = self.end_if(p[3], p[5], p[8], p[6], p.lineno(1), p.lexpos(1))
+        else:
+            p[0] = self.end_if(p[3], p[5], None, None, p.lineno(1), p.lexpos(1))
 
     def p_while_statement(self, p):
-        '''while_statement : WHILE m_label LPAREN condition RPAREN m_label block n_label'''
-        start_label = p[2]
-        exit_label = p[6]
-
-        # Jump back to start
-        self.emit('goto', start_label, None, None)
-        # Exit label
-        self.emit('label', exit_label, None, None)
-
-        p[0] = ('while', p[4])
+        '''while_statement : WHILE m_label LPAREN condition RPAREN block'''
+        p[0] = self.end_while(p[2], p[4], p[6], p.lineno(1), p.lexpos(1))
 
     def p_m_label(self, p):
         '''m_label : '''
-        # Create a new label and emit it
-        label = self.new_label()
-        self.emit('label', label, None, None)
-        p[0] = label
+        p[0] = self.loop_label()
 
-    def p_n_label(self, p):
-        '''n_label : '''
-        # Create a label for later use (for goto)
-        label = self.new_label()
-        # Don't emit yet, will be used for jumps
-        self.emit('goto', label, None, None)
-        p[0] = label
+    def p_else_jump(self, p):
+        '''else_jump : '''
+        # Reduced between the then block and ELSE
+        p[0] = self.else_jump(p[-3])
 
     def p_block(self, p):
-        '''block : LBRACE statement_list RBRACE'''
-        p[0] = ('block', p[2])
+        '''block : LBRACE enter_scope statement_list RBRACE'''
+        self.symbol_table.exit_scope()
+        p[0] = Block(p[3], p.lineno(1), p.lexpos(1))
+
+    def p_enter_scope(self, p):
+        '''enter_scope : '''
+        # Reduced right after '{' is shifted, before any statement in the block
+        p[0] = self.symbol_table.enter_scope()
 
     def p_condition(self, p):
         '''condition : expression relop expression'''
-        temp = self.new_temp()
-        self.emit(p[2], p[1], p[3], temp)
-
-        # Emit conditional jump right after condition
-        false_label = self.new_label()
-        self.emit('if_false', temp, false_label, None)
-
-        p[0] = (temp, false_label)
+        p[0] = self.condition(p[2], p[1], p[3])
 
     def p_relop(self, p):
         '''relop : LT
@@ -166,9 +315,7 @@ class Parser:
     def p_expression_binop(self, p):
         '''expression : expression PLUS term
                      | expression MINUS term'''
-        temp = self.new_temp()
-        self.emit(p[2], p[1], p[3], temp)
-        p[0] = temp
+        p[0] = self.binary(p[2], p[1], p[3], p.lineno(2), p.lexpos(2))
 
     def p_expression_term(self, p):
         '''expression : term'''
@@ -178,9 +325,7 @@ class Parser:
         '''term : term TIMES factor
                | term DIVIDE factor
                | term MODULO factor'''
-        temp = self.new_temp()
-        self.emit(p[2], p[1], p[3], temp)
-        p[0] = temp
+        p[0] = self.binary(p[2], p[1], p[3], p.lineno(2), p.lexpos(2))
 
     def p_term_factor(self, p):
         '''term : factor'''
@@ -189,13 +334,11 @@ class Parser:
     def p_factor_number(self, p):
         '''factor : NUMBER
                  | FLOAT_NUM'''
-        p[0] = p[1]
+        p[0] = self.number(p[1], p.lineno(1), p.lexpos(1))
 
     def p_factor_id(self, p):
         '''factor : ID'''
-        if not self.symbol_table.lookup(p[1]):
-            self.errors.append(f"Variable '{p[1]}' not declared")
-        p[0] = p[1]
+        p[0] = self.variable(p[1], p.lineno(1), p.lexpos(1))
 
     def p_factor_paren(self, p):
         '''factor : LPAREN expression RPAREN'''
@@ -207,19 +350,71 @@ class Parser:
         else:
             self.errors.append("Syntax error at EOF")
 
-    def build(self):
-        self.parser = yacc.yacc(module=self)
-
-    def parse(self, data):
-        self.intermediate_code = []
-        self.temp_count = 0
-        self.label_count = 0
-        self.errors = []
-        self.parse_tree = []
-
-        # Create a custom lexer that tracks scopes
-        lexer = ScopeTrackingLexer(self.symbol_table)
-        lexer.build()
+    def build(self, tabmodule=TABLE_MODULE, debug=False, lexer_backend='ply', quiet=False,
+              **kwargs):
+        # Imported here, so that importing the parser does not load PLY
+        import ply.yacc as yacc
+
+        if quiet:
+            # Suppress PLY's grammar warnings (e.g. unused tokens)
+            kwargs['errorlog'] = yacc.NullLogger()
+        # Tables are written to (and on later runs read back from) the
+        # versioned tabmodule, so only the first build pays for LALR generation
+        self.parser = yacc.yacc(module=self, tabmodule=tabmodule, debug=debug, **kwargs)
+        # PLY reduces the empty m_label/n_label/enter_scope rules without
+        # reading a lookahead; during error recovery that re-pushes the state
+        # it just popped, looping forever on inputs such as 'if (x) y = 1;'
+        self.parser.disable_defaulted_states()
+
+        # The lexer is built once and reset on every parse
+        self.lexer = RecordingLexer()
+        self.lexer.build(lexer_backend)
+
+    def rule_actions(self):
+        """(owner, attribute) of the callable run for each grammar rule
+        reduction, for instrumentation (see profiling.py)"""
+        return [(production, 'callable') for production in self.parser.productions
+                if production.callable is not None]
+
+    def parse(self, data, record_tokens=False, symbol_table=None, cancel=None, consumer=None):
+        """Parse data; with record_tokens the scanned tokens and lexical
+        errors are kept in self.lexer.tokens_list / self.lexer.errors.
+
+        A pre-populated symbol_table may be passed in to parse a fragment
+        of a larger program. Setting the optional cancel event from another
+        thread makes the parse raise CompileCancelled.
+
+        With a consumer, the parse streams: consumer(statement, ir) is
+        called as soon as each top-level statement is reduced, with its
+        AST node and an IntermediateCode of just its instructions (sharing
+        the name and constant tables of the others). Neither is kept, so
+        no Program is built and memory depends on the largest statement
+        rather than on the program. Before a syntax error PLY has already
+        discarded, a chunk may hold part of a statement, as the whole-
+        program IR would.
+        """
+        self.reset()
+        if symbol_table is not None:
+            self.symbol_table = symbol_table
+        self.consumer = consumer
+        self.lexer.reset(record_tokens, cancel)
+
+        result = self.parser.parse(data, lexer=self.lexer.lexer)
+        if record_tokens:
+            self.lexer.drain()
+        return result
 
-        result = self.parser.parse(data, lexer=lexer.lexer)
+    def parse_stream(self, tokens, symbol_table=None, cancel=None, consumer=None):
+        """Parse an iterable of Token tuples, e.g. StreamingLexer.tokens(),
+        reading each token only when the parser asks for it; consumer is
+        as for parse()"""
+        self.reset()
+        if symbol_table is not None:
+            self.symbol_table = symbol_table
+        self.consumer = consumer
+        feed = TokenFeed(tokens, cancel)
+        result = self.parser.parse(lexer=feed)
+        # Run the stream to its end so its lexical errors are all collected
+        while feed.token():
+            pass
         return result
\ No newline at end of file
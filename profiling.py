@@ -0,0 +1,287 @@
+# profiling.py
+"""Per-phase instrumentation of the compile pipeline.
+
+A Profile passed to CompilerSession.compile() (or IncrementalCompiler)
+records, for every phase of that compile, its wall and CPU time and, if
+tracemalloc is tracing, the peak traced memory while it ran. It also
+counts tokens, grammar productions, symbol-table lookups and
+instructions. The instrumentation (timed token calls, counting rule
+actions, a counting symbol table) is only swapped in for a profiled
+compile, so unprofiled compiles pay nothing for it.
+
+Lexing runs interleaved with parsing, one token at a time; its
+accumulated time is reported as a 'lex' phase of its own, just before
+'parse', which is the rest of the parse.
+
+Profile.to_dict() is plain data (as in the JSON lines output of
+batch.py); merge_profiles() totals several, format_profile() renders one
+as text and chrome_trace() turns a list of them into Chrome's trace event
+format (chrome://tracing, Perfetto).
+"""
+import os
+import time
+# The C core of tracemalloc: all a Profile needs, without the snapshot
+# classes and the pickle and linecache imports that come with them
+import _tracemalloc as tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from symbol_table import SymbolTable
+
+# CPU time of the calling thread; the GUI compiles on a worker thread
+_cpu_time = getattr(time, 'thread_time', time.process_time)
+
+
+class PhaseStats:
+    """Time (and peak traced memory) of one phase; start is seconds since
+    the profile began"""
+
+    __slots__ = ('name', 'start', 'wall', 'cpu', 'peak_memory')
+
+    def __init__(self, name, start, wall, cpu, peak_memory=None):
+        self.name = name
+        self.start = start
+        self.wall = wall
+        self.cpu = cpu
+        self.peak_memory = peak_memory
+
+    def to_dict(self):
+        return {'phase': self.name, 'start': self.start, 'wall': self.wall, 'cpu': self.cpu,
+                'peak_memory': self.peak_memory}
+
+
+class CountingSymbolTable(SymbolTable):
+    """SymbolTable counting its lookups into counters['symbol_lookups']"""
+
+    def __init__(self, counters):
+        super().__init__()
+        self.counters = counters
+        counters.setdefault('symbol_lookups', 0)
+
+    def lookup(self, name):
+        self.counters['symbol_lookups'] += 1
+        return super().lookup(name)
+
+    def lookup_current_scope(self, name):
+        self.counters['symbol_lookups'] += 1
+        return super().lookup_current_scope(name)
+
+
+class _Timed:
+    """Wraps a function, accumulating the wall and CPU time spent in it"""
+
+    __slots__ = ('function', 'wall', 'cpu')
+
+    def __init__(self, function):
+        self.function = function
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def __call__(self):
+        wall = time.perf_counter()
+        cpu = _cpu_time()
+        try:
+            return self.function()
+        finally:
+            self.cpu += _cpu_time() - cpu
+            self.wall += time.perf_counter() - wall
+
+
+@contextmanager
+def _counting_calls(targets, counters, name):
+    """Count calls of the callables at (owner, attribute) in targets"""
+    counters.setdefault(name, 0)
+    saved = []
+    for owner, attribute in targets:
+        function = getattr(owner, attribute)
+        saved.append((owner, attribute, function, attribute in vars(owner)))
+
+        def counted(*args, function=function):
+            counters[name] += 1
+            return function(*args)
+        setattr(owner, attribute, counted)
+    try:
+        yield
+    finally:
+        for owner, attribute, function, own in saved:
+            if own:
+                setattr(owner, attribute, function)
+            else:
+                delattr(owner, attribute)
+
+
+class Profile:
+    """Timings and counts of one compile"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.phases = []
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        mark = self.mark()
+        try:
+            yield
+        finally:
+            self.record(name, mark)
+
+    def mark(self):
+        """Start timing a phase that record() ends, for phases that do not
+        fit a with block"""
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        return time.perf_counter(), _cpu_time(), tracing
+
+    def record(self, name, mark):
+        wall, cpu, tracing = mark
+        cpu = _cpu_time() - cpu
+        end = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1] if tracing else None
+        self.phases.append(PhaseStats(name, wall - self.origin, end - wall, cpu, peak))
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def symbol_table(self):
+        """A SymbolTable whose lookups are counted in this profile"""
+        return CountingSymbolTable(self.counters)
+
+    def counting_productions(self, parser):
+        """Count the productions parser (PLY or descent backend) recognizes
+        while the context is open"""
+        return _counting_calls(parser.rule_actions(), self.counters, 'productions')
+
+    @contextmanager
+    def parsing(self, parser):
+        """Profile one parse by parser (PLY or descent backend): its token
+        reads as 'lex', the rest as 'parse', its productions, and the
+        lookups in the symbol table yielded for the parse to use"""
+        lexer = parser.lexer
+        timed = _Timed(lexer.original_token)
+        lexer.original_token = timed
+        try:
+            with self.counting_productions(parser):
+                with self.phase('parse'):
+                    yield self.symbol_table()
+        finally:
+            lexer.original_token = timed.function
+            # Split the token reads out of the parse phase
+            parse = self.phases[-1]
+            self.phases[-1:] = [
+                PhaseStats('lex', parse.start, timed.wall, timed.cpu, parse.peak_memory),
+                PhaseStats('parse', parse.start + timed.wall, parse.wall - timed.wall,
+                           parse.cpu - timed.cpu, parse.peak_memory),
+            ]
+
+    @property
+    def wall(self):
+        return sum(phase.wall for phase in self.phases)
+
+    @property
+    def cpu(self):
+        return sum(phase.cpu for phase in self.phases)
+
+    @property
+    def peak_memory(self):
+        """Peak traced memory over all phases, or None if none was traced"""
+        peaks = [phase.peak_memory for phase in self.phases if phase.peak_memory is not None]
+        return max(peaks) if peaks else None
+
+    def to_dict(self):
+        return {
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'peak_memory': self.peak_memory,
+            'phases': [phase.to_dict() for phase in self.phases],
+            'counters': dict(self.counters),
+            'origin': self.origin,
+            'pid': self.pid,
+        }
+
+
+def phase_timer(profile):
+    """profile.phase, or a no-op stand-in when profile is None"""
+    if profile is not None:
+        return profile.phase
+    return _unprofiled
+
+
+def _unprofiled(name):
+    return nullcontext()
+
+
+def merge_profiles(profiles):
+    """Total several Profile.to_dict() results: times and counters are
+    summed per phase / counter name, peak memory is the largest"""
+    phases = {}
+    counters = {}
+    peaks = []
+    for profile in profiles:
+        for phase in profile['phases']:
+            total = phases.setdefault(phase['phase'], {'phase': phase['phase'], 'wall': 0.0,
+                                                       'cpu': 0.0, 'peak_memory': None})
+            total['wall'] += phase['wall']
+            total['cpu'] += phase['cpu']
+            if phase['peak_memory'] is not None:
+                total['peak_memory'] = max(total['peak_memory'] or 0, phase['peak_memory'])
+        for name, value in profile['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+        if profile['peak_memory'] is not None:
+            peaks.append(profile['peak_memory'])
+    return {
+        'wall': sum(phase['wall'] for phase in phases.values()),
+        'cpu': sum(phase['cpu'] for phase in phases.values()),
+        'peak_memory': max(peaks) if peaks else None,
+        'phases': list(phases.values()),
+        'counters': counters,
+    }
+
+
+def _format_bytes(size):
+    if size is None:
+        return "-"
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def format_profile(profile):
+    """Render Profile.to_dict() (or merge_profiles()) as text lines"""
+    lines = [f"{'Phase':<16} {'wall ms':>10} {'cpu ms':>10} {'peak mem':>10}"]
+    for phase in profile['phases']:
+        lines.append(f"{phase['phase']:<16} {phase['wall'] * 1000:10.2f} {phase['cpu'] * 1000:10.2f} "
+                     f"{_format_bytes(phase['peak_memory']):>10}")
+    lines.append(f"{'total':<16} {profile['wall'] * 1000:10.2f} {profile['cpu'] * 1000:10.2f} "
+                 f"{_format_bytes(profile['peak_memory']):>10}")
+    if profile['peak_memory'] is None:
+        lines.append("(peak memory is only measured while tracemalloc is tracing)")
+    lines.append("")
+    lines.extend(f"{name.replace('_', ' '):<24} {value}" for name, value in profile['counters'].items())
+    return lines
+
+
+def chrome_trace(profiles, names=None):
+    """Chrome trace-event data for Profile.to_dict() results, one slice per
+    phase under one slice per compile; names labels each compile"""
+    if not profiles:
+        return {'traceEvents': []}
+    base = min(profile['origin'] for profile in profiles)
+    events = []
+    for n, profile in enumerate(profiles):
+        name = names[n] if names is not None else f"compile {n + 1}"
+        origin = profile['origin'] - base
+        end = max((phase['start'] + phase['wall'] for phase in profile['phases']), default=0.0)
+        events.append({'name': name, 'cat': 'compile', 'ph': 'X', 'ts': origin * 1e6,
+                       'dur': end * 1e6, 'pid': profile['pid'], 'tid': profile['pid'],
+                       'args': dict(profile['counters'])})
+        for phase in profile['phases']:
+            events.append({'name': phase['phase'], 'cat': 'phase', 'ph': 'X',
+                           'ts': (origin + phase['start']) * 1e6, 'dur': phase['wall'] * 1e6,
+                           'pid': profile['pid'], 'tid': profile['pid'],
+                           'args': {'cpu_ms': phase['cpu'] * 1000,
+                                    'peak_memory': phase['peak_memory']}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
@@ -0,0 +1,129 @@
+# semantic.py
+"""Semantic analysis over the AST, separate from parsing.
+
+SemanticAnalyzer walks a Program with its own SymbolTable, scoped the way
+the parser scopes it, and
+
+- resolves the type of every expression node: 'int' when all its
+  operands are int, 'float' when any is, None when it uses an
+  undeclared name;
+- reports the same undeclared / duplicate declaration errors as the
+  parser, in the same order;
+- reports type mismatches as warnings: a float value stored in an int
+  variable, and '%' applied to a float.
+
+Run after lower() (or on the parser's own AST), declarations with an
+initializer record the operand text of their value in the symbol table,
+as the parser's do.
+"""
+from symbol_table import SymbolTable
+from syntax_tree import (Block, Declaration, Assignment, Print, If, While, Number, Name, Condition,
+                         binary_type)
+
+
+class SemanticAnalyzer:
+    def __init__(self, symbol_table=None, ir=None):
+        """symbol_table may hold names declared before the analyzed code;
+        ir, if given, resolves the operands recorded as symbol values"""
+        self.symbol_table = symbol_table if symbol_table is not None else SymbolTable()
+        self.ir = ir
+        self.errors = []
+        self.warnings = []
+
+    def analyze(self, program):
+        """Analyze a Program (or any statement node); returns self"""
+        statements = getattr(program, 'statements', None)
+        for statement in statements if statements is not None else (program,):
+            self.statement(statement)
+        return self
+
+    def statement(self, node):
+        """Analyze a statement node and the statements nested in it"""
+        # Blocks may nest deeper than Python's recursion limit, so each
+        # statement is a generator yielding its nested statements, driven
+        # from an explicit stack
+        stack = [self.visit(node)]
+        while stack:
+            nested = next(stack[-1], None)
+            if nested is None:
+                stack.pop()
+            else:
+                stack.append(self.visit(nested))
+
+    def visit(self, node):
+        kind = type(node)
+        if kind is Assignment:
+            value_type = self.expression(node.value)
+            symbol = self.symbol_table.lookup(node.name)
+            if not symbol:
+                self.errors.append(f"Variable '{node.name}' not declared")
+            else:
+                self.check_store(symbol.type, value_type, node)
+        elif kind is Declaration:
+            value_type = self.expression(node.init) if node.init is not None else None
+            if self.symbol_table.lookup_current_scope(node.name):
+                self.errors.append(f"Variable '{node.name}' already declared in current scope")
+                return
+            value = None
+            if node.init is not None:
+                if self.ir is not None and node.init.operand is not None:
+                    value = self.ir.value(node.init.operand)
+                self.check_store(node.var_type, value_type, node)
+            self.symbol_table.insert(node.name, node.var_type, value)
+        elif kind is Print:
+            self.expression(node.value)
+        elif kind is If:
+            self.expression(node.condition)
+            yield node.then
+            if node.otherwise is not None:
+                yield node.otherwise
+        elif kind is While:
+            self.expression(node.condition)
+            yield node.body
+        elif kind is Block:
+            self.symbol_table.enter_scope()
+            yield from node.statements
+            self.symbol_table.exit_scope()
+        else:
+            raise TypeError(f"Not a statement node: {node!r}")
+
+    def check_store(self, target_type, value_type, node):
+        if target_type == 'int' and value_type == 'float':
+            self.warnings.append(f"Type mismatch: float value stored in int variable "
+                                 f"'{node.name}' (line {node.line})")
+
+    def expression(self, node):
+        """Set and return the type of an expression node"""
+        # Post-order over an explicit stack: a long chain of binary
+        # operators nests deeper than Python's recursion limit
+        types = []
+        stack = [(node, False)]
+        while stack:
+            node, operands_done = stack.pop()
+            kind = type(node)
+            if kind is Number:
+                types.append(node.type)
+            elif kind is Name:
+                symbol = self.symbol_table.lookup(node.name)
+                if not symbol:
+                    self.errors.append(f"Variable '{node.name}' not declared")
+                node.type = symbol.type if symbol else None
+                types.append(node.type)
+            elif not operands_done:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+            else:
+                right = types.pop()
+                left = types.pop()
+                if kind is not Condition:
+                    if node.op == '%' and 'float' in (left, right):
+                        self.warnings.append(f"Type mismatch: '%' applied to a float (line {node.line})")
+                    node.type = binary_type(left, right)
+                types.append(node.type)
+        return types.pop()
+
+
+def analyze(program, symbol_table=None, ir=None):
+    """Run a SemanticAnalyzer over program and return it"""
+    return SemanticAnalyzer(symbol_table, ir).analyze(program)
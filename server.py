@@ -0,0 +1,440 @@
+# server.py
+"""Persistent compile server.
+
+A long-running asyncio daemon for editors, graders and other tools that
+would otherwise pay for importing the compiler and building its lexer and
+parser tables on every run. It speaks JSON-RPC 2.0, one JSON message per
+line, over stdio or a Unix socket. Requests on a connection are served
+concurrently and answered as they finish, matched up by id.
+
+Methods (params in braces; opt_level and registers are optional):
+    compile      {source, opt_level, registers} -> {ok, cached, errors, warnings,
+                 symbols, intermediate_code, assembly}
+    tokenize     {source} -> {tokens, errors}
+    diagnostics  {source, opt_level, registers} -> {ok, errors, warnings}
+    stats        {} -> request, reply cache and worker counters
+    shutdown     {} -> null; the server stops once in-flight requests are answered
+
+Compiles run on a pool of worker processes (a single thread with --jobs 1),
+each holding a CompilerSession whose tables are built when the server
+starts. Finished replies are kept, serialized, in an LRU keyed on the exact
+source, so a repeated request is answered on the event loop without
+reaching a worker, and identical requests in flight share one compile.
+Workers share compile results through the disk tier of a CompileCache
+with --cache-dir.
+
+Usage:
+    python server.py [--socket PATH] [--jobs N] [--cache-dir DIR]
+                     [--lexer ply|fast] [--parser ply|descent]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import signal
+import stat
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from parser import format_instruction
+from session import CompilerSession, PARSER_BACKENDS
+from cache import CompileCache
+from lexer import BACKENDS
+from optimizer import OPT_LEVELS
+from codegen import CodeGenerator, DEFAULT_REGISTERS, SCRATCH_REGISTERS
+
+# Longest request line accepted, and bytes of serialized replies kept
+MAX_MESSAGE = 64 * 1024 * 1024
+REPLY_CACHE_BYTES = 64 * 1024 * 1024
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+# Methods answered by a worker, and the options each one takes
+WORKER_METHODS = {'compile': True, 'tokenize': False, 'diagnostics': True}
+
+# Per-worker compiler session, created by _init_worker
+_session = None
+
+
+class RequestError(Exception):
+    """A request that gets a JSON-RPC error response"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def _init_worker(cache_dir=None, lexer_backend='ply', parser_backend='ply'):
+    global _session
+    _session = CompilerSession(quiet=True, cache=CompileCache(disk_dir=cache_dir),
+                               lexer_backend=lexer_backend, parser_backend=parser_backend)
+    _session.build()
+
+
+def _serve(method, source, opt_level=0, registers=DEFAULT_REGISTERS):
+    """Answer one worker method in the current worker; returns the result
+    serialized as JSON, so the event loop never has to encode it"""
+    session = _session
+    if method == 'tokenize':
+        tokens, errors = session.tokenize(source)
+        return json.dumps({'tokens': tokens, 'errors': errors})
+
+    if session.opt_level != opt_level:
+        session.opt_level = opt_level
+    if len(session.code_generator.registers) != registers:
+        session.code_generator = CodeGenerator(registers)
+    result = session.compile(source)
+    errors = result.all_errors
+    reply = {'ok': not errors, 'errors': errors, 'warnings': result.warnings}
+    if method == 'compile':
+        reply['cached'] = result.cached
+        reply['symbols'] = result.symbols
+        reply['intermediate_code'] = [format_instruction(inst)
+                                      for inst in result.intermediate_code]
+        reply['assembly'] = result.assembly
+    return json.dumps(reply)
+
+
+def _warm():
+    """Submitted once per worker at startup, so that every worker process is
+    started, and has built its session, before the first request"""
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def parse_params(method, params):
+    """Validate the params of a worker method; returns the arguments of _serve"""
+    if not isinstance(params, dict):
+        raise RequestError(INVALID_PARAMS, "params must be an object")
+    source = params.get('source')
+    if not isinstance(source, str):
+        raise RequestError(INVALID_PARAMS, "params.source must be a string")
+    if not WORKER_METHODS[method]:
+        return (method, source)
+
+    opt_level = params.get('opt_level', 0)
+    if opt_level not in OPT_LEVELS or isinstance(opt_level, bool):
+        raise RequestError(INVALID_PARAMS, f"params.opt_level must be one of {list(OPT_LEVELS)}")
+    registers = params.get('registers', DEFAULT_REGISTERS)
+    if not isinstance(registers, int) or isinstance(registers, bool) or registers <= SCRATCH_REGISTERS:
+        raise RequestError(INVALID_PARAMS,
+                           f"params.registers must be an integer above {SCRATCH_REGISTERS}")
+    return (method, source, opt_level, registers)
+
+
+def reply_key(args):
+    """Reply cache key of a worker call: the method, its options and a hash
+    of the exact source (token positions depend on every character)"""
+    digest = hashlib.sha256(args[1].encode('utf-8', 'surrogatepass')).hexdigest()
+    return (args[0], digest) + args[2:]
+
+
+def _is_pipe(stream):
+    """Whether the event loop can watch stream: a pipe, socket or tty
+    rather than a regular file"""
+    mode = os.fstat(stream.fileno()).st_mode
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode)
+
+
+class _FileWriter:
+    """The parts of a StreamWriter that serve_connection uses, writing
+    through to a regular file (which the event loop cannot watch); each
+    reply is small, so a blocking write and flush is fine"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.stream.flush()
+
+
+async def _feed_file(stream, reader):
+    """Feed a regular file into reader, reading off the event loop"""
+    loop = asyncio.get_running_loop()
+    while True:
+        data = await loop.run_in_executor(None, stream.read1, 64 * 1024)
+        if not data:
+            break
+        reader.feed_data(data)
+    reader.feed_eof()
+
+
+class CompileServer:
+    """Serves JSON-RPC requests from any number of connections"""
+
+    def __init__(self, jobs=None, cache_dir=None, lexer_backend='ply', parser_backend='ply',
+                 reply_cache_bytes=REPLY_CACHE_BYTES):
+        self.jobs = jobs or os.cpu_count() or 1
+        initargs = (cache_dir, lexer_backend, parser_backend)
+        if self.jobs == 1:
+            # Sessions are not thread-safe: one thread, in this process
+            _init_worker(*initargs)
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker,
+                                                initargs=initargs)
+        # key -> result JSON, least recently used first
+        self.replies = OrderedDict()
+        self.reply_bytes = 0
+        self.reply_cache_bytes = reply_cache_bytes
+        # key -> future of a worker call in flight
+        self.pending = {}
+        # Requests being answered, on all connections, and the open
+        # connections as (handler task, writer)
+        self.tasks = set()
+        self.open = set()
+        self.stopping = asyncio.Event()
+        self.started = time.monotonic()
+        self.counts = {}
+        self.reply_hits = 0
+        self.shared = 0
+        self.misses = 0
+        self.errors = 0
+        self.connections = 0
+
+    async def warm_up(self):
+        """Start every worker and build its tables before serving"""
+        if self.jobs > 1:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self.executor, _warm)
+                                   for _ in range(self.jobs)))
+
+    def close(self):
+        self.executor.shutdown()
+
+    # Requests
+
+    async def handle_line(self, line):
+        """The response line to one request line, or None for a notification
+        (a request without an id), which is never answered, not even with an
+        error. Only a line that is not JSON, or not a JSON object, gets an
+        error with a null id."""
+        request = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise RequestError(PARSE_ERROR, f"parse error: {e}")
+            if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' \
+                    or not isinstance(request.get('method'), str):
+                raise RequestError(INVALID_REQUEST, "not a JSON-RPC 2.0 request")
+            result = await self.dispatch(request['method'], request.get('params', {}))
+        except RequestError as e:
+            error = {'code': e.code, 'message': str(e)}
+        except Exception as e:
+            error = {'code': INTERNAL_ERROR, 'message': f"{type(e).__name__}: {e}"}
+        else:
+            if 'id' not in request:
+                return None
+            # The result is already JSON; splice it in rather than re-encoding it
+            return f'{{"jsonrpc": "2.0", "id": {json.dumps(request["id"])}, "result": {result}}}'
+        self.errors += 1
+        if not isinstance(request, dict):
+            return json.dumps({'jsonrpc': '2.0', 'id': None, 'error': error})
+        if 'id' not in request:
+            return None
+        return json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'error': error})
+
+    async def dispatch(self, method, params):
+        """Run one method; returns its result as JSON text"""
+        self.counts[method] = self.counts.get(method, 0) + 1
+        if method in WORKER_METHODS:
+            return await self.call_worker(parse_params(method, params))
+        if method == 'stats':
+            return json.dumps(self.stats())
+        if method == 'shutdown':
+            self.stopping.set()
+            return 'null'
+        raise RequestError(METHOD_NOT_FOUND, f"unknown method {method!r}")
+
+    async def call_worker(self, args):
+        key = reply_key(args)
+        reply = self.replies.get(key)
+        if reply is not None:
+            self.replies.move_to_end(key)
+            self.reply_hits += 1
+            return reply
+
+        future = self.pending.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, _serve, *args)
+        self.pending[key] = future
+        try:
+            reply = await asyncio.shield(future)
+        finally:
+            del self.pending[key]
+        self._remember(key, reply)
+        return reply
+
+    def _remember(self, key, reply):
+        if len(reply) > self.reply_cache_bytes:
+            return
+        self.replies[key] = reply
+        self.reply_bytes += len(reply)
+        while self.reply_bytes > self.reply_cache_bytes:
+            _, evicted = self.replies.popitem(last=False)
+            self.reply_bytes -= len(evicted)
+
+    def stats(self):
+        return {
+            'uptime': time.monotonic() - self.started,
+            'workers': self.jobs,
+            'connections': self.connections,
+            'requests': dict(self.counts),
+            'errors': self.errors,
+            'reply_hits': self.reply_hits,
+            'shared': self.shared,
+            'misses': self.misses,
+            'in_flight': len(self.pending),
+            'reply_entries': len(self.replies),
+            'reply_bytes': self.reply_bytes,
+        }
+
+    # Connections
+
+    async def serve_connection(self, reader, writer):
+        """Answer the requests on one connection until it closes; each
+        request is its own task, so a slow compile does not hold up the
+        requests behind it"""
+        self.connections += 1
+        connection = (asyncio.current_task(), writer)
+        self.open.add(connection)
+        tasks = set()
+
+        async def respond(line):
+            response = await self.handle_line(line)
+            if response is not None:
+                writer.write(response.encode('utf-8') + b"\n")
+                await writer.drain()
+
+        try:
+            while not self.stopping.is_set():
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_MESSAGE; the stream cannot be resynchronized
+                    error = {'code': INVALID_REQUEST, 'message': "request too large"}
+                    writer.write(json.dumps({'jsonrpc': '2.0', 'id': None,
+                                             'error': error}).encode('utf-8') + b"\n")
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(respond(line))
+                    for group in (tasks, self.tasks):
+                        group.add(task)
+                        task.add_done_callback(group.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.connections -= 1
+            self.open.discard(connection)
+            writer.close()
+
+    async def finish(self):
+        """Answer the requests still in flight, then close every connection"""
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        handlers = [handler for handler, writer in self.open]
+        for _, writer in list(self.open):
+            # The handler reads the end of its stream and returns
+            writer.close()
+        if handlers:
+            await asyncio.gather(*handlers, return_exceptions=True)
+
+    async def serve_socket(self, path):
+        server = await asyncio.start_unix_server(self.serve_connection, path, limit=MAX_MESSAGE)
+        await self.stopping.wait()
+        server.close()
+        await self.finish()
+
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=MAX_MESSAGE)
+        feeding = None
+        if _is_pipe(sys.stdin):
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        else:
+            feeding = asyncio.ensure_future(_feed_file(sys.stdin.buffer, reader))
+        if _is_pipe(sys.stdout):
+            transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin,
+                                                                sys.stdout)
+            writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        else:
+            writer = _FileWriter(sys.stdout.buffer)
+        # Stop at the end of input, or after a shutdown request
+        connection = asyncio.ensure_future(self.serve_connection(reader, writer))
+        stopping = asyncio.ensure_future(self.stopping.wait())
+        await asyncio.wait([connection, stopping], return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if feeding is not None:
+            feeding.cancel()
+        await self.finish()
+
+
+async def serve(socket_path=None, **options):
+    server = CompileServer(**options)
+    # Stop as after a shutdown request, so worker processes are shut down too
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.stopping.set)
+    try:
+        await server.warm_up()
+        if socket_path is None:
+            await server.serve_stdio()
+        else:
+            print(f"Serving on {socket_path} with {server.jobs} workers", file=sys.stderr)
+            await server.serve_socket(socket_path)
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Serve compiles over JSON-RPC")
+    arg_parser.add_argument('--socket', help="listen on this Unix socket instead of stdio")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None,
+                            help="worker processes (default: all cores; 1 compiles on a thread)")
+    arg_parser.add_argument('--cache-dir',
+                            help="share compile results between workers and runs through this directory")
+    arg_parser.add_argument('--lexer', choices=BACKENDS, default='ply',
+                            help="lexer backend; 'fast' scans with one regex instead of PLY")
+    arg_parser.add_argument('--parser', choices=sorted(PARSER_BACKENDS), default='ply',
+                            help="parser backend; 'descent' is hand-written instead of PLY's LALR")
+    args = arg_parser.parse_args(argv)
+
+    # Generate the lexer and parse table modules once so workers only ever
+    # read them; backends that do not use PLY have no tables to generate
+    CompilerSession(quiet=True, lexer_backend=args.lexer, parser_backend=args.parser).build()
+    if args.socket and os.path.exists(args.socket):
+        os.remove(args.socket)
+    try:
+        asyncio.run(serve(args.socket, jobs=args.jobs, cache_dir=args.cache_dir,
+                          lexer_backend=args.lexer, parser_backend=args.parser))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+# session.py
+from lexer import Lexer, StreamingLexer, BACKENDS
+from parser import Parser, GRAMMAR_VERSION
+from descent import DescentParser
+from codegen import CodeGenerator, DEFAULT_REGISTERS
+from ir import IntermediateCode
+from optimizer import Optimizer
+from lowering import lower
+from semantic import SemanticAnalyzer, analyze
+from symbol_table import SymbolTable
+from profiling import phase_timer
+
+# Bump whenever the IR or assembly produced for a program changes, so
+# cached compile results from older compilers are not reused
+COMPILER_VERSION = 7
+CACHE_VERSION = f"{COMPILER_VERSION}.{GRAMMAR_VERSION}"
+
+PARSER_BACKENDS = {'ply': Parser, 'descent': DescentParser}
+
+
+class CompileResult:
+    """Everything produced by one run of the compiler pipeline.
+
+    intermediate_code may be given as an IntermediateCode or in the dict
+    format; the other form is built on first use.
+    """
+
+    def __init__(self, tokens, lex_errors, symbols, intermediate_code, assembly, errors):
+        self.tokens = tokens
+        self.lex_errors = lex_errors
+        self.symbols = symbols
+        if isinstance(intermediate_code, IntermediateCode):
+            self._ir = intermediate_code
+            self._intermediate_code = None
+        else:
+            self._ir = None
+            self._intermediate_code = intermediate_code
+        self.assembly = assembly
+        self.errors = errors
+        # Type mismatches found by the semantic pass; they do not stop a compile
+        self.warnings = []
+        # The Program node parsed from the source, if this compile parsed it
+        self.ast = None
+        self.cached = False
+        # Optimizer.report() of the passes that produced intermediate_code
+        self.optimization = None
+        # CodeGenerator.report() of the register allocation behind assembly
+        self.allocation = None
+        # The Profile passed to the compile that produced this result, if any
+        self.profile = None
+
+    @property
+    def ir(self):
+        if self._ir is None:
+            self._ir = IntermediateCode.from_dicts(self._intermediate_code)
+        return self._ir
+
+    @property
+    def intermediate_code(self):
+        if self._intermediate_code is None:
+            self._intermediate_code = self._ir.to_dicts()
+        return self._intermediate_code
+
+    @property
+    def all_errors(self):
+        return self.lex_errors + self.errors
+
+    def to_dict(self):
+        return {
+            'tokens': self.tokens,
+            'lex_errors': self.lex_errors,
+            'symbols': self.symbols,
+            'intermediate_code': self.intermediate_code,
+            'assembly': self.assembly,
+            'errors': self.errors,
+            'warnings': self.warnings,
+        }
+
+    def cache_entry(self):
+        """The parts of the result stored in a CompileCache (copied, so later
+        changes to this result never leak into the cache)"""
+        return {
+            'lex_errors': list(self.lex_errors),
+            'symbols': [dict(symbol) for symbol in self.symbols],
+            'ir': self.ir.copy(),
+            'assembly': list(self.assembly),
+            'errors': list(self.errors),
+            'warnings': list(self.warnings),
+        }
+
+    @classmethod
+    def from_cache(cls, tokens, entry):
+        result = cls(
+            tokens=tokens,
+            lex_errors=list(entry['lex_errors']),
+            symbols=[dict(symbol) for symbol in entry['symbols']],
+            intermediate_code=entry['ir'].copy(),
+            assembly=list(entry['assembly']),
+            errors=list(entry['errors']),
+        )
+        result.warnings = list(entry['warnings'])
+        result.cached = True
+        return result
+
+
+class CompilerSession:
+    """Builds the lexer and parser tables once and reuses them across compiles.
+
+    Only the per-compile state (symbol table, intermediate code, counters,
+    errors and register assignments) is reset between runs. With a
+    CompileCache, previously seen sources skip parsing and code generation.
+    opt_level selects the optimizer passes run between parsing and code
+    generation (see optimizer.py); registers is the number of registers the
+    code generator allocates (see codegen.py). lexer_backend picks the
+    scanner, 'ply' or 'fast' (see lexer.py); both give the same tokens.
+    parser_backend picks PLY's LALR parser ('ply') or the hand-written one
+    ('descent', see descent.py); both give the same results.
+
+    The lexer and parser are built on first use, so creating a session is
+    cheap and the fast and descent backends never import PLY at all;
+    build() builds them up front.
+    """
+
+    def __init__(self, quiet=False, cache=None, opt_level=0, registers=DEFAULT_REGISTERS,
+                 lexer_backend='ply', parser_backend='ply'):
+        if lexer_backend not in BACKENDS:
+            raise ValueError(f"Unknown lexer backend {lexer_backend!r}; expected one of {BACKENDS}")
+        self.quiet = quiet
+        self.cache = cache
+        self.optimizer = Optimizer(opt_level)
+        self.lexer_backend = lexer_backend
+        self.parser_class = PARSER_BACKENDS[parser_backend]
+        self._lexer = None
+        self._parser = None
+        self.code_generator = CodeGenerator(registers)
+
+    @property
+    def lexer(self):
+        """The Lexer behind tokenize(), built on first use"""
+        if self._lexer is None:
+            lexer = Lexer()
+            lexer.build(self.lexer_backend)
+            self._lexer = lexer
+        return self._lexer
+
+    @property
+    def parser(self):
+        """The parser, built on first use; PLY's tables are read from the
+        versioned table module (see parser.py) or, the very first time,
+        generated into it"""
+        if self._parser is None:
+            parser = self.parser_class()
+            parser.build(lexer_backend=self.lexer_backend, quiet=self.quiet)
+            self._parser = parser
+        return self._parser
+
+    def build(self):
+        """Build the lexer and parser now rather than on first use, e.g. to
+        warm up a long-running process before its first compile"""
+        return self.lexer, self.parser
+
+    def tokenize(self, source_code):
+        """Run only the lexer over source_code"""
+        tokens, lex_errors = self.lexer.tokenize(source_code)
+        return list(tokens), list(lex_errors)
+
+    @property
+    def opt_level(self):
+        return self.optimizer.level
+
+    @opt_level.setter
+    def opt_level(self, level):
+        self.optimizer = Optimizer(level)
+
+    def optimize(self, ir):
+        """Run the optimizer over ir; returns (ir, report)"""
+        optimizer = self.optimizer
+        optimized = optimizer.optimize(ir)
+        return optimized, optimizer.report()
+
+    def generate(self, ir):
+        """Generate assembly for ir; returns (assembly, allocation report)"""
+        assembly = self.code_generator.generate(ir)
+        return list(assembly), self.code_generator.report()
+
+    def compile(self, source_code, cancel=None, profile=None):
+        """Compile source_code; raises CompileCancelled if the optional
+        cancel event is set before parsing finishes. A Profile (see
+        profiling.py) passed as profile records each phase and is kept
+        as result.profile."""
+        phase = phase_timer(profile)
+        key = None
+        if self.cache is not None:
+            # Imported here: hashing is only needed with a cache
+            from cache import cache_key
+            with phase('cache'):
+                options = f"-O{self.opt_level}-R{len(self.code_generator.registers)}"
+                key = cache_key(source_code, CACHE_VERSION + options)
+                entry = self.cache.get(key)
+            if entry is not None:
+                # Token positions depend on the exact text, so re-lex only
+                with phase('lex'):
+                    tokens, _ = self.tokenize(source_code)
+                result = CompileResult.from_cache(tokens, entry)
+                if profile is not None:
+                    profile.count('tokens', len(tokens))
+                    profile.count('instructions', len(result.ir))
+                    profile.count('assembly_lines', len(result.assembly))
+                    result.profile = profile
+                return result
+
+        # Single pass: the parser's lexer records the tokens it hands out
+        if profile is None:
+            self.parser.parse(source_code, record_tokens=True, cancel=cancel)
+        else:
+            with profile.parsing(self.parser) as symbol_table:
+                self.parser.parse(source_code, record_tokens=True, symbol_table=symbol_table,
+                                  cancel=cancel)
+        ast = self.parser.ast
+        with phase('optimize'):
+            ir, report = self.optimize(self.parser.ir)
+        with phase('codegen'):
+            assembly, allocation = self.generate(ir)
+
+        result = CompileResult(
+            tokens=self.parser.lexer.tokens_list,
+            lex_errors=self.parser.lexer.errors,
+            symbols=self.parser.symbol_table.get_all(),
+            intermediate_code=ir,
+            assembly=assembly,
+            errors=list(self.parser.errors),
+        )
+        if ast is not None:
+            with phase('analyze'):
+                symbol_table = profile.symbol_table() if profile is not None else None
+                result.warnings = analyze(ast, symbol_table).warnings
+        result.ast = ast
+        result.optimization = report
+        result.allocation = allocation
+        if key is not None:
+            with phase('cache'):
+                self.cache.put(key, result.cache_entry())
+        if profile is not None:
+            profile.count('tokens', len(result.tokens))
+            profile.count('ir_instructions', len(self.parser.ir))
+            profile.count('instructions', len(ir))
+            profile.count('assembly_lines', len(assembly))
+            result.profile = profile
+        return result
+
+    def compile_ast(self, program):
+        """Run the stages after parsing on an AST, e.g. the ast of an
+        earlier result: lowering to IR, semantic analysis, optimization
+        and code generation. No tokens are involved, so result.tokens and
+        result.lex_errors are empty."""
+        ir = lower(program)
+        analyzer = analyze(program, ir=ir)
+        optimized, report = self.optimize(ir)
+        assembly, allocation = self.generate(optimized)
+
+        result = CompileResult(
+            tokens=[],
+            lex_errors=[],
+            symbols=analyzer.symbol_table.get_all(),
+            intermediate_code=optimized,
+            assembly=assembly,
+            errors=analyzer.errors,
+        )
+        result.warnings = analyzer.warnings
+        result.ast = program
+        result.optimization = report
+        result.allocation = allocation
+        return result
+
+    def compile_stream(self, source, cancel=None):
+        """Compile from a file object or mmap without reading it into one
+        string. Tokens are handed straight to the parser and not kept, so
+        result.tokens is empty; nothing is cached."""
+        lexer = StreamingLexer()
+        self.parser.parse_stream(lexer.tokens(source), cancel=cancel)
+        ast = self.parser.ast
+        ir, report = self.optimize(self.parser.ir)
+        assembly, allocation = self.generate(ir)
+
+        result = CompileResult(
+            tokens=[],
+            lex_errors=lexer.errors,
+            symbols=self.parser.symbol_table.get_all(),
+            intermediate_code=ir,
+            assembly=assembly,
+            errors=list(self.parser.errors),
+        )
+        if ast is not None:
+            result.warnings = analyze(ast).warnings
+        result.ast = ast
+        result.optimization = report
+        result.allocation = allocation
+        return result
+
+    def compile_statements(self, source, consumer, cancel=None):
+        """Compile a program too large to hold whole, one top-level
+        statement at a time. source is a string, or a file object or mmap
+        read as it is lexed; consumer(statement, ir) is called with each
+        statement's AST node and unoptimized IR as soon as it is parsed
+        (see Parser.parse). Only the global symbols and the diagnostics are
+        kept: the result has no tokens, IR, assembly or AST."""
+        analyzer = SemanticAnalyzer(SymbolTable(keep_closed=False))
+
+        def take(statement, ir):
+            analyzer.analyze(statement)
+            consumer(statement, ir)
+
+        symbol_table = SymbolTable(keep_closed=False)
+        if isinstance(source, str):
+            self.parser.parse(source, symbol_table=symbol_table, cancel=cancel, consumer=take)
+            # Collect the lexical errors past a syntax error too
+            self.parser.lexer.drain()
+            lex_errors = self.parser.lexer.errors
+        else:
+            lexer = StreamingLexer()
+            self.parser.parse_stream(lexer.tokens(source), symbol_table=symbol_table,
+                                     cancel=cancel, consumer=take)
+            lex_errors = lexer.errors
+
+        result = CompileResult(
+            tokens=[],
+            lex_errors=lex_errors,
+            symbols=symbol_table.get_all(),
+            intermediate_code=IntermediateCode(),
+            assembly=[],
+            errors=list(self.parser.errors),
+        )
+        result.warnings = analyzer.warnings
+        return result
@@ -1,10 +1,56 @@
 # symbol_table.py
 
+class Symbol:
+    """One declared identifier"""
+
+    __slots__ = ('name', 'type', 'value', 'scope', 'depth', 'ir_name')
+
+    def __init__(self, name, symbol_type, value, scope, depth, ir_name=None):
+        self.name = name
+        self.type = symbol_type
+        self.value = value
+        self.scope = scope
+        # Position of the declaring scope in the scope stack (0 = global)
+        self.depth = depth
+        # The variable's name in the IR; see SymbolTable
+        self.ir_name = ir_name if ir_name is not None else name
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'type': self.type,
+            'value': self.value,
+            'scope': self.scope
+        }
+
+
+def _ir_name(name, depth, visible):
+    return f"{name}@{depth}" if visible else name
+
+
 class SymbolTable:
-    def __init__(self):
-        self.symbols = {}
+    """Scope-chain symbol table.
+
+    Each name maps to a stack of its visible bindings, innermost last, so
+    lookup is a single dict probe however deeply scopes are nested. Leaving
+    a scope pops the bindings it declared. Every symbol ever declared is
+    also kept, in declaration order, for get_all(); with keep_closed=False
+    only global ones are, so the symbols of closed scopes can be freed.
+
+    A declaration that shadows a visible binding of its name gets the IR
+    name name@depth ('@' cannot occur in an identifier), so the variables
+    stay distinct once lowered; any other keeps its plain name.
+    """
+
+    def __init__(self, keep_closed=True):
+        self.keep_closed = keep_closed
         self.scope_stack = ['global']
         self.scope_counter = 0
+        # name -> visible Symbols, ordered by depth (innermost last)
+        self.bindings = {}
+        # Names declared in each open scope, parallel to scope_stack
+        self.declared = [[]]
+        self.entries = []
 
     def enter_scope(self, scope_name=None):
         """Enter a new scope (e.g., entering an if block or while loop)"""
@@ -12,11 +58,22 @@ class SymbolTable:
             self.scope_counter += 1
             scope_name = f"scope_{self.scope_counter}"
         self.scope_stack.append(scope_name)
+        self.declared.append([])
         return scope_name
 
     def exit_scope(self):
         """Exit the current scope"""
         if len(self.scope_stack) > 1:
+            depth = len(self.scope_stack) - 1
+            bindings = self.bindings
+            for name in self.declared.pop():
+                stack = bindings[name]
+                if stack[-1].depth == depth:
+                    stack.pop()
+                else:
+                    stack[:] = [symbol for symbol in stack if symbol.depth != depth]
+                if not stack:
+                    del bindings[name]
             return self.scope_stack.pop()
         return None
 
@@ -26,36 +83,62 @@ class SymbolTable:
 
     def insert(self, name, symbol_type, value=None, scope=None):
         """Insert a symbol into the table"""
+        depth = len(self.scope_stack) - 1
         if scope is None:
-            scope = self.current_scope()
+            scope = self.scope_stack[depth]
+        elif scope != self.scope_stack[depth]:
+            return self._insert_outer(name, symbol_type, value, scope)
 
-        # Check if variable already exists in current scope
-        key = f"{scope}:{name}"
-        if key in self.symbols:
+        stack = self.bindings.get(name)
+        if stack is None:
+            self.bindings[name] = stack = []
+        elif stack[-1].depth == depth:
             return False  # Already declared in this scope
 
-        self.symbols[key] = {
-            'name': name,
-            'type': symbol_type,
-            'value': value,
-            'scope': scope
-        }
+        symbol = Symbol(name, symbol_type, value, scope, depth, _ir_name(name, depth, stack))
+        stack.append(symbol)
+        self.declared[depth].append(name)
+        if depth == 0 or self.keep_closed:
+            self.entries.append(symbol)
+        return True
+
+    def _insert_outer(self, name, symbol_type, value, scope):
+        """Insert into an enclosing (or closed) scope rather than the current one"""
+        if scope not in self.scope_stack:
+            # Not visible from here; only reported by get_all()
+            if any(symbol.name == name and symbol.scope == scope for symbol in self.entries):
+                return False
+            if self.keep_closed:
+                self.entries.append(Symbol(name, symbol_type, value, scope, -1))
+            return True
+
+        depth = self.scope_stack.index(scope)
+        stack = self.bindings.setdefault(name, [])
+        position = len(stack)
+        while position and stack[position - 1].depth >= depth:
+            if stack[position - 1].depth == depth:
+                return False
+            position -= 1
+
+        symbol = Symbol(name, symbol_type, value, scope, depth, _ir_name(name, depth, stack))
+        stack.insert(position, symbol)
+        self.declared[depth].append(name)
+        if depth == 0 or self.keep_closed:
+            self.entries.append(symbol)
         return True
 
     def lookup(self, name):
         """Lookup a symbol, searching from innermost to outermost scope"""
-        for scope in reversed(self.scope_stack):
-            key = f"{scope}:{name}"
-            if key in self.symbols:
-                return self.symbols[key]
-        return None
+        stack = self.bindings.get(name)
+        return stack[-1] if stack else None
 
     def lookup_current_scope(self, name):
         """Lookup a symbol only in the current scope"""
-        scope = self.current_scope()
-        key = f"{scope}:{name}"
-        return self.symbols.get(key)
+        stack = self.bindings.get(name)
+        if stack and stack[-1].depth == len(self.scope_stack) - 1:
+            return stack[-1]
+        return None
 
     def get_all(self):
         """Get all symbols"""
-        return list(self.symbols.values())
\ No newline at end of file
+        return [symbol.to_dict() for symbol in self.entries]
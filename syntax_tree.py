@@ -0,0 +1,167 @@
+# syntax_tree.py
+"""Abstract syntax tree built by both parser backends.
+
+Every node records the line and character position of the token it
+starts at (for a binary expression, its operator). Expression nodes also
+have a type ('int', 'float', or None when it involves an undeclared
+name) and the IR operand holding their value, both set by whichever pass
+last emitted IR for them, the parser or lower(), and the type again by
+the semantic pass.
+"""
+
+
+def binary_type(left, right):
+    """Type of a binary expression with operands of the given types"""
+    if left is None or right is None:
+        return None
+    return 'float' if 'float' in (left, right) else 'int'
+
+
+class Node:
+    __slots__ = ('line', 'position')
+    # Child and attribute slots, in source order, for walking and repr()
+    fields = ()
+
+    def __repr__(self):
+        values = ", ".join(repr(getattr(self, name)) for name in self.fields)
+        return f"{type(self).__name__}({values})"
+
+
+class Program(Node):
+    __slots__ = ('statements',)
+    fields = ('statements',)
+
+    def __init__(self, statements, line, position):
+        self.statements = statements
+        self.line = line
+        self.position = position
+
+
+class Block(Node):
+    __slots__ = ('statements',)
+    fields = ('statements',)
+
+    def __init__(self, statements, line, position):
+        self.statements = statements
+        self.line = line
+        self.position = position
+
+
+class Declaration(Node):
+    """var_type name; or var_type name = init;"""
+
+    __slots__ = ('var_type', 'name', 'init')
+    fields = ('var_type', 'name', 'init')
+
+    def __init__(self, var_type, name, init, line, position):
+        self.var_type = var_type
+        self.name = name
+        self.init = init
+        self.line = line
+        self.position = position
+
+
+class Assignment(Node):
+    __slots__ = ('name', 'value')
+    fields = ('name', 'value')
+
+    def __init__(self, name, value, line, position):
+        self.name = name
+        self.value = value
+        self.line = line
+        self.position = position
+
+
+class Print(Node):
+    __slots__ = ('value',)
+    fields = ('value',)
+
+    def __init__(self, value, line, position):
+        self.value = value
+        self.line = line
+        self.position = position
+
+
+class If(Node):
+    """otherwise is the else Block, or None"""
+
+    __slots__ = ('condition', 'then', 'otherwise')
+    fields = ('condition', 'then', 'otherwise')
+
+    def __init__(self, condition, then, otherwise, line, position):
+        self.condition = condition
+        self.then = then
+        self.otherwise = otherwise
+        self.line = line
+        self.position = position
+
+
+class While(Node):
+    __slots__ = ('condition', 'body')
+    fields = ('condition', 'body')
+
+    def __init__(self, condition, body, line, position):
+        self.condition = condition
+        self.body = body
+        self.line = line
+        self.position = position
+
+
+class Expression(Node):
+    __slots__ = ('type', 'operand')
+
+
+class Number(Expression):
+    __slots__ = ('value',)
+    fields = ('value',)
+
+    def __init__(self, value, line, position):
+        self.value = value
+        self.type = 'int' if isinstance(value, int) else 'float'
+        self.operand = None
+        self.line = line
+        self.position = position
+
+
+class Name(Expression):
+    __slots__ = ('name',)
+    fields = ('name',)
+
+    def __init__(self, name, line, position):
+        self.name = name
+        self.type = None
+        self.operand = None
+        self.line = line
+        self.position = position
+
+
+class Binary(Expression):
+    __slots__ = ('op', 'left', 'right')
+    fields = ('op', 'left', 'right')
+
+    def __init__(self, op, left, right, line, position):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.type = None
+        self.operand = None
+        self.line = line
+        self.position = position
+
+
+class Condition(Expression):
+    """left op right guarding an if or while; operand is the comparison's
+    temp and false_label where the code jumps when it is false"""
+
+    __slots__ = ('op', 'left', 'right', 'false_label')
+    fields = ('op', 'left', 'right')
+
+    def __init__(self, op, left, right, line, position):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.type = 'int'
+        self.operand = None
+        self.false_label = None
+        self.line = line
+        self.position = position
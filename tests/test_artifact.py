@@ -0,0 +1,150 @@
+# tests/test_artifact.py
+"""Binary artifacts: round trips, and rejection of damaged or foreign data.
+
+Usage: python -m pytest tests
+"""
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifact
+from artifact import Artifact, ArtifactError
+from cache import CompileCache
+from ir import IntermediateCode, NONE
+from lowering import lower
+from session import CompilerSession
+
+SOURCE = """int count = 0;
+float total = 1.5;
+while (count < 3) {
+    int count2 = count * 2;
+    if (count2 > 2) {
+        total = total + count2 / 4;
+    } else {
+        float total = 0;
+        print(total);
+    }
+    count = count + 1;
+}
+print(total % 2);
+"""
+
+BROKEN = "int a;\nb = a + 1;\nint a;\nx @ 2;\n"
+
+
+def compile_source(source):
+    session = CompilerSession(quiet=True)
+    return session, session.compile(source)
+
+
+@pytest.mark.parametrize('source', [SOURCE, BROKEN])
+def test_round_trip_matches_parser(source):
+    session, result = compile_source(source)
+    parser = session.parser
+    with Artifact(artifact.dumps(result.cache_entry(), result.ast)) as loaded:
+        assert loaded.ir.to_dicts() == parser.intermediate_code
+        assert loaded.symbols == parser.symbol_table.get_all()
+        assert loaded.lex_errors == result.lex_errors
+        assert loaded.errors == parser.errors
+        assert loaded.warnings == result.warnings
+        assert loaded.assembly == result.assembly
+        ast = loaded.ast
+    assert repr(ast) == repr(parser.ast)
+    if source is SOURCE:
+        # The stored AST lowers to the same IR again
+        assert lower(ast).to_dicts() == parser.intermediate_code
+
+
+def test_round_trip_through_file(tmp_path):
+    _, result = compile_source(SOURCE)
+    path = tmp_path / ("program" + artifact.SUFFIX)
+    artifact.save(path, result.cache_entry())
+    with artifact.load(path) as loaded:
+        assert loaded.cache_entry()['ir'].to_dicts() == result.intermediate_code
+        assert loaded.ast is None
+
+
+def test_round_trip_of_constants():
+    ir = IntermediateCode()
+    values = [0, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 80, -2 ** 80, 0.1, -2.5, float('inf')]
+    for value in values:
+        ir.emit('=', ir.const(value), NONE, ir.var('x'))
+    entry = {'ir': ir, 'symbols': [], 'lex_errors': [], 'errors': [], 'warnings': [],
+             'assembly': []}
+    with Artifact(artifact.dumps(entry)) as loaded:
+        constants = loaded.ir.constants
+    assert constants == values
+    assert [type(value) for value in constants] == [type(value) for value in values]
+
+
+def test_truncated_data_is_rejected():
+    _, result = compile_source(SOURCE)
+    data = artifact.dumps(result.cache_entry(), result.ast)
+    entry = result.cache_entry()
+    for size in range(len(data)):
+        try:
+            with Artifact(data[:size]) as loaded:
+                # Only trailing alignment padding may be missing
+                assert loaded.ir.to_dicts() == entry['ir'].to_dicts()
+                assert repr(loaded.ast) == repr(result.ast)
+        except ArtifactError:
+            pass
+
+
+@pytest.mark.parametrize('offset, data, message', [
+    (0, b'XXXX', "Not a compiled program artifact"),
+    (4, struct.pack('<H', artifact.FORMAT_VERSION + 1), "Unsupported artifact format version"),
+    # The first section's offset, misaligned
+    (artifact._HEADER.size, struct.pack('<Q', 3), "out of bounds"),
+    # The first section's count, past the end of the data
+    (artifact._HEADER.size + 8, struct.pack('<Q', 1 << 40), "out of bounds"),
+])
+def test_corrupted_header_is_rejected(offset, data, message):
+    _, result = compile_source(SOURCE)
+    damaged = bytearray(artifact.dumps(result.cache_entry()))
+    damaged[offset:offset + len(data)] = data
+    with pytest.raises(ArtifactError, match=message):
+        Artifact(damaged)
+
+
+def test_foreign_and_empty_files_are_rejected(tmp_path):
+    path = tmp_path / "empty.mca"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        artifact.load(path)
+    path.write_bytes(b'{"ir": []}')
+    with pytest.raises(ArtifactError):
+        artifact.load(path)
+
+
+def section(data, name):
+    """(offset, count) of a section, from the directory"""
+    n = artifact.SECTIONS.index(name)
+    return struct.unpack_from('<QQ', data, artifact._HEADER.size + 16 * n)
+
+
+def test_corrupt_cache_entry_is_a_miss(tmp_path):
+    session = CompilerSession(quiet=True, cache=CompileCache(disk_dir=str(tmp_path)))
+    expected = session.compile(SOURCE)
+    (path,) = tmp_path.glob("*" + artifact.SUFFIX)
+    # Variable names pointing past the string table: the header is fine,
+    # but decoding the IR fails
+    data = bytearray(path.read_bytes())
+    offset, count = section(data, 'names')
+    data[offset:offset + 4 * count] = b'\xff' * (4 * count)
+    path.write_bytes(bytes(data))
+    with pytest.raises(IndexError):
+        with artifact.load(path) as loaded:
+            loaded.cache_entry()
+
+    cache = CompileCache(disk_dir=str(tmp_path))
+    result = CompilerSession(quiet=True, cache=cache).compile(SOURCE)
+    assert result.intermediate_code == expected.intermediate_code
+    assert cache.stats()['disk_hits'] == 0 and cache.stats()['misses'] == 1
+    # The corrupt entry was replaced by a good one
+    with artifact.load(path) as loaded:
+        assert loaded.ir.to_dicts() == expected.intermediate_code
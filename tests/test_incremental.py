@@ -0,0 +1,28 @@
+# tests/test_incremental.py
+"""Incremental recompilation against a full compile of the same source.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import CompilerSession
+from incremental import IncrementalCompiler
+
+
+@pytest.mark.parametrize('source', ["", "  \n\t\n", "// nothing here\n", "/* nor here */"])
+def test_source_without_statements_matches_full_compile(source):
+    result = IncrementalCompiler(CompilerSession(quiet=True)).compile(source)
+    full = CompilerSession(quiet=True).compile(source)
+    assert result.errors == full.errors == ["Syntax error at EOF"]
+
+
+def test_emptied_source_after_edit_matches_full_compile():
+    compiler = IncrementalCompiler(CompilerSession(quiet=True))
+    assert not compiler.compile("int x;\nx = 1;\n").all_errors
+    assert compiler.compile("").errors == ["Syntax error at EOF"]
+    assert not compiler.compile("int x;\nx = 2;\n").all_errors
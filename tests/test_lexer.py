@@ -0,0 +1,106 @@
+# tests/test_lexer.py
+"""The fast and streaming lexers against the PLY lexer.
+
+Usage: python -m pytest tests
+"""
+import io
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexer import Lexer, StreamingLexer, BACKENDS
+
+PIECES = ['x', 'abc1', '_t9', 'if', 'else', 'while', 'print', 'int', 'float', '0', '12', '3.25',
+          '1.', '.5', '/* c\n * d */', '/**/', '/* unterminated', '// line\n', '/', '*', '+',
+          '-', '%', '==', '=', '!=', '!', '<=', '<', '>=', '>', '(', ')', '{', '}', ';', ',',
+          ' ', '\t', '\n', '\n\n', '@', '$', '\r']
+
+
+def tokens(lexer, source):
+    """(type, value, line, position) of each token, and the errors"""
+    found, errors = lexer.tokenize(source)
+    return [(t['type'], t['value'], t['line'], t['position']) for t in found], errors
+
+
+@pytest.fixture(scope='module')
+def lexers():
+    built = {}
+    for backend in BACKENDS:
+        built[backend] = Lexer()
+        built[backend].build(backend)
+    return built
+
+
+def streamed(source, chunk_size):
+    lexer = StreamingLexer(chunk_size)
+    found = [(t.type, t.value, t.line, t.position) for t in lexer.tokens(io.StringIO(source))]
+    return found, lexer.errors
+
+
+CASES = {
+    'comments': ("a/b // c\n/* x\n y */ z", (
+        [('ID', 'a', 1, 0), ('DIVIDE', '/', 1, 1), ('ID', 'b', 1, 2), ('ID', 'z', 3, 20)], [])),
+    'bad characters': ("x @ $\r\ny", (
+        [('ID', 'x', 1, 0), ('ID', 'y', 2, 7)],
+        ["Illegal character '@' at line 1", "Illegal character '$' at line 1",
+         "Illegal character '\r' at line 1"])),
+    'line numbers': ("int a;\n\n\n  a = 1;\n", (
+        [('INT', 'int', 1, 0), ('ID', 'a', 1, 4), ('SEMICOLON', ';', 1, 5),
+         ('ID', 'a', 4, 11), ('ASSIGN', '=', 4, 13), ('NUMBER', 1, 4, 15),
+         ('SEMICOLON', ';', 4, 16)], [])),
+    'numbers': ("1. .5 3.25 12 007 1.5.2", (
+        [('NUMBER', 1, 1, 0), ('NUMBER', 5, 1, 4), ('FLOAT_NUM', 3.25, 1, 6),
+         ('NUMBER', 12, 1, 11), ('NUMBER', 7, 1, 14), ('FLOAT_NUM', 1.5, 1, 18),
+         ('NUMBER', 2, 1, 22)],
+        ["Illegal character '.' at line 1"] * 3)),
+    'operators': ("a<=b==c!=d>=e!f", (
+        [('ID', 'a', 1, 0), ('LE', '<=', 1, 1), ('ID', 'b', 1, 3), ('EQ', '==', 1, 4),
+         ('ID', 'c', 1, 6), ('NE', '!=', 1, 7), ('ID', 'd', 1, 9), ('GE', '>=', 1, 10),
+         ('ID', 'e', 1, 12), ('ID', 'f', 1, 14)],
+        ["Illegal character '!' at line 1"])),
+}
+
+
+@pytest.mark.parametrize('source, expected', CASES.values(), ids=CASES.keys())
+def test_ply_lexer(lexers, source, expected):
+    assert tokens(lexers['ply'], source) == expected
+
+
+@pytest.mark.parametrize('source, expected', CASES.values(), ids=CASES.keys())
+def test_fast_lexer_matches_ply(lexers, source, expected):
+    assert tokens(lexers['fast'], source) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, StreamingLexer.CHUNK_SIZE])
+@pytest.mark.parametrize('source, expected', CASES.values(), ids=CASES.keys())
+def test_streaming_lexer_matches_ply(source, expected, chunk_size):
+    assert streamed(source, chunk_size) == expected
+
+
+def test_unterminated_comment(lexers):
+    # Lexer scans '/' '*' and carries on; StreamingLexer reports it
+    assert tokens(lexers['ply'], "x /* open\ny") == ([('ID', 'x', 1, 0), ('DIVIDE', '/', 1, 2),
+                                                      ('TIMES', '*', 1, 3), ('ID', 'open', 1, 5),
+                                                      ('ID', 'y', 2, 10)], [])
+    assert streamed("x /* open\ny", 4) == ([('ID', 'x', 1, 0)],
+                                           ["Unterminated comment starting at line 1"])
+
+
+def test_random_sources(lexers):
+    rng = random.Random(0)
+    for case in range(2000):
+        source = ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 60)))
+        lineno = 1 + case % 3
+        results = []
+        for lexer in lexers.values():
+            found, errors = lexer.tokenize(source, lineno)
+            results.append(([dict(token) for token in found], list(errors)))
+        assert results[0] == results[1], source
+        # StreamingLexer counts lines from 1 and reports unterminated comments
+        if lineno == 1 and '/* unterminated' not in source:
+            expected = tokens(lexers['ply'], source)
+            assert streamed(source, rng.randint(1, 16)) == expected, source
@@ -0,0 +1,56 @@
+# tests/test_transpile.py
+"""The Python tier against the bytecode VM on deeply nested programs.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import CompilerSession
+from vm import VM, lower
+import transpile
+
+
+def nested_loops(depth):
+    lines = [f"int i{n};" for n in range(depth)] + ["int total;", "total = 0;"]
+    for n in range(depth):
+        lines += [f"i{n} = 0;", f"while (i{n} < 1) {{", f"i{n} = i{n} + 1;"]
+    lines.append("total = total + 1;")
+    lines += ["}"] * depth
+    lines.append("print(total);")
+    return "\n".join(lines) + "\n"
+
+
+def nested_ifs(depth):
+    lines = ["int x;", "x = 1;"]
+    lines += ["if (x > 0) {"] * depth
+    lines.append("print(x);")
+    lines += ["}"] * depth
+    return "\n".join(lines) + "\n"
+
+
+def run_both(source, max_steps=None):
+    result = CompilerSession(quiet=True).compile(source)
+    assert not result.all_errors
+    return VM(max_steps).run(lower(result.ir)), transpile.execute(result.ir, max_steps)
+
+
+@pytest.mark.parametrize('depth', [transpile.MAX_DEPTH, 21, 40])
+def test_deeply_nested_loops(depth):
+    vm_output, python_output = run_both(nested_loops(depth))
+    assert vm_output == python_output == ['1']
+
+
+def test_deeply_nested_loops_with_step_limit():
+    vm_output, python_output = run_both(nested_loops(30), max_steps=10 ** 6)
+    assert vm_output == python_output == ['1']
+
+
+@pytest.mark.parametrize('depth', [50, 150])
+def test_deeply_nested_ifs(depth):
+    vm_output, python_output = run_both(nested_ifs(depth))
+    assert vm_output == python_output == ['1']
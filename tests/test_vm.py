@@ -0,0 +1,89 @@
+# tests/test_vm.py
+"""Step limits of the bytecode VM and the Python tier at their boundary.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import CompilerSession
+from vm import VM, VMError, lower
+import transpile
+
+LOOP = """int counter;
+counter = 0;
+while (counter < 3) {
+    counter = counter + 1;
+}
+print(counter);
+"""
+
+
+@pytest.fixture(scope='module')
+def ir():
+    result = CompilerSession(quiet=True).compile(LOOP)
+    assert not result.all_errors
+    return result.ir
+
+
+@pytest.mark.parametrize('max_steps', [0, -1])
+def test_vm_rejects_step_limits_below_one(max_steps):
+    with pytest.raises(ValueError):
+        VM(max_steps)
+
+
+@pytest.mark.parametrize('max_steps', [0, -1])
+def test_python_tier_rejects_step_limits_below_one(ir, max_steps):
+    with pytest.raises(ValueError):
+        transpile.execute(ir, max_steps)
+
+
+def test_vm_stops_at_one_step(ir):
+    with pytest.raises(VMError):
+        VM(1).run(lower(ir))
+
+
+def test_vm_runs_within_step_limit(ir):
+    assert VM(100).run(lower(ir)) == ['3']
+    assert VM().run(lower(ir)) == ['3']
+
+
+SHADOWED = """int x = 1;
+{
+    int x = 5;
+    print(x);
+    {
+        int x = 7;
+        x = x + 1;
+        print(x);
+    }
+    print(x);
+}
+print(x);
+"""
+
+
+@pytest.mark.parametrize('parser_backend', ['ply', 'descent'])
+def test_shadowed_locals_are_distinct_variables(parser_backend):
+    result = CompilerSession(quiet=True, parser_backend=parser_backend).compile(SHADOWED)
+    assert not result.all_errors
+    expected = ['5', '8', '5', '1']
+    assert VM().run(lower(result.ir)) == expected
+    assert transpile.execute(result.ir) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ("float f = 3; f = f / 2; print(f);", ['1.5']),
+    ("int i = 7; float f; f = i; print(f / 2); print(i / 2);", ['3.5', '3']),
+    ("float f; print(f);", ['0.0']),
+])
+@pytest.mark.parametrize('opt_level', [0, 2])
+def test_ints_stored_in_floats_are_converted(source, expected, opt_level):
+    result = CompilerSession(quiet=True, opt_level=opt_level).compile(source)
+    assert not result.all_errors
+    assert VM().run(lower(result.ir)) == expected
+    assert transpile.execute(result.ir) == expected
@@ -0,0 +1,349 @@
+# transpile.py
+"""Second execution tier: the IR translated to Python and compiled.
+
+translate() turns an IntermediateCode into the source of one Python
+function, where each variable and temp is a local. Control flow comes
+out as structured code whenever the jumps nest the way the parser emits
+them:
+
+    L1: ...; if_false t goto L2; ...; goto L1; L2:   ->  while True: ... if not t: break
+    if_false t goto L1; ...; goto L2; L1: ...; L2:    ->  if t: ... else: ...
+
+Anything else (e.g. jumps rewired by the optimizer so they no longer
+nest, or nesting deeper than the Python compiler accepts) falls back to a loop that dispatches on the current basic block.
+The same fusions as vm.lower() apply, so a comparison that only feeds
+the next if_false becomes the if's condition. compile_ir() caches the
+compiled code per translated source, and a CompiledProgram runs it with
+the same output and errors as the bytecode VM.
+"""
+import math
+from functools import lru_cache
+
+from ir import (IntermediateCode, OPCODES, OP_ASSIGN, OP_LABEL, OP_GOTO, OP_IF_FALSE,
+                OP_PRINT, KIND_BITS, KIND_MASK, TEMP, VAR, CONST)
+from vm import VMError, divide
+
+ARITHMETIC = {OPCODES.index(op): op for op in ('+', '-', '*')}
+DIVISION = {OPCODES.index('/'): '_div', OPCODES.index('%'): '_mod'}
+COMPARISONS = {OPCODES.index(op): op for op in ('<', '<=', '>', '>=', '==', '!=')}
+
+CACHE_SIZE = 64
+INDENT = "    "
+# Deepest block structured code opens: CPython rejects more than 20
+# nested loops, and deeper ifs soon after
+MAX_DEPTH = 20
+# Locals initialized to 0 per line of the generated prologue
+NAMES_PER_LINE = 32
+
+
+def _div(a, b):
+    if b == 0:
+        raise VMError("Division by zero")
+    return divide(a, b, False)
+
+
+def _mod(a, b):
+    if b == 0:
+        raise VMError("Division by zero")
+    return divide(a, b, True)
+
+
+class _Unstructured(Exception):
+    """The jumps do not nest; use block dispatch instead"""
+
+
+# Items of the label-free instruction list built by _Translator
+STATEMENT = 'statement'
+GOTO = 'goto'
+BRANCH = 'branch'
+
+
+class _Translator:
+    def __init__(self, ir, step_limit):
+        self.ir = ir
+        self.step_limit = step_limit
+        self.lines = []
+        self.locals = {}
+        # (kind, text, target): a statement's text, or a jump to the item
+        # index target, taken for a BRANCH when the condition text is false
+        self.items = []
+        self._build_items()
+
+    def operand(self, operand):
+        kind = operand & KIND_MASK
+        if kind == CONST:
+            value = self.ir.constants[operand >> KIND_BITS]
+            if isinstance(value, float) and not math.isfinite(value):
+                return f"float('{value}')"
+            return f"({value!r})" if value < 0 else repr(value)
+        if kind == VAR:
+            # A shadowing x@2 becomes v2_x, which no v_<identifier> can be
+            name, _, depth = self.ir.names[operand >> KIND_BITS].partition('@')
+            name = f"v{depth}_{name}"
+        elif kind == TEMP:
+            name = f"t_{operand >> KIND_BITS}"
+        else:
+            raise ValueError(f"Not a value operand: {self.ir.value(operand)}")
+        self.locals[name] = None
+        return name
+
+    def expression(self, op, arg1, arg2):
+        """Python text of a binary operation; comparisons give a bool"""
+        a, b = self.operand(arg1), self.operand(arg2)
+        if op in DIVISION:
+            return f"{DIVISION[op]}({a}, {b})"
+        return f"{a} {ARITHMETIC.get(op) or COMPARISONS[op]} {b}"
+
+    def _build_items(self):
+        ir = self.ir
+        ops, arg1, arg2, result = ir.ops, ir.arg1, ir.arg2, ir.result
+        count = len(ops)
+
+        reads = {}
+        for column in (arg1, arg2):
+            for operand in column:
+                if operand & KIND_MASK == TEMP:
+                    reads[operand] = reads.get(operand, 0) + 1
+
+        def read_once_by_next(temp, i, next_op):
+            return (i + 1 < count and ops[i + 1] == next_op and arg1[i + 1] == temp
+                    and reads.get(temp) == 1)
+
+        items = self.items
+        offsets = {}
+        i = 0
+        while i < count:
+            op = ops[i]
+            if op == OP_LABEL:
+                offsets.setdefault(arg1[i], len(items))
+            elif op == OP_ASSIGN:
+                items.append((STATEMENT, f"{self.operand(result[i])} = {self.operand(arg1[i])}",
+                              None))
+            elif op == OP_GOTO:
+                items.append((GOTO, None, arg1[i]))
+            elif op == OP_IF_FALSE:
+                items.append((BRANCH, self.operand(arg1[i]), arg2[i]))
+            elif op == OP_PRINT:
+                items.append((STATEMENT, f"_write(str({self.operand(arg1[i])}))", None))
+            elif op in COMPARISONS and read_once_by_next(result[i], i, OP_IF_FALSE):
+                items.append((BRANCH, self.expression(op, arg1[i], arg2[i]), arg2[i + 1]))
+                i += 1
+            else:
+                text = self.expression(op, arg1[i], arg2[i])
+                if op in COMPARISONS:
+                    text = f"int({text})"
+                target = result[i]
+                if target & KIND_MASK == TEMP and read_once_by_next(target, i, OP_ASSIGN):
+                    i += 1
+                    target = result[i]
+                items.append((STATEMENT, f"{self.operand(target)} = {text}", None))
+            i += 1
+
+        # A jump to a label the program never defines ends it
+        end = len(items)
+        for n, (kind, text, label) in enumerate(items):
+            if kind != STATEMENT:
+                items[n] = (kind, text, offsets.get(label, end))
+
+        self.back_jumps = {}
+        for n, (kind, text, target) in enumerate(items):
+            if kind == GOTO and target <= n:
+                self.back_jumps.setdefault(target, []).append(n)
+
+    # Output
+
+    def emit(self, depth, text):
+        self.lines.append(INDENT * depth + text)
+
+    def emit_step(self, depth):
+        if self.step_limit:
+            self.emit(depth, "_steps -= 1")
+            self.emit(depth, "if not _steps:")
+            self.emit(depth + 1, "raise VMError(f'Step limit of {_max_steps} jumps exceeded')")
+
+    def translate(self):
+        try:
+            end = len(self.items)
+            self.structured(0, end, 1, None, {end})
+        except _Unstructured:
+            self.lines = []
+            self.dispatch()
+        body = self.lines
+
+        self.lines = ["def _program(_write, _max_steps):"]
+        if self.step_limit:
+            self.emit(1, "_steps = _max_steps")
+        names = list(self.locals)
+        for first in range(0, len(names), NAMES_PER_LINE):
+            self.emit(1, " = ".join(names[first:first + NAMES_PER_LINE]) + " = 0")
+        self.lines.extend(body)
+        self.emit(1, "return")
+        return "\n".join(self.lines) + "\n"
+
+    def structured(self, start, end, depth, loop, exits):
+        """Emit items [start, end) as nested while/if statements.
+
+        exits holds the item indices that falling off the end of the range
+        amounts to jumping to. loop is (head, breaks) of the innermost
+        enclosing loop: jumps to head continue it, jumps into breaks leave it.
+        """
+        if depth > MAX_DEPTH:
+            raise _Unstructured()
+        items = self.items
+        emitted = len(self.lines)
+        i = start
+        while i < end:
+            # A backward goto inside this range makes i a loop head
+            if loop is None or i != loop[0] or i != start:
+                back = [n for n in self.back_jumps.get(i, ()) if n < end]
+                if back:
+                    last = max(back)
+                    breaks = {last + 1} | (exits if last + 1 == end else set())
+                    self.emit(depth, "while True:")
+                    self.emit_step(depth + 1)
+                    self.structured(i, last, depth + 1, (i, breaks), {i})
+                    i = last + 1
+                    continue
+
+            kind, text, target = items[i]
+            if kind == STATEMENT:
+                self.emit(depth, text)
+                i += 1
+                continue
+
+            if loop is not None and (target == loop[0] or target in loop[1]):
+                jump = "continue" if target == loop[0] else "break"
+                if kind == GOTO:
+                    self.emit(depth, jump)
+                else:
+                    self.emit(depth, f"if not ({text}):")
+                    self.emit(depth + 1, jump)
+                i += 1
+            elif kind == GOTO:
+                # Only a jump to where the code goes next anyway
+                if not (target == i + 1 or (i == end - 1 and target in exits)):
+                    raise _Unstructured()
+                i += 1
+            elif i < target <= end:
+                # if_false t goto F; then...; [goto J; F: else...;] J:
+                join = self.join(i + 1, target)
+                self.emit(depth, f"if {text}:")
+                if join is not None and target < join <= end:
+                    after = {join} | (exits if join == end else set())
+                    # A final 'goto J' is implied by the else
+                    then_end = target - 1 if items[target - 1][2] == join else target
+                    self.structured(i + 1, then_end, depth + 1, loop, after)
+                    self.emit(depth, "else:")
+                    self.structured(target, join, depth + 1, loop, after)
+                    i = join
+                elif join is not None and join in exits:
+                    # The join is past this range: the else part runs to its end
+                    self.structured(i + 1, target, depth + 1, loop, exits)
+                    self.emit(depth, "else:")
+                    self.structured(target, end, depth + 1, loop, exits)
+                    i = end
+                else:
+                    after = {target} | (exits if target == end else set())
+                    self.structured(i + 1, target, depth + 1, loop, after)
+                    i = target
+            elif target in exits:
+                # Skips the rest of this range
+                self.emit(depth, f"if {text}:")
+                self.structured(i + 1, end, depth + 1, loop, exits)
+                i = end
+            else:
+                raise _Unstructured()
+        if len(self.lines) == emitted:
+            self.emit(depth, "pass")
+
+    def join(self, start, end):
+        """Where the then part [start, end) of an if continues when it
+        cannot fall through to the else part at end, or None"""
+        kind, _, target = self.items[end - 1]
+        if kind != GOTO or target == end:
+            return None
+        if target > end:
+            return target
+        # It ends by looping back: the join is wherever its loop exits to
+        beyond = {target for kind, _, target in self.items[start:end]
+                  if kind != STATEMENT and target > end}
+        return beyond.pop() if len(beyond) == 1 else None
+
+    def dispatch(self):
+        """Emit the items as basic blocks run by a dispatch loop"""
+        items = self.items
+        count = len(items)
+        leaders = {0}
+        for n, (kind, _, target) in enumerate(items):
+            if kind != STATEMENT:
+                leaders.add(target)
+                leaders.add(n + 1)
+        leaders = sorted(leader for leader in leaders if leader < count)
+
+        self.emit(1, f"_block = {leaders[0] if leaders else count}")
+        self.emit(1, "while True:")
+        self.emit_step(2)
+        for n, start in enumerate(leaders):
+            end = leaders[n + 1] if n + 1 < len(leaders) else count
+            self.emit(2, f"{'if' if n == 0 else 'elif'} _block == {start}:")
+            for kind, text, target in items[start:end]:
+                if kind == STATEMENT:
+                    self.emit(3, text)
+                elif kind == GOTO:
+                    self.emit(3, f"_block = {target}")
+                    break
+                else:
+                    self.emit(3, f"if not ({text}):")
+                    self.emit(4, f"_block = {target}")
+                    self.emit(4, "continue")
+            else:
+                self.emit(3, f"_block = {end}")
+        self.emit(2, f"{'elif' if leaders else 'if'} True:")
+        self.emit(3, "break")
+
+
+def translate(intermediate_code, step_limit=False):
+    """Python source of a _program(_write, _max_steps) function running the
+    program; with step_limit it counts loop iterations against _max_steps"""
+    if not isinstance(intermediate_code, IntermediateCode):
+        intermediate_code = IntermediateCode.from_dicts(intermediate_code)
+    return _Translator(intermediate_code, step_limit).translate()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile_source(source):
+    namespace = {'_div': _div, '_mod': _mod, 'VMError': VMError}
+    exec(compile(source, '<mini-program>', 'exec'), namespace)
+    return namespace['_program']
+
+
+class CompiledProgram:
+    """A program translated to Python and compiled to a code object"""
+
+    __slots__ = ('source', 'function', 'output')
+
+    def __init__(self, source, function):
+        self.source = source
+        self.function = function
+        self.output = []
+
+    def run(self, max_steps=None):
+        """Run the program; returns the list of printed values as text.
+        max_steps needs a program compiled with step_limit."""
+        if max_steps is not None and max_steps < 1:
+            raise ValueError(f"max_steps must be at least 1, got {max_steps}")
+        output = self.output = []
+        self.function(output.append, max_steps if max_steps is not None else -1)
+        return output
+
+
+def compile_ir(intermediate_code, step_limit=False):
+    """Translate and compile a program, reusing the code object of an
+    identical translation compiled before"""
+    source = translate(intermediate_code, step_limit)
+    return CompiledProgram(source, _compile_source(source))
+
+
+def execute(intermediate_code, max_steps=None):
+    """Translate, compile and run a program; returns what it printed"""
+    return compile_ir(intermediate_code, max_steps is not None).run(max_steps)
@@ -0,0 +1,257 @@
+# vm.py
+"""Bytecode virtual machine that executes compiled programs.
+
+lower() turns an IntermediateCode into Bytecode: a list of
+(opcode, a, b, c) tuples whose operands are indices into one flat slot
+array holding every variable, temp and constant, and whose jump targets
+are absolute instruction offsets. Labels take no instruction at all, and
+a HALT ends the code.
+While lowering, two common pairs are fused into one instruction:
+
+    t = a < b; if_false t goto L   ->  JUMP_UNLESS_LT a, b, L
+    t = a + b; x = t               ->  x = a + b
+
+both only when t is read nowhere else. VM.run() executes the bytecode in
+a single dispatch loop and collects what print writes in an output list.
+"""
+import math
+
+from ir import (IntermediateCode, OPCODES, OP_ASSIGN, OP_LABEL, OP_GOTO, OP_IF_FALSE,
+                OP_PRINT, KIND_MASK, TEMP, CONST)
+
+# Bytecode opcodes, roughly most frequent first since run() tests them in order
+(MOVE, ADD, SUB, MUL, JUMP, JUMP_UNLESS_LT, JUMP_UNLESS_LE, JUMP_UNLESS_GT,
+ JUMP_UNLESS_GE, JUMP_UNLESS_EQ, JUMP_UNLESS_NE, JUMP_IF_FALSE, PRINT, DIV, MOD,
+ LT, LE, GT, GE, EQ, NE, HALT) = range(22)
+
+BYTECODE_NAMES = ('MOVE', 'ADD', 'SUB', 'MUL', 'JUMP', 'JUMP_UNLESS_LT', 'JUMP_UNLESS_LE',
+                  'JUMP_UNLESS_GT', 'JUMP_UNLESS_GE', 'JUMP_UNLESS_EQ', 'JUMP_UNLESS_NE',
+                  'JUMP_IF_FALSE', 'PRINT', 'DIV', 'MOD', 'LT', 'LE', 'GT', 'GE', 'EQ', 'NE',
+                  'HALT')
+
+BINARY = {OPCODES.index(op): code for op, code in (
+    ('+', ADD), ('-', SUB), ('*', MUL), ('/', DIV), ('%', MOD),
+    ('<', LT), ('<=', LE), ('>', GT), ('>=', GE), ('==', EQ), ('!=', NE))}
+JUMP_UNLESS = {LT: JUMP_UNLESS_LT, LE: JUMP_UNLESS_LE, GT: JUMP_UNLESS_GT,
+               GE: JUMP_UNLESS_GE, EQ: JUMP_UNLESS_EQ, NE: JUMP_UNLESS_NE}
+
+
+class VMError(Exception):
+    """A run-time error in the executed program"""
+
+
+class Bytecode:
+    """Lowered program: instructions, the initial slot values (constants
+    filled in, everything else 0) and the operand text of each slot"""
+
+    __slots__ = ('code', 'slots', 'names')
+
+    def __init__(self, code, slots, names):
+        self.code = code
+        self.slots = slots
+        self.names = names
+
+    def __len__(self):
+        return len(self.code)
+
+    def disassemble(self):
+        """Text lines listing the instructions, for debugging"""
+        names = self.names
+        lines = []
+        for offset, (op, a, b, c) in enumerate(self.code):
+            if op == HALT:
+                args = ()
+            elif op == JUMP:
+                args = (str(a),)
+            elif op == PRINT:
+                args = (names[a],)
+            elif op == MOVE:
+                args = (names[c], names[a])
+            elif op == JUMP_IF_FALSE:
+                args = (names[a], str(c))
+            elif op in JUMP_UNLESS.values():
+                args = (names[a], names[b], str(c))
+            else:
+                args = (names[c], names[a], names[b])
+            lines.append(f"{offset:5} {BYTECODE_NAMES[op]:<15} {', '.join(args)}")
+        return lines
+
+
+def lower(intermediate_code):
+    """Lower an IntermediateCode (or the dict format) to Bytecode"""
+    if not isinstance(intermediate_code, IntermediateCode):
+        intermediate_code = IntermediateCode.from_dicts(intermediate_code)
+    ir = intermediate_code
+    ops, arg1, arg2, result = ir.ops, ir.arg1, ir.arg2, ir.result
+    count = len(ops)
+
+    slot_of = {}
+    slots = []
+    names = []
+
+    def slot(operand):
+        index = slot_of.get(operand)
+        if index is None:
+            index = slot_of[operand] = len(slots)
+            slots.append(ir.value(operand) if operand & KIND_MASK == CONST else 0)
+            names.append(str(ir.value(operand)))
+        return index
+
+    # How often each temp is read, to know when fusing may drop it
+    reads = {}
+    for column in (arg1, arg2):
+        for operand in column:
+            if operand & KIND_MASK == TEMP:
+                reads[operand] = reads.get(operand, 0) + 1
+
+    def read_once_by_next(temp, i, next_op):
+        return (i + 1 < count and ops[i + 1] == next_op and arg1[i + 1] == temp
+                and reads.get(temp) == 1)
+
+    code = []
+    # label operand -> offset; jumps hold label operands until resolved
+    offsets = {}
+    i = 0
+    while i < count:
+        op = ops[i]
+        if op == OP_LABEL:
+            offsets.setdefault(arg1[i], len(code))
+        elif op == OP_ASSIGN:
+            code.append((MOVE, slot(arg1[i]), 0, slot(result[i])))
+        elif op == OP_GOTO:
+            code.append((JUMP, arg1[i], 0, 0))
+        elif op == OP_IF_FALSE:
+            code.append((JUMP_IF_FALSE, slot(arg1[i]), 0, arg2[i]))
+        elif op == OP_PRINT:
+            code.append((PRINT, slot(arg1[i]), 0, 0))
+        elif op in BINARY:
+            binary = BINARY[op]
+            a, b, target = slot(arg1[i]), slot(arg2[i]), result[i]
+            if binary in JUMP_UNLESS and read_once_by_next(target, i, OP_IF_FALSE):
+                code.append((JUMP_UNLESS[binary], a, b, arg2[i + 1]))
+                i += 1
+            else:
+                if target & KIND_MASK == TEMP and read_once_by_next(target, i, OP_ASSIGN):
+                    i += 1
+                    target = result[i]
+                code.append((binary, a, b, slot(target)))
+        i += 1
+
+    # Resolve labels; a jump to a label the program never defines ends it
+    end = len(code)
+    code.append((HALT, 0, 0, 0))
+    for offset, (op, a, b, c) in enumerate(code):
+        if op == JUMP:
+            code[offset] = (op, offsets.get(a, end), b, c)
+        elif op >= JUMP_UNLESS_LT and op <= JUMP_IF_FALSE:
+            code[offset] = (op, a, b, offsets.get(c, end))
+    return Bytecode(code, slots, names)
+
+
+def divide(a, b, remainder):
+    """a / b, or a % b with remainder; integer division and remainder
+    truncate toward zero, as in C. b must not be zero."""
+    if isinstance(a, int) and isinstance(b, int):
+        quotient = abs(a) // abs(b)
+        if (a < 0) != (b < 0):
+            quotient = -quotient
+        return a - b * quotient if remainder else quotient
+    return math.fmod(a, b) if remainder else a / b
+
+
+class VM:
+    """Runs Bytecode. output holds the text of every value printed by the
+    last run(); max_steps, if set, bounds the number of jumps taken so a
+    program that never ends raises VMError instead of hanging."""
+
+    def __init__(self, max_steps=None):
+        if max_steps is not None and max_steps < 1:
+            raise ValueError(f"max_steps must be at least 1, got {max_steps}")
+        self.max_steps = max_steps
+        self.output = []
+        self.slots = []
+
+    def run(self, bytecode):
+        """Execute bytecode from the start; returns the output list"""
+        code = bytecode.code
+        slots = self.slots = list(bytecode.slots)
+        output = self.output = []
+        write = output.append
+        budget = self.max_steps if self.max_steps is not None else -1
+        pc = 0
+
+        # One flat loop over locals, dispatching on opcode ranges first so
+        # any instruction is found in a handful of comparisons
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+            if op <= MUL:
+                if op == ADD:
+                    slots[c] = slots[a] + slots[b]
+                elif op == MOVE:
+                    slots[c] = slots[a]
+                elif op == MUL:
+                    slots[c] = slots[a] * slots[b]
+                else:
+                    slots[c] = slots[a] - slots[b]
+                continue
+            if op <= JUMP_IF_FALSE:
+                if op == JUMP:
+                    pc = a
+                elif op == JUMP_UNLESS_LT:
+                    if slots[a] < slots[b]:
+                        continue
+                    pc = c
+                elif op == JUMP_UNLESS_LE:
+                    if slots[a] <= slots[b]:
+                        continue
+                    pc = c
+                elif op == JUMP_UNLESS_GT:
+                    if slots[a] > slots[b]:
+                        continue
+                    pc = c
+                elif op == JUMP_UNLESS_GE:
+                    if slots[a] >= slots[b]:
+                        continue
+                    pc = c
+                elif op == JUMP_UNLESS_EQ:
+                    if slots[a] == slots[b]:
+                        continue
+                    pc = c
+                elif op == JUMP_UNLESS_NE:
+                    if slots[a] != slots[b]:
+                        continue
+                    pc = c
+                else:
+                    if slots[a]:
+                        continue
+                    pc = c
+                # Only taken jumps get here
+                budget -= 1
+                if not budget:
+                    raise VMError(f"Step limit of {self.max_steps} jumps exceeded")
+            elif op == PRINT:
+                write(str(slots[a]))
+            elif op <= MOD:
+                if slots[b] == 0:
+                    raise VMError(f"Division by zero at instruction {pc - 1}")
+                slots[c] = divide(slots[a], slots[b], op == MOD)
+            elif op == LT:
+                slots[c] = int(slots[a] < slots[b])
+            elif op == LE:
+                slots[c] = int(slots[a] <= slots[b])
+            elif op == GT:
+                slots[c] = int(slots[a] > slots[b])
+            elif op == GE:
+                slots[c] = int(slots[a] >= slots[b])
+            elif op == EQ:
+                slots[c] = int(slots[a] == slots[b])
+            elif op == NE:
+                slots[c] = int(slots[a] != slots[b])
+            else:
+                return output
+
+
+def execute(intermediate_code, max_steps=None):
+    """Lower and run a program; returns what it printed"""
+    return VM(max_steps).run(lower(intermediate_code))
@@ -0,0 +1,196 @@
+# worker.py
+"""Background compilation for the GUI.
+
+Compiles run on a single worker thread so the Tk event loop never blocks.
+The outputs of every tab are also prepared on the worker, and results are
+handed back through a queue that the GUI polls with root.after. Submitting
+a new compile, or calling cancel(), abandons the one in flight.
+"""
+import queue
+import threading
+
+from lexer import CompileCancelled
+from parser import format_instruction
+from optimizer import format_report
+from codegen import format_allocation
+from profiling import format_profile
+
+NO_ERRORS = ("✓ No errors found.\n✓ Comments handled correctly.\n"
+             "✓ Scopes managed properly.\n✓ Control flow is correct.")
+
+
+class Rows:
+    """The lines of an output tab, formatted only when asked for.
+
+    Row i of the count rows is format_row(i); header and footer lines are
+    given ready-made. Supports len() and indexing by int, which is all a
+    listview.VirtualListView needs to show the visible window of rows.
+    """
+
+    def __init__(self, count, format_row, header=(), footer=()):
+        self.count = count
+        self.format_row = format_row
+        self.header = list(header)
+        self.footer = list(footer)
+
+    def __len__(self):
+        return len(self.header) + self.count + len(self.footer)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0:
+            raise IndexError("row index out of range")
+        header = len(self.header)
+        if i < header:
+            return self.header[i]
+        i -= header
+        if i < self.count:
+            return self.format_row(i)
+        return self.footer[i - self.count]
+
+    def find(self, text, start=0, stop=None):
+        """Index of the first row in range(start, stop) containing text, or
+        None. Only those rows are formatted; they are joined so that the
+        search itself is a single str.find."""
+        if not text or '\n' in text:
+            return None
+        stop = len(self) if stop is None else min(stop, len(self))
+        joined = "\n".join([self[i] for i in range(start, stop)])
+        position = joined.find(text)
+        if position < 0:
+            return None
+        return start + joined.count("\n", 0, position)
+
+
+def render_outputs(result):
+    """Prepare the contents of each output tab for a CompileResult.
+
+    Tokens, symbols, IR and assembly become Rows (or a list of lines) over
+    the result's own arrays, so nothing is formatted until a view shows it;
+    the errors and stats tabs are short and are built as text.
+    """
+    tokens = result.tokens
+    token_rows = Rows(len(tokens),
+                      lambda i: "{type:<16} {value!s:<15} {line}".format_map(tokens[i]),
+                      header=["Token Type       Value           Line", "-" * 45])
+
+    # Symbol Table with scope information
+    symbols = sorted(result.symbols,
+                     key=lambda x: (0 if x['scope'] == 'global' else 1, x['name']))
+    symbol_rows = Rows(len(symbols),
+                       lambda i: "{name:<16} {type:<10} {scope}".format_map(symbols[i]),
+                       header=["Name             Type       Scope", "-" * 45])
+
+    ir = result.ir
+    ic_footer = []
+    if result.optimization:
+        ic_footer.append("")
+        ic_footer.extend("; " + line for line in format_report(result.optimization))
+    ic_rows = Rows(len(ir), lambda i: f"{i + 1}. {format_instruction(ir.instruction(i))}",
+                   footer=ic_footer)
+
+    assembly_lines = list(result.assembly)
+    if result.allocation:
+        assembly_lines.append("")
+        assembly_lines.extend("; " + line for line in format_allocation(result.allocation))
+
+    all_errors = result.all_errors
+    if all_errors:
+        errors_output = "".join(f"{i}. {error}\n" for i, error in enumerate(all_errors, 1))
+    else:
+        errors_output = NO_ERRORS
+    if result.warnings:
+        errors_output += "\nWarnings:\n" + "".join(f"- {warning}\n" for warning in result.warnings)
+
+    if result.profile is not None:
+        stats_output = "".join(line + "\n" for line in format_profile(result.profile.to_dict()))
+    else:
+        stats_output = "Not profiled.\n"
+
+    return {
+        'tokens_view': token_rows,
+        'symbol_view': symbol_rows,
+        'intermediate_view': ic_rows,
+        'assembly_view': assembly_lines,
+        'errors_text': errors_output,
+        'stats_text': stats_output,
+    }
+
+
+class CompileWorker:
+    """Runs compile_func(source_code, cancel, *args) on a background thread.
+
+    Only one compile runs at a time. Each submit gets its own cancel event,
+    which the lexer checks on every token, so a superseded compile stops
+    within a few tokens instead of running to completion. An optional
+    warm_up() runs first on the same thread, e.g. to build the compiler's
+    tables while the window comes up.
+    """
+
+    def __init__(self, compile_func, warm_up=None):
+        self.compile_func = compile_func
+        self.warm_up = warm_up
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        # Cancel event of the most recently submitted compile
+        self.current = None
+        self.thread = threading.Thread(target=self._run, name='compile-worker', daemon=True)
+        self.thread.start()
+
+    def submit(self, source_code, *args):
+        """Start compiling source_code, cancelling any earlier compile. args
+        are passed on to compile_func, so that options are read when the
+        compile is submitted rather than shared with the worker thread."""
+        self.cancel()
+        cancel = threading.Event()
+        self.current = cancel
+        self.requests.put((source_code, cancel, args))
+
+    def cancel(self):
+        if self.current is not None:
+            self.current.set()
+            self.current = None
+
+    def poll(self):
+        """Return (outputs, result) for the latest finished compile, or None.
+
+        Results of cancelled compiles are dropped. Errors raised by the
+        compiler are re-raised here, on the calling (Tk) thread.
+        """
+        latest = None
+        while True:
+            try:
+                cancel, outputs, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if cancel is not self.current:
+                continue
+            self.current = None
+            if error is not None:
+                raise error
+            latest = (outputs, result)
+        return latest
+
+    def stop(self):
+        self.cancel()
+        self.requests.put((None, None, ()))
+
+    def _run(self):
+        if self.warm_up is not None:
+            self.warm_up()
+        while True:
+            source_code, cancel, args = self.requests.get()
+            if source_code is None:
+                return
+            if cancel.is_set():
+                continue
+            outputs = result = error = None
+            try:
+                result = self.compile_func(source_code, cancel, *args)
+                outputs = render_outputs(result)
+            except CompileCancelled:
+                continue
+            except Exception as e:
+                error = e
+            self.results.put((cancel, outputs, result, error))